@@ -0,0 +1,180 @@
+import os
+import pathlib
+from dotenv import load_dotenv
+
+# Settings are read from the environment once, when the app is imported.
+APP_DIR = pathlib.Path(__file__).parent
+BACKEND_DIR = APP_DIR.parent
+
+def load_env():
+    """Load the first .env found: backend/app/.env, then backend/.env, then the cwd."""
+    for env_path in (APP_DIR / ".env", BACKEND_DIR / ".env"):
+        if env_path.exists():
+            load_dotenv(env_path)
+            return
+    load_dotenv()
+
+load_env()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Model per task: breakdown, question extraction and response drafting (each
+# defaults to GEMINI_MODEL), and per-attempt deadlines after which a call is
+# abandoned and retried (0 waits for the client timeout)
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+BREAKDOWN_MODEL = os.getenv("BREAKDOWN_MODEL", GEMINI_MODEL)
+EXTRACTION_MODEL = os.getenv("EXTRACTION_MODEL", GEMINI_MODEL)
+RESPONSE_MODEL = os.getenv("RESPONSE_MODEL", GEMINI_MODEL)
+BREAKDOWN_DEADLINE_SECONDS = float(os.getenv("BREAKDOWN_DEADLINE_SECONDS", "30"))
+EXTRACTION_DEADLINE_SECONDS = float(os.getenv("EXTRACTION_DEADLINE_SECONDS", "300"))
+RESPONSE_DEADLINE_SECONDS = float(os.getenv("RESPONSE_DEADLINE_SECONDS", "120"))
+
+# Shared Gemini client: request timeout and HTTP connection pool limits
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "120"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GEMINI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+GEMINI_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+# Maximum number of break_down_question calls in flight during grant ingestion
+BREAKDOWN_CONCURRENCY = int(os.getenv("BREAKDOWN_CONCURRENCY", "5"))
+
+# LLM result cache: in-memory LRU size, entry lifetime, and optional on-disk
+# directory (unset keeps the cache in memory only)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR") or None
+
+# Upload context documents once through the Files API instead of inlining
+# their bytes on every draft; handles are refreshed this long before expiry
+CONTEXT_FILES_API = os.getenv("CONTEXT_FILES_API", "1") != "0"
+CONTEXT_FILE_EXPIRY_MARGIN_SECONDS = float(os.getenv("CONTEXT_FILE_EXPIRY_MARGIN_SECONDS", "3600"))
+
+# Grant-scoped retrieval: draft from the top-k chunks of the grant's documents
+# instead of attaching every uploaded file. The index is held by each worker
+# process and catches up with other workers' uploads before a search
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "1") != "0"
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "220"))
+RETRIEVAL_CHUNK_OVERLAP_WORDS = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP_WORDS", "40"))
+
+# Maximum number of drafts in flight for /grants/{grant_id}/draft_all
+DRAFT_ALL_CONCURRENCY = int(os.getenv("DRAFT_ALL_CONCURRENCY", "4"))
+
+# SQLite database holding grants and file metadata (WAL mode, shared by workers)
+DATABASE_PATH = pathlib.Path(os.getenv("DATABASE_PATH", str(BACKEND_DIR / "data" / "grants.db")))
+
+# Background grant ingestion: worker count, attempts per stage, and the base
+# delay of the exponential backoff between attempts
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_MAX_ATTEMPTS = int(os.getenv("INGESTION_MAX_ATTEMPTS", "3"))
+INGESTION_RETRY_BACKOFF_SECONDS = float(os.getenv("INGESTION_RETRY_BACKOFF_SECONDS", "2"))
+# A running job refreshes its lease while it works; one whose lease has run
+# out (its process died) is re-queued, or failed after INGESTION_MAX_ATTEMPTS
+# such recoveries
+INGESTION_JOB_LEASE_SECONDS = float(os.getenv("INGESTION_JOB_LEASE_SECONDS", "60"))
+
+# Uploads are streamed to disk in chunks of this size and rejected once they
+# pass MAX_UPLOAD_BYTES (0 disables the limit)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+# Questions per batched break_down_questions_async call (1 keeps one call per question)
+BREAKDOWN_BATCH_SIZE = int(os.getenv("BREAKDOWN_BATCH_SIZE", "8"))
+# Extract questions and sub-questions in one call during ingestion, falling
+# back to separate extraction and breakdown when the output fails validation
+COMBINED_INGESTION = os.getenv("COMBINED_INGESTION", "1") != "0"
+
+# Sharded question extraction for long PDFs: pages per window, pages shared
+# by neighbouring windows, windows in flight, and per-window retries
+EXTRACTION_SHARD_PAGES = int(os.getenv("EXTRACTION_SHARD_PAGES", "25"))
+EXTRACTION_SHARD_OVERLAP_PAGES = int(os.getenv("EXTRACTION_SHARD_OVERLAP_PAGES", "2"))
+EXTRACTION_SHARD_CONCURRENCY = int(os.getenv("EXTRACTION_SHARD_CONCURRENCY", "4"))
+EXTRACTION_SHARD_ATTEMPTS = int(os.getenv("EXTRACTION_SHARD_ATTEMPTS", "3"))
+EXTRACTION_SHARD_RETRY_BACKOFF_SECONDS = float(os.getenv("EXTRACTION_SHARD_RETRY_BACKOFF_SECONDS", "1"))
+
+# Send uploaded PDFs to the model as their extracted page text, stored in
+# DOCUMENT_TEXT_DIR by content hash. PDFs where most pages have fewer than
+# PDF_TEXT_MIN_CHARS_PER_PAGE characters are treated as scanned and sent as PDFs
+PDF_TEXT_ENABLED = os.getenv("PDF_TEXT_ENABLED", "1") != "0"
+DOCUMENT_TEXT_DIR = pathlib.Path(os.getenv("DOCUMENT_TEXT_DIR", str(BACKEND_DIR / "data" / "text")))
+PDF_TEXT_MIN_CHARS_PER_PAGE = int(os.getenv("PDF_TEXT_MIN_CHARS_PER_PAGE", "50"))
+
+# Context packing for drafts: token budget for context parts, the least budget
+# worth filling with an excerpt of an oversized document, and whether to count
+# tokens with the model's count_tokens endpoint instead of a local estimate
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "32000"))
+CONTEXT_MIN_EXCERPT_TOKENS = int(os.getenv("CONTEXT_MIN_EXCERPT_TOKENS", "200"))
+CONTEXT_COUNT_TOKENS_API = os.getenv("CONTEXT_COUNT_TOKENS_API", "0") != "0"
+
+# Opt-in request profiling: requests sending PROFILE_TOKEN in an X-Profile
+# header or ?profile= run under cProfile, with stats saved to PROFILE_DIR
+# (unset token disables it). SERVER_TIMING adds the Server-Timing header to
+# every response, not just profiled ones
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or None
+PROFILE_DIR = pathlib.Path(os.getenv("PROFILE_DIR", str(BACKEND_DIR / "data" / "profiles")))
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") != "0"
+
+# Model backend: "gemini" calls the API; "fake" answers every call locally with
+# deterministic, schema-valid output after FAKE_MODEL_LATENCY_SECONDS (plus or
+# minus up to FAKE_MODEL_JITTER_SECONDS), failing at FAKE_MODEL_ERROR_RATE.
+# Used for offline development and benchmark.py
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini")
+FAKE_MODEL_LATENCY_SECONDS = float(os.getenv("FAKE_MODEL_LATENCY_SECONDS", "0.05"))
+FAKE_MODEL_JITTER_SECONDS = float(os.getenv("FAKE_MODEL_JITTER_SECONDS", "0"))
+FAKE_MODEL_ERROR_RATE = float(os.getenv("FAKE_MODEL_ERROR_RATE", "0"))
+FAKE_MODEL_SEED = int(os.getenv("FAKE_MODEL_SEED", "0"))
+
+# Directory holding uploaded files, stored under their content hash
+UPLOADS_DIR = pathlib.Path(os.getenv("UPLOADS_DIR", str(APP_DIR / "uploads")))
+
+# Model call gateway: token-bucket rate limit sized to the API quota (0
+# disables it; the rate halves on each 429 and recovers on success), retries
+# of 429 and 5xx responses with jittered exponential backoff, a circuit
+# breaker that fails calls fast after consecutive server errors, and merging
+# of identical requests already in flight
+MODEL_RATE_LIMIT_PER_MINUTE = float(os.getenv("MODEL_RATE_LIMIT_PER_MINUTE", "1000"))
+MODEL_RATE_LIMIT_BURST = int(os.getenv("MODEL_RATE_LIMIT_BURST", "20"))
+MODEL_RETRY_ATTEMPTS = int(os.getenv("MODEL_RETRY_ATTEMPTS", "4"))
+MODEL_RETRY_BACKOFF_SECONDS = float(os.getenv("MODEL_RETRY_BACKOFF_SECONDS", "0.5"))
+MODEL_RETRY_MAX_BACKOFF_SECONDS = float(os.getenv("MODEL_RETRY_MAX_BACKOFF_SECONDS", "20"))
+MODEL_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("MODEL_CIRCUIT_FAILURE_THRESHOLD", "5"))
+MODEL_CIRCUIT_RESET_SECONDS = float(os.getenv("MODEL_CIRCUIT_RESET_SECONDS", "30"))
+MODEL_COALESCE_REQUESTS = os.getenv("MODEL_COALESCE_REQUESTS", "1") != "0"
+
+# Hedged requests for the tasks in HEDGE_TASKS: a call still unanswered at the
+# HEDGE_PERCENTILE of recent latencies for its model and operation is sent
+# again and the first schema-valid answer wins. Hedging starts once
+# HEDGE_MIN_SAMPLES calls have been timed, never sooner than
+# HEDGE_MIN_DELAY_SECONDS, and only while the rate limiter has spare tokens
+HEDGE_TASKS = {task.strip() for task in os.getenv("HEDGE_TASKS", "breakdown,extraction,response").split(",") if task.strip()}
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+
+# Change feed (/api/events): events kept for clients resuming with
+# Last-Event-ID, and seconds between keep-alive comments on idle streams
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "1000"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+# How long browsers may cache /api/files/{id}/content for content-addressed
+# uploads, which never change under their id
+FILE_CACHE_MAX_AGE_SECONDS = int(os.getenv("FILE_CACHE_MAX_AGE_SECONDS", str(365 * 24 * 3600)))
+
+# Cross-grant question index: every stored question as a hashed word n-gram
+# vector. A question at least QUESTION_REUSE_THRESHOLD similar (cosine) to one
+# already broken down reuses its sub-questions instead of calling the model,
+# and drafts get the stored answer to a question at least
+# QUESTION_SEED_THRESHOLD similar from another grant as context. A threshold
+# above 1 turns that use off. Like the retrieval index, it is held by each
+# worker process and catches up with other workers' grants before a search
+QUESTION_REUSE_THRESHOLD = float(os.getenv("QUESTION_REUSE_THRESHOLD", "0.7"))
+QUESTION_SEED_THRESHOLD = float(os.getenv("QUESTION_SEED_THRESHOLD", "0.5"))
+
+# Listing endpoints (/all_grants, /grants/{id}, /all_files): the largest page
+# a client may ask for, how many encoded response bodies are cached until
+# their table next changes, and the body size from which responses are
+# compressed (brotli when the package is installed and accepted, else gzip)
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "500"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
@@ -1,7 +1,14 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from contextlib import contextmanager
+import json
+import sqlite3
+import threading
 import time
+from app import config, events
 
-files_database = [
+# Records inserted on first start so a fresh database has a sample grant
+
+SEED_FILES = [
     {
         "id": "default-grant-doc",
         "original_name": "sample_grant.pdf",
@@ -22,7 +29,7 @@ files_database = [
     }
 ]
 
-grants_database = [
+SEED_GRANTS = [
     {
         "id": "1",
         "name": "Sample Grant",
@@ -35,16 +42,489 @@ grants_database = [
 
 ]
 
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grants (
+    id TEXT PRIMARY KEY,
+    status TEXT,
+    data TEXT NOT NULL,
+    summary TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    grant_id TEXT,
+    doc_role TEXT,
+    stored_name TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_grant_id_doc_role ON files (grant_id, doc_role);
+CREATE INDEX IF NOT EXISTS files_doc_role ON files (doc_role);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE INDEX IF NOT EXISTS grants_status ON grants (status);
+CREATE INDEX IF NOT EXISTS grants_department ON grants (json_extract(data, '$.department'));
+CREATE INDEX IF NOT EXISTS grants_county ON grants (json_extract(data, '$.county'));
+CREATE TABLE IF NOT EXISTS revisions (
+    name TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS drafts (
+    id TEXT PRIMARY KEY,
+    grant_id TEXT,
+    question_key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    stale INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS drafts_question_version ON drafts (grant_id, question_key, version);
+CREATE INDEX IF NOT EXISTS drafts_fingerprint ON drafts (fingerprint);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Per-thread connection to the SQLite database.
+
+    WAL mode lets readers in every uvicorn worker proceed while one writer
+    commits; busy_timeout makes concurrent writers wait instead of failing.
+    """
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        config.DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(config.DATABASE_PATH, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+        _local.connection = connection
+        _local.depth = 0
+    return connection
+
+
+@contextmanager
+def transaction():
+    """
+    Run the enclosed writes in one transaction. Nested calls join the
+    outermost transaction, so several add_* calls can be batched together.
+    """
+    init_database()
+    connection = _connect()
+    if _local.depth == 0:
+        connection.execute("BEGIN IMMEDIATE")
+        _local.events = []
+    _local.depth += 1
+    try:
+        yield connection
+    except BaseException:
+        _local.depth -= 1
+        if _local.depth == 0:
+            connection.execute("ROLLBACK")
+            _local.events = []
+        raise
+    _local.depth -= 1
+    if _local.depth == 0:
+        connection.execute("COMMIT")
+        pending, _local.events = _local.events, []
+        for event_type, data in pending:
+            events.bus.publish(event_type, data)
+
+
+def _bump_revision(connection: sqlite3.Connection, name: str) -> None:
+    """Record that a table changed, in the writing transaction; see revision()."""
+    connection.execute(
+        "INSERT INTO revisions (name, revision) VALUES (?, 1) "
+        "ON CONFLICT (name) DO UPDATE SET revision = revision + 1",
+        (name,),
+    )
+
+
+def revision(name: str) -> int:
+    """
+    A number that changes whenever the named table ("grants" or "files") is
+    written, by any process, so caches of its contents know when to rebuild.
+    """
+    init_database()
+    row = _connect().execute("SELECT revision FROM revisions WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def _publish(event_type: str, data: Dict[str, Any]) -> None:
+    """Queue a change event, published once the enclosing transaction commits."""
+    _local.events.append((event_type, data))
+
+
+def _job_summary(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: job.get(key) for key in ("id", "grant_id", "state", "stage", "error")}
+
+
+def _grant_summary(grant_entry: Dict[str, Any]) -> Dict[str, Any]:
+    """A grant for change events: its fields, with the questions reduced to a count."""
+    summary = {key: value for key, value in grant_entry.items() if key != "questions"}
+    summary["question_count"] = len(grant_entry.get("questions") or [])
+    return summary
+
+
+def _draft_summary(draft: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: draft.get(key) for key in ("id", "grant_id", "question_key", "version", "stale")}
+
+
+def _file_summary(file_metadata: Dict[str, Any]) -> Dict[str, Any]:
+    keys = ("id", "grant_id", "doc_role", "original_name", "content_type", "size_bytes", "upload_timestamp")
+    return {key: file_metadata.get(key) for key in keys}
+
+
+def init_database() -> None:
+    """Create the schema and insert the seed records, once per process."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        connection = _connect()
+        # Databases created before grants had a summary column get one here
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(grants)")}
+        if columns and "summary" not in columns:
+            connection.execute("ALTER TABLE grants ADD COLUMN summary TEXT")
+        connection.executescript(SCHEMA)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT OR IGNORE INTO grants (id, status, data, summary) VALUES (?, ?, ?, ?)",
+                [_grant_row(grant) for grant in SEED_GRANTS],
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO files (id, grant_id, doc_role, stored_name, data) VALUES (?, ?, ?, ?, ?)",
+                [_file_row(file) for file in SEED_FILES],
+            )
+            connection.executemany(
+                "UPDATE grants SET summary = ? WHERE id = ?",
+                [
+                    (json.dumps(_grant_summary(json.loads(data))), grant_id)
+                    for grant_id, data in connection.execute("SELECT id, data FROM grants WHERE summary IS NULL").fetchall()
+                ],
+            )
+            _bump_revision(connection, "grants")
+            _bump_revision(connection, "files")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        _initialized = True
+
+
+def _grant_row(grant_entry: Dict[str, Any]) -> tuple:
+    return (grant_entry["id"], grant_entry.get("status"), json.dumps(grant_entry), json.dumps(_grant_summary(grant_entry)))
+
+
+def _file_row(file_metadata: Dict[str, Any]) -> tuple:
+    return (
+        file_metadata["id"],
+        file_metadata.get("grant_id"),
+        file_metadata.get("doc_role"),
+        file_metadata.get("stored_name"),
+        json.dumps(file_metadata),
+    )
+
+
+def _query(sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+    init_database()
+    return [json.loads(row[0]) for row in _connect().execute(sql, params)]
+
+
 def add_to_grants_database(grant_entry: Dict[str, Any]) -> None:
-    """Add grant entry to the in-memory database."""
-    grants_database.append(grant_entry)
-    return grants_database
+    """Add grant entry to the database."""
+    with transaction() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO grants (id, status, data, summary) VALUES (?, ?, ?, ?)",
+            _grant_row(grant_entry),
+        )
+        _bump_revision(connection, "grants")
+        _publish("grant.created", _grant_summary(grant_entry))
+
+
+def load_grants() -> List[Dict[str, Any]]:
+    """Load all grants from the database, oldest first."""
+    return _query("SELECT data FROM grants ORDER BY rowid")
+
+
+def _page(sql: str, clauses: List[str], params: list, after: Optional[int], limit: Optional[int]) -> Tuple[List[str], Optional[int]]:
+    """Run a rowid-ordered page query; returns the rows' first column and the cursor of the next page, if any."""
+    if after is not None:
+        clauses.append("rowid > ?")
+        params.append(after)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"{sql}{where} ORDER BY rowid"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    init_database()
+    rows = _connect().execute(sql, tuple(params)).fetchall()
+    if limit is not None and len(rows) > limit:
+        return [row[0] for row in rows[:limit]], rows[limit - 1][1]
+    return [row[0] for row in rows], None
+
+
+def grant_page(
+    summary: bool = False,
+    status: Optional[str] = None,
+    department: Optional[str] = None,
+    county: Optional[str] = None,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[str], Optional[int]]:
+    """
+    Grants as stored JSON text, oldest first, without decoding them: the full
+    records, or with `summary` their summaries (no questions, plus a
+    question_count). Returns at most `limit` grants after cursor `after` and
+    the cursor of the next page, or None on the last page.
+    """
+    clauses, params = [], []
+    for clause, value in (
+        ("status = ?", status),
+        ("json_extract(data, '$.department') = ?", department),
+        ("json_extract(data, '$.county') = ?", county),
+    ):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    column = "summary" if summary else "data"
+    return _page(f"SELECT {column}, rowid FROM grants", clauses, params, after, limit)
+
+
+def load_grant_json(grant_id: str, summary: bool = False) -> Optional[str]:
+    """A single grant (or its summary) as stored JSON text, or None."""
+    init_database()
+    column = "summary" if summary else "data"
+    row = _connect().execute(f"SELECT {column} FROM grants WHERE id = ?", (grant_id,)).fetchone()
+    return row[0] if row else None
+
+
+def file_page(
+    grant_id: Optional[str] = None,
+    doc_role: Optional[str] = None,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Tuple[List[str], Optional[int]]:
+    """File metadata as stored JSON text, paged and filtered like grant_page."""
+    clauses, params = [], []
+    if grant_id is not None:
+        clauses.append("grant_id = ?")
+        params.append(grant_id)
+    if doc_role is not None:
+        clauses.append("doc_role = ?")
+        params.append(doc_role)
+    return _page("SELECT data, rowid FROM files", clauses, params, after, limit)
+
+
+def load_grant(grant_id: str) -> Optional[Dict[str, Any]]:
+    """Look up a single grant by id, or None."""
+    rows = _query("SELECT data FROM grants WHERE id = ?", (grant_id,))
+    return rows[0] if rows else None
+
 
 def add_file_metadata(file_metadata: Dict[str, Any]) -> None:
-    """Add file metadata to the in-memory database."""
-    files_database.append(file_metadata)
-    return files_database
+    """Add file metadata to the database."""
+    add_files_metadata([file_metadata])
+
+
+def add_files_metadata(files_metadata: List[Dict[str, Any]]) -> None:
+    """Add several files' metadata in a single transaction."""
+    with transaction() as connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO files (id, grant_id, doc_role, stored_name, data) VALUES (?, ?, ?, ?, ?)",
+            [_file_row(file_metadata) for file_metadata in files_metadata],
+        )
+        _bump_revision(connection, "files")
+        for file_metadata in files_metadata:
+            _publish("file.created", _file_summary(file_metadata))
+
 
 def load_file_metadata() -> List[Dict[str, Any]]:
-    """Load all file metadata from the in-memory database."""
-    return files_database
+    """Load all file metadata from the database, oldest first."""
+    return _query("SELECT data FROM files ORDER BY rowid")
+
+
+def load_file(file_id: str) -> Optional[Dict[str, Any]]:
+    """Look up a single file's metadata by id, or None."""
+    rows = _query("SELECT data FROM files WHERE id = ?", (file_id,))
+    return rows[0] if rows else None
+
+
+def find_files(grant_id: Optional[str] = None, doc_role: Optional[str] = None) -> List[Dict[str, Any]]:
+    """File metadata filtered by grant and/or document role, using the indexes."""
+    clauses, params = [], []
+    if grant_id is not None:
+        clauses.append("grant_id = ?")
+        params.append(grant_id)
+    if doc_role is not None:
+        clauses.append("doc_role = ?")
+        params.append(doc_role)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    return _query(f"SELECT data FROM files{where} ORDER BY rowid", tuple(params))
+
+
+def update_grant(grant_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+    """Update fields of a stored grant (e.g. status, questions). Returns the new record."""
+    with transaction() as connection:
+        row = connection.execute("SELECT data FROM grants WHERE id = ?", (grant_id,)).fetchone()
+        if row is None:
+            return None
+        grant_entry = {**json.loads(row[0]), **fields}
+        connection.execute(
+            "UPDATE grants SET status = ?, data = ?, summary = ? WHERE id = ?",
+            (grant_entry.get("status"), json.dumps(grant_entry), json.dumps(_grant_summary(grant_entry)), grant_id),
+        )
+        _bump_revision(connection, "grants")
+        changed = _grant_summary(fields)
+        if "questions" not in fields:
+            del changed["question_count"]
+        _publish("grant.updated", {"id": grant_id, **changed})
+        return grant_entry
+
+
+def add_job(job: Dict[str, Any]) -> None:
+    """Add a background job record to the database."""
+    with transaction() as connection:
+        connection.execute(
+            "INSERT INTO jobs (id, state, data) VALUES (?, ?, ?)",
+            (job["id"], job["state"], json.dumps(job)),
+        )
+        _publish("job.updated", _job_summary(job))
+
+
+def load_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Look up a single job by id, or None."""
+    init_database()
+    row = _connect().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def load_jobs(state: str) -> List[Dict[str, Any]]:
+    """All jobs currently in `state`, oldest first."""
+    init_database()
+    return [json.loads(row[0]) for row in _connect().execute("SELECT data FROM jobs WHERE state = ? ORDER BY rowid", (state,))]
+
+
+def update_job(
+    job_id: str,
+    expected_state: Optional[str] = None,
+    updated_before: Optional[float] = None,
+    **fields: Any,
+) -> Optional[Dict[str, Any]]:
+    """
+    Update fields of a job. With `expected_state`, the update only applies if
+    the job is still in that state, which lets one worker claim a queued job;
+    with `updated_before`, only if it was last updated before that time.
+    Returns the new record, or None if the job was missing or not claimable.
+    """
+    with transaction() as connection:
+        row = connection.execute("SELECT state, data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (expected_state is not None and row[0] != expected_state):
+            return None
+        if updated_before is not None and json.loads(row[1])["updated_at"] >= updated_before:
+            return None
+        job = {**json.loads(row[1]), **fields, "updated_at": time.time()}
+        connection.execute(
+            "UPDATE jobs SET state = ?, data = ? WHERE id = ?",
+            (job["state"], json.dumps(job), job_id),
+        )
+        _publish("job.updated", _job_summary(job))
+        return job
+
+
+def touch_job(job_id: str, expected_state: str) -> bool:
+    """
+    Refresh a job's updated_at, without publishing a change, while it is
+    still in `expected_state`. Returns whether it was.
+    """
+    with transaction() as connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET data = json_set(data, '$.updated_at', ?) WHERE id = ? AND state = ?",
+            (time.time(), job_id, expected_state),
+        )
+        return cursor.rowcount > 0
+
+
+def add_draft(draft: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store a draft as the next version of its question's drafts (per grant and
+    question_key). Earlier versions are kept. Returns the record with its version.
+    """
+    with transaction() as connection:
+        row = connection.execute(
+            "SELECT MAX(version) FROM drafts WHERE grant_id IS ? AND question_key = ?",
+            (draft.get("grant_id"), draft["question_key"]),
+        ).fetchone()
+        draft = {**draft, "version": (row[0] or 0) + 1, "stale": False}
+        connection.execute(
+            "INSERT INTO drafts (id, grant_id, question_key, version, fingerprint, stale, data) VALUES (?, ?, ?, ?, ?, 0, ?)",
+            (draft["id"], draft.get("grant_id"), draft["question_key"], draft["version"], draft["fingerprint"], json.dumps(draft)),
+        )
+        _publish("draft.created", _draft_summary(draft))
+        return draft
+
+
+def find_draft(grant_id: Optional[str], question_key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """
+    The newest stored draft of a question made from exactly this input, or
+    None. A stale draft whose input matches again is marked fresh.
+    """
+    init_database()
+    row = _connect().execute(
+        "SELECT data FROM drafts WHERE grant_id IS ? AND question_key = ? AND fingerprint = ? ORDER BY version DESC LIMIT 1",
+        (grant_id, question_key, fingerprint),
+    ).fetchone()
+    if row is None:
+        return None
+    draft = json.loads(row[0])
+    if draft.get("stale"):
+        updated = set_drafts_stale([draft["id"]], False)
+        draft = updated[0] if updated else {**draft, "stale": False}
+    return draft
+
+
+def load_drafts(grant_id: Optional[str], question_key: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Every version of one question's drafts, newest first, or with no
+    question_key the latest version of each of the grant's questions.
+    """
+    if question_key is not None:
+        return _query(
+            "SELECT data FROM drafts WHERE grant_id IS ? AND question_key = ? ORDER BY version DESC",
+            (grant_id, question_key),
+        )
+    return _query(
+        "SELECT data FROM drafts AS d WHERE grant_id IS ? AND version = "
+        "(SELECT MAX(version) FROM drafts WHERE grant_id IS d.grant_id AND question_key = d.question_key) "
+        "ORDER BY rowid",
+        (grant_id,),
+    )
+
+
+def set_drafts_stale(draft_ids: List[str], stale: bool = True) -> List[Dict[str, Any]]:
+    """
+    Mark drafts as stale (their context has changed) or fresh again. Returns
+    the records that changed; drafts already in that state are left alone.
+    """
+    updated = []
+    with transaction() as connection:
+        for draft_id in draft_ids:
+            row = connection.execute("SELECT stale, data FROM drafts WHERE id = ?", (draft_id,)).fetchone()
+            if row is None or bool(row[0]) == stale:
+                continue
+            draft = {**json.loads(row[1]), "stale": stale}
+            connection.execute(
+                "UPDATE drafts SET stale = ?, data = ? WHERE id = ?",
+                (int(stale), json.dumps(draft), draft_id),
+            )
+            _publish("draft.updated", _draft_summary(draft))
+            updated.append(draft)
+    return updated
@@ -0,0 +1,128 @@
+import os
+import hashlib
+import pathlib
+import threading
+from email.utils import formatdate
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from app import config
+
+# Bytes read at a time when hashing files that were stored without a sha256
+HASH_CHUNK_BYTES = 1024 * 1024
+# Bytes FileResponse reads and sends at a time, so memory stays flat whatever the file size
+SEND_CHUNK_BYTES = 256 * 1024
+
+
+class PathSendResponse(Response):
+    """
+    A whole-file FileResponse sent with the ASGI `http.response.pathsend`
+    extension: the server is handed the path and can use sendfile, so the
+    bytes never pass through Python.
+    """
+
+    def __init__(self, file_response: FileResponse):
+        self.status_code = file_response.status_code
+        self.path = file_response.path
+        self.background = file_response.background
+        self.raw_headers = file_response.raw_headers
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": str(self.path)})
+        if self.background is not None:
+            await self.background()
+
+
+class _DigestCache:
+    """sha256 of files stored without one (the seed documents), keyed on path, size and mtime."""
+
+    def __init__(self):
+        self._digests: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path: pathlib.Path) -> str:
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._digests:
+                return self._digests[key]
+        hasher = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(HASH_CHUNK_BYTES):
+                hasher.update(chunk)
+        with self._lock:
+            self._digests = {k: v for k, v in self._digests.items() if k[0] != key[0]}
+            self._digests[key] = hasher.hexdigest()
+        return self._digests[key]
+
+
+digests = _DigestCache()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison, as RFC 9110 asks)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def cache_headers(file_metadata: dict, etag: str) -> Dict[str, str]:
+    """
+    Content-addressed uploads never change under their id, so they may be
+    cached for FILE_CACHE_MAX_AGE_SECONDS without revalidating; files stored
+    without a sha256 are revalidated against their ETag on every use.
+    """
+    if file_metadata.get("sha256"):
+        cache_control = f"private, max-age={config.FILE_CACHE_MAX_AGE_SECONDS}, immutable"
+    else:
+        cache_control = "private, no-cache"
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def if_range_matches(if_range: str, etag: str, stat_result: os.stat_result) -> bool:
+    """Whether an If-Range validator is still current: our strong ETag, or the file's Last-Modified date."""
+    if_range = if_range.strip()
+    return if_range == etag or if_range == formatdate(stat_result.st_mtime, usegmt=True)
+
+
+def document_response(file_metadata: dict, path: pathlib.Path, sha256: str, request: Request) -> Response:
+    """
+    A 304 if the client's copy is current, otherwise the file (or the requested ranges of it).
+
+    FileResponse serves Range requests itself but checks If-Range against its
+    own mtime-based ETag, so If-Range is settled here first: a stale
+    validator drops the Range header and the whole file is sent, a current
+    one drops If-Range so the range is honoured. Whole-file GETs go out with
+    pathsend where the server supports it; FileResponse reads the rest in
+    SEND_CHUNK_BYTES pieces.
+    """
+    etag = f'"{sha256}"'
+    headers = cache_headers(file_metadata, etag)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    stat_result = path.stat()
+    if_range = request.headers.get("if-range")
+    if if_range is not None:
+        skip = {b"if-range"} if if_range_matches(if_range, etag, stat_result) else {b"if-range", b"range"}
+        request.scope["headers"] = [(name, value) for name, value in request.scope["headers"] if name not in skip]
+    response = FileResponse(
+        path,
+        headers=headers,
+        media_type=file_metadata.get("content_type") or None,
+        filename=file_metadata.get("original_name"),
+        stat_result=stat_result,
+        content_disposition_type="inline",
+    )
+    response.chunk_size = SEND_CHUNK_BYTES
+    full_body = request.method == "GET" and "range" not in Headers(scope=request.scope)
+    if full_body and "http.response.pathsend" in request.scope.get("extensions", {}):
+        return PathSendResponse(response)
+    return response
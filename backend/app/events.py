@@ -0,0 +1,164 @@
+import json
+import uuid
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from app import config, metrics
+
+
+@dataclass
+class Event:
+    """One change, identified by "<bus epoch>-<sequence>" so ids from an earlier process are recognised."""
+    id: str
+    type: str
+    data: Dict[str, Any]
+
+    @property
+    def grant_id(self) -> Optional[str]:
+        """The grant the change belongs to."""
+        return self.data.get("id") if self.type.startswith("grant.") else self.data.get("grant_id")
+
+    def encode(self) -> str:
+        """The event in Server-Sent Events wire format."""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, separators=(',', ':'))}\n\n"
+
+
+# Sent when the events after a client's Last-Event-ID are no longer buffered
+# (or it fell too far behind): it should refetch and carry on from there
+RESET = "reset"
+# Queued to a subscriber to end its subscription
+_CLOSED = object()
+
+
+@dataclass
+class _Subscriber:
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue
+    overflowed: bool = False
+
+
+class EventBus:
+    """
+    In-process publish/subscribe of data changes, for the /api/events feed.
+
+    Publishing is thread-safe, so database writes made from worker threads
+    can publish directly; events are handed to each subscriber's event loop.
+    The last `buffer_size` events are kept so a reconnecting client can
+    resume from its Last-Event-ID. A subscriber that falls `queue_size`
+    events behind is sent a reset instead of the events it missed.
+
+    The bus lives in one process: with several uvicorn workers, each feed
+    only carries the changes made by its own worker.
+    """
+
+    def __init__(self, buffer_size: int = 1000, queue_size: int = 1000):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self._sequence = 0
+        self._buffer: Deque[Event] = deque(maxlen=buffer_size)
+        self._subscribers: List[_Subscriber] = []
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def publish(self, type: str, data: Dict[str, Any]) -> Event:
+        with self._lock:
+            self._sequence += 1
+            self.published += 1
+            event = Event(f"{self.epoch}-{self._sequence}", type, data)
+            self._buffer.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            self._deliver(subscriber, event)
+        return event
+
+    def _deliver(self, subscriber: _Subscriber, event: Any) -> None:
+        def put() -> None:
+            if subscriber.overflowed:
+                return
+            if subscriber.queue.qsize() >= self.queue_size and event is not _CLOSED:
+                subscriber.overflowed = True
+                subscriber.queue.put_nowait(Event(f"{self.epoch}-{self._sequence}", RESET, {"reason": "overflow"}))
+                return
+            subscriber.queue.put_nowait(event)
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is subscriber.loop:
+            put()
+        elif not subscriber.loop.is_closed():
+            subscriber.loop.call_soon_threadsafe(put)
+
+    def _backlog(self, last_event_id: Optional[str]) -> List[Event]:
+        """Buffered events after `last_event_id`, or a reset if some of them are gone."""
+        if not last_event_id:
+            return []
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return [Event(f"{self.epoch}-{self._sequence}", RESET, {"reason": "unknown_event_id"})]
+        sequence = int(sequence)
+        oldest = int(self._buffer[0].id.partition("-")[2]) if self._buffer else self._sequence + 1
+        if sequence + 1 < oldest:
+            return [Event(f"{self.epoch}-{self._sequence}", RESET, {"reason": "expired"})]
+        return [event for event in self._buffer if int(event.id.partition("-")[2]) > sequence]
+
+    async def subscribe(self, last_event_id: Optional[str] = None, idle_seconds: Optional[float] = None) -> AsyncIterator[Optional[Event]]:
+        """
+        Yield events as they are published, starting with those after
+        `last_event_id`, and None after every `idle_seconds` without one (for
+        keep-alives). Ends when the bus is closed or after an overflow reset.
+        """
+        subscriber = _Subscriber(asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            backlog = self._backlog(last_event_id)
+            self._subscribers.append(subscriber)
+        try:
+            for event in backlog:
+                yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), idle_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is _CLOSED:
+                    return
+                yield event
+                if event.type == RESET and subscriber.overflowed:
+                    return
+        finally:
+            with self._lock:
+                self._subscribers.remove(subscriber)
+
+    def close(self) -> None:
+        """End every subscription, so open streams finish before shutdown."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            self._deliver(subscriber, _CLOSED)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "published": self.published,
+                "buffered": len(self._buffer),
+                "last_event_id": f"{self.epoch}-{self._sequence}",
+            }
+
+
+bus = EventBus(buffer_size=config.EVENTS_BUFFER_SIZE)
+
+
+def _event_metrics():
+    stats = bus.stats()
+    return [
+        ("events_published_total", "counter", "Change events published to the event bus.", [({}, stats["published"])]),
+        ("events_subscribers", "gauge", "Open /api/events streams.", [({}, stats["subscribers"])]),
+    ]
+
+metrics.registry.register_collector(_event_metrics)
@@ -0,0 +1,238 @@
+import time
+import uuid
+import random
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app import config, metrics
+from app.database import add_job, load_jobs, touch_job, update_job, update_grant
+from app.scripts import ai
+
+# Grant status values, in pipeline order
+GRANT_UPLOADING = "uploading"
+GRANT_EXTRACTING = "extracting"
+GRANT_BREAKING_DOWN = "breaking_down"
+GRANT_READY = "ready"
+GRANT_FAILED = "failed"
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class StageFailed(Exception):
+    """A pipeline stage still failed after its last attempt."""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"{stage} failed: {error}")
+        self.stage = stage
+
+
+def create_ingestion_job(grant_id: str, file_metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Record a queued ingestion job for a grant whose document is already on disk."""
+    now = time.time()
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": "ingest_grant",
+        "state": JOB_QUEUED,
+        "grant_id": grant_id,
+        "file": file_metadata,
+        "stage": None,
+        "attempts": 0,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    add_job(job)
+    return job
+
+
+async def _with_retries(job_id: str, stage: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+    """Run one stage, retrying with jittered exponential backoff up to INGESTION_MAX_ATTEMPTS."""
+    max_attempts = max(1, config.INGESTION_MAX_ATTEMPTS)
+    for attempt_number in range(1, max_attempts + 1):
+        await asyncio.to_thread(update_job, job_id, stage=stage, attempts=attempt_number)
+        try:
+            return await attempt()
+        except Exception as e:
+            print(f"Ingestion job {job_id}: {stage} attempt {attempt_number} failed: {e}")
+            if attempt_number == max_attempts:
+                raise StageFailed(stage, e) from e
+            metrics.retries.inc(operation=f"ingestion_{stage}")
+            delay = config.INGESTION_RETRY_BACKOFF_SECONDS * 2 ** (attempt_number - 1)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+
+async def run_ingestion_job(job_id: str) -> None:
+    """
+    Extract and break down the questions of an uploaded grant, moving the
+    grant's status through extracting, breaking_down and ready (or failed).
+
+    The job is claimed atomically, so a job enqueued in several worker
+    processes only runs once. With COMBINED_INGESTION, extraction also
+    returns sub-questions and the breakdown stage has nothing left to do.
+    Each stage is retried on its own: an extraction retry re-sends only the
+    page windows that failed, and a breakdown retry only the questions that
+    came back empty.
+    """
+    job = await asyncio.to_thread(update_job, job_id, expected_state=JOB_QUEUED, state=JOB_RUNNING)
+    if job is None:
+        return
+    grant_id = job["grant_id"]
+    grant_questions: List[Dict[str, Any]] = []
+    heartbeat = asyncio.create_task(_keep_lease(job_id))
+
+    try:
+        await asyncio.to_thread(update_grant, grant_id, status=GRANT_EXTRACTING)
+        preprocessing = await asyncio.to_thread(ai.preprocess_document, job["file"])
+        if preprocessing is not None:
+            await asyncio.to_thread(update_job, job_id, preprocessing=preprocessing)
+        await asyncio.to_thread(ai.index_document, job["file"])
+
+        async def extract() -> List[Dict[str, Any]]:
+            if config.COMBINED_INGESTION:
+                combined = await ai.extract_and_break_down_async(grant_id)
+                if combined:
+                    return combined
+            questions = await ai.extract_narrative_questions_async(grant_id=grant_id)
+            if not questions:
+                raise RuntimeError("no narrative questions were extracted")
+            return [{"question": question, "sub_questions": []} for question in questions]
+
+        grant_questions = await _with_retries(job_id, GRANT_EXTRACTING, extract)
+        await asyncio.to_thread(update_grant, grant_id, status=GRANT_BREAKING_DOWN)
+
+        async def breakdown() -> None:
+            pending = [i for i, item in enumerate(grant_questions) if not item["sub_questions"]]
+            results = await ai.break_down_questions_concurrently([grant_questions[i]["question"] for i in pending])
+            for i, result in zip(pending, results):
+                grant_questions[i] = result
+            missing = sum(1 for item in grant_questions if not item["sub_questions"])
+            if missing:
+                raise RuntimeError(f"{missing} of {len(grant_questions)} questions could not be broken down")
+
+        await _with_retries(job_id, GRANT_BREAKING_DOWN, breakdown)
+
+        await asyncio.to_thread(_finish_job, job_id, grant_id, grant_questions)
+    except asyncio.CancelledError:
+        # The workers are stopping: hand the job back so the next start runs
+        # it. The thread completes even if this task is cancelled again.
+        await asyncio.to_thread(_requeue_job, job_id, grant_id)
+        raise
+    except Exception as e:
+        print(f"Ingestion job {job_id} failed: {e}")
+        await asyncio.to_thread(_finish_job, job_id, grant_id, grant_questions, str(e))
+    finally:
+        heartbeat.cancel()
+
+
+def _finish_job(job_id: str, grant_id: str, grant_questions: List[Dict[str, Any]], error: Optional[str] = None) -> None:
+    """Store a finished job's questions on its grant, as ready or (with an error) failed."""
+    if error is None:
+        ai.index_grant_questions(update_grant(grant_id, status=GRANT_READY, questions=grant_questions))
+        update_job(job_id, state=JOB_SUCCEEDED, stage=None)
+    else:
+        ai.index_grant_questions(update_grant(grant_id, status=GRANT_FAILED, questions=grant_questions, error=error))
+        update_job(job_id, state=JOB_FAILED, error=error)
+
+
+def _requeue_job(job_id: str, grant_id: str) -> None:
+    if update_job(job_id, expected_state=JOB_RUNNING, state=JOB_QUEUED, stage=None) is not None:
+        update_grant(grant_id, status=GRANT_UPLOADING)
+
+
+async def _keep_lease(job_id: str) -> None:
+    """Refresh a running job's lease until it stops running or this task is cancelled."""
+    while True:
+        await asyncio.sleep(config.INGESTION_JOB_LEASE_SECONDS / 3)
+        if not await asyncio.to_thread(touch_job, job_id, JOB_RUNNING):
+            return
+
+
+def recover_stale_jobs() -> List[str]:
+    """
+    Re-queue running jobs whose lease ran out, i.e. whose worker process
+    died mid-job, and return their ids. A job that has already been
+    recovered INGESTION_MAX_ATTEMPTS times is failed instead, with its
+    grant, so a job that keeps crashing its worker is not retried forever.
+    """
+    stale_before = time.time() - config.INGESTION_JOB_LEASE_SECONDS
+    requeued = []
+    for job in load_jobs(JOB_RUNNING):
+        recoveries = job.get("recoveries", 0) + 1
+        claim = {"expected_state": JOB_RUNNING, "updated_before": stale_before, "recoveries": recoveries}
+        if recoveries > max(1, config.INGESTION_MAX_ATTEMPTS):
+            error = f"worker stopped during {job.get('stage') or 'ingestion'} {recoveries - 1} times"
+            if update_job(job["id"], state=JOB_FAILED, error=error, **claim) is not None:
+                update_grant(job["grant_id"], status=GRANT_FAILED, error=error)
+        elif update_job(job["id"], state=JOB_QUEUED, stage=None, **claim) is not None:
+            update_grant(job["grant_id"], status=GRANT_UPLOADING)
+            requeued.append(job["id"])
+    return requeued
+
+
+class IngestionQueue:
+    """
+    In-process pool of workers that run queued ingestion jobs, plus a
+    reaper that re-queues jobs left running by a worker process that died.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self, workers: Optional[int] = None) -> None:
+        """Start the workers and pick up jobs that were queued, or left running, at shutdown."""
+        self._queue = asyncio.Queue()
+        await asyncio.to_thread(recover_stale_jobs)
+        for job in await asyncio.to_thread(load_jobs, JOB_QUEUED):
+            self._queue.put_nowait(job["id"])
+        self._workers = [
+            asyncio.create_task(self._work())
+            for _ in range(max(1, workers or config.INGESTION_WORKERS))
+        ]
+        self._workers.append(asyncio.create_task(self._reap()))
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    def enqueue(self, job_id: str) -> None:
+        """
+        Queue a job for the workers. Jobs enqueued before start() stay
+        queued in the database and are picked up when the queue starts.
+        """
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await run_ingestion_job(job_id)
+            except Exception as e:
+                print(f"Ingestion worker error on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(config.INGESTION_JOB_LEASE_SECONDS)
+            try:
+                for job_id in await asyncio.to_thread(recover_stale_jobs):
+                    self._queue.put_nowait(job_id)
+            except Exception as e:
+                print(f"Ingestion job recovery failed: {e}")
+
+    async def join(self) -> None:
+        """Wait until every queued job has been processed."""
+        if self._queue is not None:
+            await self._queue.join()
+
+
+ingestion_queue = IngestionQueue()
@@ -2,12 +2,57 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.utils import ensure_uploads_dir, UPLOADS_DIR
 import shutil
+import asyncio
 from app.routes import api_router
+from app import events
+from app.scripts import ai
+from app.database import load_file_metadata
+from app.jobs import ingestion_queue
+from app.metrics import MetricsMiddleware
+from app.profiling import ProfilingMiddleware
+from contextlib import asynccontextmanager
+
+PRESERVE_UPLOAD_FILES = [
+    "default-grant-doc.pdf",
+    "budget_template.pdf",
+]
+
+def cleanup_uploads() -> None:
+    """Remove upload files that no database record refers to."""
+    ensure_uploads_dir()
+    referenced = {item.get("stored_name") for item in load_file_metadata()}
+    for item in UPLOADS_DIR.iterdir():
+        if item.name in PRESERVE_UPLOAD_FILES or item.name in referenced:
+            continue
+        if item.is_file() or item.is_symlink():
+            item.unlink(missing_ok=True)
+        elif item.is_dir():
+            shutil.rmtree(item, ignore_errors=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup: clear unreferenced uploads, load the retrieval and question
+    indexes and start the ingestion workers. Shutdown: stop the workers (their
+    running jobs are requeued), end open event streams and close the model
+    client's connection pools.
+    """
+    await asyncio.to_thread(cleanup_uploads)
+    await asyncio.to_thread(ai.sync_retrieval_index)
+    await asyncio.to_thread(ai.sync_question_index)
+    await ingestion_queue.start()
+    try:
+        yield
+    finally:
+        await ingestion_queue.stop()
+        events.bus.close()
+        await ai.close_client()
 
 app = FastAPI(
     title="Grant Writing Demo API",
     description="FastAPI backend for Next.js frontend",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -19,25 +64,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time every request by route for /api/metrics
+app.add_middleware(MetricsMiddleware)
+# Per-request cProfile and Server-Timing, for requests carrying PROFILE_TOKEN
+app.add_middleware(ProfilingMiddleware)
+
 # Include API routes
 app.include_router(api_router, prefix="/api")
 
-PRESERVE_UPLOAD_FILES = [
-    "default-grant-doc.pdf",
-    "budget_template.pdf",
-]
-
-@app.on_event("startup")
-async def cleanup_uploads_on_startup() -> None:
-    ensure_uploads_dir()
-    for item in UPLOADS_DIR.iterdir():
-        if item.name in PRESERVE_UPLOAD_FILES:
-            continue
-        if item.is_file() or item.is_symlink():
-            item.unlink(missing_ok=True)
-        elif item.is_dir():
-            shutil.rmtree(item, ignore_errors=True)
-
 @app.get("/")
 async def root():
     return {
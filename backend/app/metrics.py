@@ -0,0 +1,348 @@
+import time
+import inspect
+import functools
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app import profiling
+
+# Latency buckets in seconds, wide enough for multi-minute model calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class _Metric:
+    """
+    Base for metrics whose samples are kept per thread.
+
+    Each thread records into its own dict, so the hot path takes no lock: only
+    a thread's first sample registers its shard. A scrape sums the shards.
+    """
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "values", None)
+        if shard is None:
+            shard = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _key(self, labels: Dict[str, Any]) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _snapshots(self) -> List[dict]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [dict(shard) for shard in shards]
+
+    def _labels(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def samples(self) -> Dict[tuple, float]:
+        totals: Dict[tuple, float] = {}
+        for snapshot in self._snapshots():
+            for key, value in snapshot.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{self._labels(key)} {_number(value)}" for key, value in sorted(self.samples().items())]
+
+
+class Gauge(Counter):
+    """A counter that can go down, such as calls in flight."""
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        shard = self._shard()
+        key = self._key(labels)
+        # [count per bucket..., +Inf count, sum]
+        entry = shard.get(key)
+        if entry is None:
+            entry = shard[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[i] += 1
+                break
+        else:
+            entry[len(self.buckets)] += 1
+        entry[-1] += value
+
+    def render(self) -> List[str]:
+        totals: Dict[tuple, list] = {}
+        for snapshot in self._snapshots():
+            for key, entry in snapshot.items():
+                entry = list(entry)
+                total = totals.setdefault(key, [0] * len(entry))
+                for i, value in enumerate(entry):
+                    total[i] += value
+        lines = []
+        for key, entry in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = self._labels(key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_number(entry[-1])}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Registry:
+    """
+    Metrics rendered in the Prometheus text format.
+
+    Collectors are callables run at scrape time that return
+    (name, kind, help, [(labels, value), ...]) tuples, for counts that
+    other objects already keep (such as cache statistics).
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[tuple]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    pairs = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+                    lines.append(f"{name}{{{pairs}}} {_number(value)}" if pairs else f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the last byte of the response, by route.",
+    ("method", "route", "status"),
+)
+ai_call_duration = registry.histogram(
+    "ai_call_duration_seconds",
+    "Duration of app.scripts.ai functions.",
+    ("function", "outcome"),
+)
+llm_requests = registry.counter(
+    "llm_requests_total",
+    "Model calls, by model, operation and outcome.",
+    ("model", "operation", "outcome"),
+)
+llm_input_tokens = registry.counter(
+    "llm_input_tokens_total",
+    "Prompt tokens reported in response usage metadata.",
+    ("model", "operation"),
+)
+llm_output_tokens = registry.counter(
+    "llm_output_tokens_total",
+    "Output tokens reported in response usage metadata.",
+    ("model", "operation"),
+)
+llm_in_flight = registry.gauge(
+    "llm_in_flight_requests",
+    "Model calls currently awaiting a response.",
+    ("model",),
+)
+retries = registry.counter(
+    "retries_total",
+    "Retried attempts, by operation.",
+    ("operation",),
+)
+question_reuses = registry.counter(
+    "question_reuses_total",
+    "Breakdowns and draft context taken from similar questions, by kind.",
+    ("kind",),
+)
+documents_preprocessed = registry.counter(
+    "documents_preprocessed_total",
+    "Uploaded PDFs whose page text was extracted, by how prompts send them (text, pdf, or scanned).",
+    ("sent_as",),
+)
+preprocessing_tokens_saved = registry.counter(
+    "preprocessing_tokens_saved_total",
+    "Estimated prompt tokens saved per prompt by sending uploaded PDFs as page text.",
+)
+
+
+def record_usage(model: str, operation: str, usage_metadata) -> None:
+    """Add a response's prompt and output token counts to the token counters."""
+    if usage_metadata is None:
+        return
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", None)
+    output_tokens = getattr(usage_metadata, "candidates_token_count", None)
+    if prompt_tokens:
+        llm_input_tokens.inc(prompt_tokens, model=model, operation=operation)
+    if output_tokens:
+        llm_output_tokens.inc(output_tokens, model=model, operation=operation)
+
+
+def timed(function: str) -> Callable:
+    """
+    Record the duration and outcome of a function in ai_call_duration_seconds,
+    and as an "ai.<function>" span of the current request. Works on plain
+    functions, coroutines and async generators (timed from the first step to
+    exhaustion or close).
+    """
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def coroutine_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                outcome = "error"
+                try:
+                    result = await fn(*args, **kwargs)
+                    outcome = "ok"
+                    return result
+                finally:
+                    elapsed = time.perf_counter() - start
+                    ai_call_duration.observe(elapsed, function=function, outcome=outcome)
+                    profiling.record(f"ai.{function}", elapsed)
+            return coroutine_wrapper
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def generator_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                outcome = "error"
+                generator = fn(*args, **kwargs)
+                try:
+                    async for item in generator:
+                        yield item
+                    outcome = "ok"
+                except GeneratorExit:
+                    outcome = "closed"
+                    raise
+                finally:
+                    await generator.aclose()
+                    elapsed = time.perf_counter() - start
+                    ai_call_duration.observe(elapsed, function=function, outcome=outcome)
+                    profiling.record(f"ai.{function}", elapsed)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                ai_call_duration.observe(elapsed, function=function, outcome=outcome)
+                profiling.record(f"ai.{function}", elapsed)
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request until its last body chunk, so
+    streamed responses are measured in full. Requests are labelled with the
+    matched route template rather than the raw path to keep label sets small.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+        recorded = False
+
+        def record() -> None:
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=scope.get("method", ""),
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
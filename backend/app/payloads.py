@@ -0,0 +1,144 @@
+import gzip
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import orjson
+from starlette.responses import Response
+
+from app import config, metrics
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it responses are only offered gzip-compressed
+    brotli = None
+
+
+def project(raw: str, fields: List[str]) -> bytes:
+    """Keep only `fields` of a stored JSON record."""
+    record = orjson.loads(raw)
+    return orjson.dumps({field: record[field] for field in fields if field in record})
+
+
+def envelope(items_key: str, items: List, **extra) -> bytes:
+    """
+    {"<items_key>": [...], **extra} from records that are already JSON, so
+    they are joined as they are instead of being decoded and encoded again.
+    """
+    parts = [item.encode("utf-8") if isinstance(item, str) else item for item in items]
+    body = b'{"' + items_key.encode("utf-8") + b'":[' + b",".join(parts) + b"]"
+    for name, value in extra.items():
+        body += b',"' + name.encode("utf-8") + b'":' + orjson.dumps(value)
+    return body + b"}"
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    The content coding we support that the client rates highest (br before
+    gzip on a tie), or None. Codings not listed take the "*" rating, if any.
+    """
+    accepted: Dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    supported = ("br", "gzip") if brotli is not None else ("gzip",)
+    ratings = {name: accepted.get(name, accepted.get("*", 0.0)) for name in supported}
+    best = max(supported, key=ratings.get)
+    return best if ratings[best] > 0 else None
+
+
+def compress(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    """(body, encoding actually applied); small bodies are sent as they are."""
+    if encoding is None or len(body) < config.RESPONSE_COMPRESS_MIN_BYTES:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=config.RESPONSE_GZIP_LEVEL), "gzip"
+
+
+class ResponseCache:
+    """
+    Encoded response bodies, each tagged with the revision of the table it
+    was read from (database.revision). An entry is only served while that
+    revision is current, so any write, by any worker, invalidates it.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, revision: int) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == revision:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, revision: int, value: tuple) -> None:
+        with self._lock:
+            self._entries[key] = (revision, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache(config.RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def _response_cache_metrics():
+    stats = response_cache.stats()
+    return [
+        ("response_cache_hits_total", "counter", "Listing responses served from the encoded body cache.", [({}, stats["hits"])]),
+        ("response_cache_misses_total", "counter", "Listing responses built and encoded.", [({}, stats["misses"])]),
+    ]
+
+metrics.registry.register_collector(_response_cache_metrics)
+
+
+async def cached_json(
+    key: Hashable,
+    revision: Callable[[], int],
+    build: Callable[[], Optional[bytes]],
+    accept_encoding: Optional[str],
+) -> Optional[Response]:
+    """
+    A JSON response for `key`, served from response_cache while the table's
+    revision is unchanged, otherwise built with `build` (run off the event
+    loop), compressed for the client and cached. None if `build` finds nothing.
+    The revision is read before building, so a write made meanwhile makes the
+    entry stale rather than hiding the write.
+    """
+    encoding = choose_encoding(accept_encoding)
+    # A primary-key read in WAL mode, cheap enough to run on the loop
+    current = revision()
+    cached = response_cache.get((key, encoding), current)
+    if cached is None:
+        body = await asyncio.to_thread(build)
+        if body is None:
+            return None
+        cached = await asyncio.to_thread(compress, body, encoding)
+        response_cache.set((key, encoding), current, cached)
+    body, applied = cached
+    headers = {"Vary": "Accept-Encoding"}
+    if applied:
+        headers["Content-Encoding"] = applied
+    return Response(body, media_type="application/json", headers=headers)
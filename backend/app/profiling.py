@@ -0,0 +1,142 @@
+import re
+import hmac
+import time
+import asyncio
+import cProfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from app import config
+
+# Wall-clock spans of the current request, or None when it is not being timed
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_PARAM = "profile"
+
+
+def record(name: str, seconds: float) -> None:
+    """Add a span to the current request's Server-Timing, if it is being timed."""
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name: str):
+    """Time a pipeline stage of the current request."""
+    if _request_spans.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def server_timing(spans: List[Tuple[str, float]]) -> str:
+    """
+    Server-Timing header value for a list of spans. Spans sharing a name are
+    summed, and the number of occurrences is given in the description.
+    """
+    totals = {}
+    for name, seconds in spans:
+        total, count = totals.get(name, (0.0, 0))
+        totals[name] = (total + seconds, count + 1)
+    entries = []
+    for name, (seconds, count) in totals.items():
+        entry = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)};dur={seconds * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="x{count}"'
+        entries.append(entry)
+    return ", ".join(entries)
+
+
+def _profile_requested(scope) -> bool:
+    """Whether the request carries the profiling token in its header or query string."""
+    if not config.PROFILE_TOKEN:
+        return False
+    supplied = None
+    for key, value in scope.get("headers", []):
+        if key.decode("latin-1").lower() == PROFILE_HEADER:
+            supplied = value.decode("latin-1")
+            break
+    if supplied is None:
+        values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(PROFILE_QUERY_PARAM)
+        supplied = values[0] if values else None
+    return supplied is not None and hmac.compare_digest(supplied, config.PROFILE_TOKEN)
+
+
+def _profile_path(scope):
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", scope.get("path", "")).strip("_") or "root"
+    return config.PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{scope.get('method', '')}-{slug}.prof"
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in profiling of single requests.
+
+    A request whose X-Profile header or ?profile= query parameter matches
+    PROFILE_TOKEN runs under cProfile, and the stats are written to
+    PROFILE_DIR (open them with pstats, snakeviz or flameprof). Its response
+    carries the file name in X-Profile-File. cProfile sees everything on the
+    event loop thread while the request runs, so concurrent requests show up
+    too; only one request is profiled at a time.
+
+    Profiled requests, and every request when SERVER_TIMING is on, get a
+    Server-Timing header with the pipeline stages recorded through span().
+    Stages that finish after the headers are sent (the body of a streamed
+    response) are not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._profiling = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = _profile_requested(scope) and not self._profiling
+        if not profile and not config.SERVER_TIMING:
+            await self.app(scope, receive, send)
+            return
+
+        spans: List[Tuple[str, float]] = []
+        token = _request_spans.set(spans)
+        start = time.perf_counter()
+        profiler = None
+        profile_path = None
+        if profile:
+            self._profiling = True
+            profiler = cProfile.Profile()
+            profile_path = _profile_path(scope)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                timing = server_timing(spans + [("total", time.perf_counter() - start)])
+                headers.append((b"server-timing", timing.encode("latin-1")))
+                if profile_path is not None:
+                    headers.append((b"x-profile-file", profile_path.name.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            if profiler is not None:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                try:
+                    config.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                    await asyncio.to_thread(profiler.dump_stats, str(profile_path))
+                except OSError as e:
+                    print(f"Warning: could not write profile {profile_path}: {e}")
+            _request_spans.reset(token)
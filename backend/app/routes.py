@@ -1,8 +1,14 @@
-from fastapi import APIRouter, HTTPException, Form
+from fastapi import APIRouter, HTTPException, Form, Header, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import asyncio
+import json
+import math
+from dataclasses import asdict
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import AsyncIterator, List, Optional, Dict
 from app.scripts import ai
-from app.database import add_file_metadata, add_to_grants_database
+from app.database import add_file_metadata, add_to_grants_database, file_page, grant_page, load_drafts, load_file, load_grant, load_grant_json, load_job, revision, update_grant
+from app import config, downloads, events, jobs, metrics, payloads, profiling
 
 api_router = APIRouter()
 
@@ -18,18 +24,12 @@ async def health_check():
         message="Backend is running successfully!"
     )
 
+def model_unavailable(e: ai.ModelUnavailable) -> HTTPException:
+    """503 with a Retry-After hint, for model calls the gateway gave up on."""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
 # Gemini API Integration
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Configure Gemini API
-GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
 
 class GenerateRequest(BaseModel):
     prompt: str
@@ -39,25 +39,74 @@ async def generate_text(request: GenerateRequest):
     """
     Generate text using Gemini API
     """
-    if not GOOGLE_API_KEY:
+    if not ai.backend_configured():
         raise HTTPException(
             status_code=500, 
             detail="GEMINI_API_KEY not found in environment variables"
         )
         
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(request.prompt)
+        client = ai.get_client()
+        response = await ai.generate_content_async(
+            client,
+            "generate",
+            model=ai.MODEL,
+            contents=request.prompt,
+        )
         return {"response": response.text}
+    except ai.ModelUnavailable as e:
+        raise model_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def ndjson_stream(items: AsyncIterator[dict]) -> StreamingResponse:
+    """
+    Send an event stream as newline-delimited JSON, finishing with
+    {"type": "done"}, or {"type": "error", "detail": ...} if it fails part way.
+    """
+    async def lines():
+        try:
+            async for item in items:
+                yield json.dumps(item) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+        finally:
+            await items.aclose()
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def text_deltas(chunks: AsyncIterator[str]) -> AsyncIterator[dict]:
+    """{"type": "delta", "text": ...} for each chunk of a text stream."""
+    try:
+        async for text in chunks:
+            yield {"type": "delta", "text": text}
+    finally:
+        await chunks.aclose()
+
+
+@api_router.post("/generate/stream")
+async def generate_text_stream(request: GenerateRequest):
+    """
+    Stream generated text from the Gemini API as NDJSON events
+    """
+    if not ai.backend_configured():
+        raise HTTPException(
+            status_code=500,
+            detail="GEMINI_API_KEY not found in environment variables"
+        )
+    return ndjson_stream(text_deltas(ai.stream_text(request.prompt)))
+
 # File Upload Integration
 from fastapi import UploadFile, File
-import shutil
 import uuid
 import time
-from app.utils import get_upload_path
+from app.utils import get_upload_path, save_upload_stream, save_upload_bytes, UploadTooLarge
 
 
 @api_router.post("/upload_file")
@@ -67,7 +116,7 @@ async def upload_file(
     grant_id: str = Form(...),
     ):
     """
-    Upload a file, save it to disk, and record metadata in index.json
+    Upload a file, save it to disk, and record metadata in the database
     """
     try:
         # Generate a unique ID for the file
@@ -75,33 +124,42 @@ async def upload_file(
         # Preserve original extension or assume none/binary
         original_filename = file.filename if file.filename else "unknown"
         ext = os.path.splitext(original_filename)[1]
-        stored_filename = f"{file_id}{ext}"
         
-        # Save file to disk
-        file_path = get_upload_path(stored_filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Stream file to disk; identical content shares one stored blob
+        blob = await save_upload_stream(file, ext)
             
         # Create metadata
         metadata = {
             "id": file_id,
             "original_name": original_filename,
-            "stored_name": stored_filename,
+            "stored_name": blob.stored_name,
             "content_type": file.content_type,
             "doc_role": file_role,
             "grant_id": grant_id,
-            "upload_timestamp": time.time()
+            "upload_timestamp": time.time(),
+            "sha256": blob.sha256,
+            "size_bytes": blob.size_bytes,
         }
         
         # Save metadata
-        add_file_metadata(metadata)
+        await asyncio.to_thread(add_file_metadata, metadata)
+        preprocessing = await asyncio.to_thread(ai.preprocess_document, metadata)
+        await asyncio.to_thread(ai.index_document, metadata)
+        # Drafts are re-planned in the background; those still valid turn fresh again
+        stale_drafts = await asyncio.to_thread(ai.mark_stale_drafts, grant_id)
+        ai.stale_draft_checker.schedule(stale_drafts)
         
         return {
             "message": "File uploaded successfully", 
             "file_id": file_id,
-            "file_info": metadata
+            "file_info": metadata,
+            "deduplicated": blob.deduplicated,
+            "preprocessing": preprocessing,
+            "stale_drafts": len(stale_drafts),
         }
         
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -109,6 +167,7 @@ async def upload_file(
 class TextUploadRequest(BaseModel):
     text: str
     filename: Optional[str] = None
+    grant_id: Optional[str] = None
 
 @api_router.post("/upload_text")
 async def upload_text(request: TextUploadRequest):
@@ -118,36 +177,42 @@ async def upload_text(request: TextUploadRequest):
     try:
         file_id = str(uuid.uuid4())
         original_filename = request.filename if request.filename else "text_upload.txt"
-        stored_filename = f"{file_id}.txt"
         
-        file_path = get_upload_path(stored_filename)
-        
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(request.text)
+        blob = await save_upload_bytes(request.text.encode("utf-8"), ".txt")
             
         metadata = {
             "id": file_id,
             "original_name": original_filename,
-            "stored_name": stored_filename,
+            "stored_name": blob.stored_name,
             "content_type": "text/plain",
             "doc_role": "context",
+            "grant_id": request.grant_id,
             "upload_timestamp": time.time(),
-            "size_bytes": os.path.getsize(file_path)
+            "sha256": blob.sha256,
+            "size_bytes": blob.size_bytes,
         }
         
-        save_upload_metadata(metadata)
+        await asyncio.to_thread(add_file_metadata, metadata)
+        await asyncio.to_thread(ai.index_document, metadata)
+        # Drafts are re-planned in the background; those still valid turn fresh again
+        stale_drafts = await asyncio.to_thread(ai.mark_stale_drafts, request.grant_id)
+        ai.stale_draft_checker.schedule(stale_drafts)
         
         return {
             "message": "Text saved successfully",
             "file_id": file_id,
-            "file_info": metadata
+            "file_info": metadata,
+            "deduplicated": blob.deduplicated,
+            "stale_drafts": len(stale_drafts),
         }
         
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@api_router.post("/upload_grant")
+@api_router.post("/upload_grant", status_code=202)
 async def upload_grant(
     file: UploadFile = File(...),
     grant_name: str = Form(...),
@@ -156,154 +221,429 @@ async def upload_grant(
     due_date: str = Form(...),
 ):
     """
-    Upload a grant document with department and county information
-    """
-    
-    import os
-    import shutil
+    Upload a grant document with department and county information.
 
+    The document is saved and an ingestion job is queued; question extraction
+    and breakdown run in the background. Poll /jobs/{job_id} or the grant's
+    status for progress.
+    """
+    try:
+        grant_id = str(uuid.uuid4())
 
+        with profiling.span("db_write"):
+            await asyncio.to_thread(add_to_grants_database, {
+                "id": grant_id,
+                "name": grant_name,
+                "department": department,
+                "county": county,
+                "due_date": due_date,
+                "questions": [],
+                "status": jobs.GRANT_UPLOADING,
+            })
 
-    try:
         # Generate a unique ID for the file
         file_id = str(uuid.uuid4())
         # Preserve original extension or assume none/binary
         original_filename = file.filename if file.filename else "unknown"
         ext = os.path.splitext(original_filename)[1]
-        stored_filename = f"{file_id}{ext}"
         
-        # Save file to disk
-        file_path = get_upload_path(stored_filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        grant_id = str(uuid.uuid4())
+        # Stream file to disk; re-uploads of the same document share one blob
+        # and reuse its cached extraction results
+        try:
+            with profiling.span("save_upload"):
+                blob = await save_upload_stream(file, ext)
+        except Exception as e:
+            await asyncio.to_thread(update_grant, grant_id, status=jobs.GRANT_FAILED, error=str(e))
+            raise
             
         # Create metadata including department and county
         file_metadata = {
             "id": file_id,
             "original_name": original_filename,
-            "stored_name": stored_filename,
+            "stored_name": blob.stored_name,
             "content_type": file.content_type,
             "doc_role": "grant",
             "upload_timestamp": time.time(),
             "grant_id": grant_id,
+            "sha256": blob.sha256,
+            "size_bytes": blob.size_bytes,
         }
         
         # Save metadata
-        add_file_metadata(file_metadata)
-
-        questions = ai.extract_narrative_questions(grant_id = grant_id)
-
-        grant_questions = []
-
-        for question in questions:
-            question_breakdown = ai.break_down_question(question)
-            grant_questions.append({
-                "question": question,
-                "sub_questions": question_breakdown
-            })
-        
-        print("Grant Questions:\n\n", grant_questions, "\n\n")
-
-        grant_entry = {
-            "id": grant_id,
-            "name": grant_name,
-            "department": department,
-            "county": county,
-            "due_date": due_date,
-            "questions": grant_questions,
-            "status": "researching"
-        }
-
-        add_to_grants_database(grant_entry)
+        with profiling.span("db_write"):
+            await asyncio.to_thread(add_file_metadata, file_metadata)
+            job = await asyncio.to_thread(jobs.create_ingestion_job, grant_id, file_metadata)
+        jobs.ingestion_queue.enqueue(job["id"])
         
         return {
-            "message": "Grant document uploaded successfully", 
+            "message": "Grant document uploaded; ingestion queued", 
             "file_id": file_id,
+            "grant_id": grant_id,
+            "job_id": job["id"],
+            "deduplicated": blob.deduplicated,
         }
         
-        
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Report the state of a background job and the status of its grant.
+    """
+    job = await asyncio.to_thread(load_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    grant = await asyncio.to_thread(load_grant, job["grant_id"])
+    return {
+        "job": {key: value for key, value in job.items() if key != "file"},
+        "grant_status": grant.get("status") if grant else None,
+    }
+
 # AI Workflow Endpoints
 @api_router.post("/extract_questions")
-async def extract_questions():
+async def extract_questions(grant_id: str):
     """
     Extract narrative questions from the uploaded grant document.
     """
     try:
-        questions = ai.extract_narrative_questions()
+        questions = await ai.extract_narrative_questions_async(grant_id=grant_id)
         return {"questions": questions}
+    except ai.PartialExtraction as e:
+        # Some page windows failed: return what was found and say which pages are missing
+        return {"questions": e.questions, "incomplete": True, "failed_pages": e.failed_pages}
+    except ai.ModelUnavailable as e:
+        raise model_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 class QuestionBreakdownRequest(BaseModel):
-    question: str
+    question: Optional[str] = None
+    questions: Optional[List[str]] = None  # batch input; answered in batched model calls
 
 @api_router.post("/break_down_question")
 async def break_down_question(request: QuestionBreakdownRequest):
     """
-    Break down a complex question into sub-questions.
+    Break down a complex question into sub-questions, or a list of questions
+    into {"question", "sub_questions"} results in input order.
     """
+    if request.questions is None and request.question is None:
+        raise HTTPException(status_code=422, detail="Provide 'question' or 'questions'.")
     try:
-        sub_questions = ai.break_down_question(request.question)
+        if request.questions is not None:
+            results = await ai.break_down_questions_async(request.questions)
+            return {
+                "results": [
+                    {"question": question, "sub_questions": sub_questions}
+                    for question, sub_questions in zip(request.questions, results)
+                ]
+            }
+        sub_questions = await ai.break_down_question_async(request.question)
         return {"sub_questions": sub_questions}
+    except ai.ModelUnavailable as e:
+        raise model_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.get("/similar_questions")
+async def similar_questions(question: str, k: int = 5):
+    """
+    Stored questions of every grant most similar to `question`, with their
+    sub-questions and cosine similarity, best first.
+    """
+    matches = await asyncio.to_thread(ai.search_questions, question, max(1, min(k, 50)))
+    return {"matches": [asdict(match) for match in matches]}
+
+
+@api_router.get("/llm_cache")
+async def llm_cache_stats():
+    """
+    Report hit/miss counts for the breakdown and extraction result cache,
+    the extracted PDF text store and the context token count cache.
+    """
+    return {
+        "cache": ai.llm_cache.stats(),
+        "document_text": ai.document_texts.stats(),
+        "token_counts": ai.token_counter.stats(),
+        "question_index": ai.question_index.stats(),
+    }
+
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Request and model-call metrics in the Prometheus text exposition format.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@api_router.get("/events")
+async def change_events(
+    grant_id: Optional[str] = None,
+    since: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Server-Sent Events feed of data changes, so pages can update in place
+    instead of refetching /all_grants and /all_files.
+
+    Events are grant.created and grant.updated (the changed fields, with
+    questions reduced to question_count), file.created, job.updated, and
+    draft.created and draft.updated (a draft's version and stale flag).
+    A reconnecting EventSource resumes after its Last-Event-ID (or ?since=).
+    A "reset" event means changes were missed: refetch, then keep listening.
+    Pass grant_id to receive only one grant's changes.
+    """
+    async def stream():
+        yield "retry: 3000\n\n"
+        subscription = events.bus.subscribe(last_event_id or since, idle_seconds=config.EVENTS_HEARTBEAT_SECONDS)
+        try:
+            async for event in subscription:
+                if event is None:
+                    yield ": keep-alive\n\n"
+                elif grant_id is None or event.type == events.RESET or event.grant_id == grant_id:
+                    yield event.encode()
+        finally:
+            await subscription.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 class GenerateResponseRequest(BaseModel):
     question: str
     outline: Dict  # expects a dict with "sections": [{"name": "...", "description": "..."}]
+    grant_id: Optional[str] = None  # limits context to this grant's documents
+    regenerate: bool = False  # draft again even if a stored draft matches
 
 @api_router.post("/generate_response")
 async def generate_response(request: GenerateResponseRequest):
     """
-    Generate a draft response for a question.
+    Generate a draft response for a question, with a report of the context
+    parts it was given and their token counts. A stored draft made from the
+    same question, outline, model and documents is returned without
+    redrafting; "draft" gives its version and whether it was reused.
     """
     try:
-        response_text = ai.generate_response(request.question, request.outline)
-        return {"response": response_text}
+        return await ai.draft_response_async(
+            request.question, request.outline, grant_id=request.grant_id, regenerate=request.regenerate
+        )
+    except ai.ModelUnavailable as e:
+        raise model_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.post("/generate_response/stream")
+async def generate_response_stream(request: GenerateResponseRequest):
+    """
+    Stream a draft response for a question as NDJSON events: one
+    {"type": "context", ...} report of the packed context, then the deltas,
+    then {"type": "draft", ...} describing the stored version. A matching
+    stored draft is sent as a single delta.
+    """
+    if not ai.backend_configured():
+        raise HTTPException(status_code=500, detail="GEMINI_API_KEY not found.")
+    plan = await ai.plan_response_context_async(request.question, request.outline, grant_id=request.grant_id)
+    draft_input, stored = await ai.stored_draft(request.question, request.outline, request.grant_id, plan)
+
+    async def response_events():
+        yield {"type": "context", **plan.report()}
+        if stored is not None and not request.regenerate:
+            result = ai.draft_result(stored, cached=True)
+            yield {"type": "delta", "text": result["response"]}
+            yield {"type": "draft", **result["draft"]}
+            return
+        text = []
+        deltas = text_deltas(ai.generate_response_stream(request.question, request.outline, plan=plan))
+        try:
+            async for event in deltas:
+                text.append(event["text"])
+                yield event
+        finally:
+            await deltas.aclose()
+        draft = await ai.save_draft(request.question, request.outline, draft_input, "".join(text), plan.report())
+        yield {"type": "draft", **draft["draft"]}
+
+    return ndjson_stream(response_events())
+
+
+
+class DraftAllRequest(BaseModel):
+    concurrency: Optional[int] = None  # defaults to DRAFT_ALL_CONCURRENCY
+
+
+@api_router.post("/grants/{grant_id}/draft_all")
+async def draft_all_questions(grant_id: str, request: Optional[DraftAllRequest] = None):
+    """
+    Draft every stored question of a grant concurrently, streaming each draft
+    as an NDJSON {"type": "draft", ...} event as soon as it finishes.
+    """
+    grant = await asyncio.to_thread(load_grant, grant_id)
+    if not grant:
+        raise HTTPException(status_code=404, detail="Grant not found")
+    if not ai.backend_configured():
+        raise HTTPException(status_code=500, detail="GEMINI_API_KEY not found.")
+
+    concurrency = request.concurrency if request else None
+    drafts = ai.draft_questions(grant_id, grant.get("questions", []), concurrency=concurrency)
+
+    async def draft_events():
+        try:
+            async for draft in drafts:
+                yield {"type": "draft", **draft}
+        finally:
+            await drafts.aclose()
+
+    return ndjson_stream(draft_events())
+
+
+@api_router.get("/grants/{grant_id}/drafts")
+async def get_grant_drafts(grant_id: str):
+    """
+    The latest stored draft of each of a grant's questions. Drafts marked
+    "stale" were made from documents that have changed since.
+    """
+    return {"drafts": await asyncio.to_thread(load_drafts, grant_id)}
+
+
+@api_router.get("/grants/{grant_id}/drafts/{question_key}")
+async def get_draft_versions(grant_id: str, question_key: str):
+    """Every stored version of one question's draft, newest first, for comparison."""
+    versions = await asyncio.to_thread(load_drafts, grant_id, question_key)
+    if not versions:
+        raise HTTPException(status_code=404, detail="No drafts for this question")
+    return {"versions": versions}
     
+VIEWS = ("full", "summary")
+
+
+def _paging(view: str, fields: Optional[str], cursor: Optional[str], limit: Optional[int]) -> tuple:
+    """Validated (summary, fields, after, limit) from listing query parameters."""
+    if view not in VIEWS:
+        raise HTTPException(status_code=400, detail=f"view must be one of {', '.join(VIEWS)}")
+    if limit is not None and not 1 <= limit <= config.PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {config.PAGE_MAX_LIMIT}")
+    if cursor is not None and not cursor.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    projection = tuple(field.strip() for field in fields.split(",") if field.strip()) if fields else None
+    return view == "summary", projection, int(cursor) if cursor is not None else None, limit
+
+
+def _records(raw: List[str], fields: Optional[tuple]) -> list:
+    return [payloads.project(record, list(fields)) for record in raw] if fields else raw
+
+
 @api_router.get("/all_grants")
-async def get_all_grants():
+async def get_all_grants(
+    view: str = "full",
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    department: Optional[str] = None,
+    county: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    accept_encoding: Optional[str] = Header(None),
+):
     """
-    Retrieve all grants from the in-memory database.
+    Retrieve grants from the database, oldest first.
+
+    view=summary leaves out the questions and adds a question_count;
+    fields=id,name,... keeps only those fields. status, department and county
+    filter the list. With limit, one page is returned with a next_cursor to
+    pass as cursor for the following page (null on the last one).
     """
+    summary, projection, after, limit = _paging(view, fields, cursor, limit)
+
+    def build() -> bytes:
+        raw, next_cursor = grant_page(summary, status, department, county, after, limit)
+        extra = {"next_cursor": str(next_cursor) if next_cursor is not None else None} if limit is not None else {}
+        return payloads.envelope("grants", _records(raw, projection), **extra)
+
     try:
-        from app.database import grants_database
-        return {"grants": grants_database}
+        key = ("all_grants", summary, projection, status, department, county, after, limit)
+        return await payloads.cached_json(key, lambda: revision("grants"), build, accept_encoding)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/grants/{grant_id}")
-async def get_grant(grant_id: str):
+async def get_grant(
+    grant_id: str,
+    view: str = "full",
+    fields: Optional[str] = None,
+    accept_encoding: Optional[str] = Header(None),
+):
     """
-    Retrieve a single grant by ID from the in-memory database.
+    Retrieve a single grant by ID from the database, with the same view and
+    fields options as /all_grants.
     """
+    summary, projection, _, _ = _paging(view, fields, None, None)
+
+    def build() -> Optional[bytes]:
+        raw = load_grant_json(grant_id, summary)
+        if raw is None:
+            return None
+        record = payloads.project(raw, list(projection)) if projection else raw.encode("utf-8")
+        return b'{"grant":' + record + b"}"
+
     try:
-        from app.database import grants_database
-        grant = next((item for item in grants_database if item["id"] == grant_id), None)
-        if not grant:
-            raise HTTPException(status_code=404, detail="Grant not found")
-        return {"grant": grant}
-    except HTTPException:
-        raise
+        key = ("grant", grant_id, summary, projection)
+        response = await payloads.cached_json(key, lambda: revision("grants"), build, accept_encoding)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if response is None:
+        raise HTTPException(status_code=404, detail="Grant not found")
+    return response
 
 @api_router.get("/all_files")
-async def get_all_files():
+async def get_all_files(
+    grant_id: Optional[str] = None,
+    doc_role: Optional[str] = None,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    accept_encoding: Optional[str] = Header(None),
+):
     """
-    Retrieve all uploaded files' metadata from the in-memory database.
+    Retrieve uploaded files' metadata from the database, oldest first,
+    optionally for one grant and/or document role, with the same fields,
+    cursor and limit options as /all_grants.
     """
+    _, projection, after, limit = _paging("full", fields, cursor, limit)
+
+    def build() -> bytes:
+        raw, next_cursor = file_page(grant_id, doc_role, after, limit)
+        extra = {"next_cursor": str(next_cursor) if next_cursor is not None else None} if limit is not None else {}
+        return payloads.envelope("files", _records(raw, projection), **extra)
+
     try:
-        from app.database import files_database
-        return {"files": files_database}
+        key = ("all_files", grant_id, doc_role, projection, after, limit)
+        return await payloads.cached_json(key, lambda: revision("files"), build, accept_encoding)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.api_route("/files/{file_id}/content", methods=["GET", "HEAD"])
+async def get_file_content(file_id: str, request: Request):
+    """
+    The stored bytes of an uploaded file, for previewing documents.
+
+    Supports Range requests (so PDF viewers can load pages incrementally),
+    a strong ETag of the content's sha256 with If-None-Match/If-Range, and
+    long-lived caching of content-addressed uploads.
+    """
+    file_metadata = await asyncio.to_thread(load_file, file_id)
+    if not file_metadata or not file_metadata.get("stored_name"):
+        raise HTTPException(status_code=404, detail="File not found")
+    path = get_upload_path(file_metadata["stored_name"])
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="File content not found")
+    sha256 = file_metadata.get("sha256") or await asyncio.to_thread(downloads.digests.digest, path)
+    return downloads.document_response(file_metadata, path, sha256, request)
@@ -1,60 +1,319 @@
 import os
+import sys
 import json
+import time
+import uuid
+import asyncio
 import pathlib
-from typing import List
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import httpx
 from google import genai
-from dotenv import load_dotenv
+from google.genai import types
 from pydantic import BaseModel, Field
-from typing import List
-import sys
-import os
-from app.database import load_file_metadata
+
 # Add the parent directory to sys.path for direct execution
 if __name__ == "__main__":
     sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from google.genai import types
-import httpx
+from app import config, metrics, profiling
+from app.scripts.cache import ResultCache, make_key, sha256_hex
+from app.scripts.documents import DocumentRegistry
+from app.scripts.gateway import Hedger, ModelGateway, ModelUnavailable
+from app.scripts.retrieval import RetrievalIndex
+from app.scripts.question_index import QuestionIndex, QuestionMatch
+from app.scripts.pdf_shards import page_count, page_windows, split_pdf, merge_shard_questions
+from app.scripts.pdf_text import DocumentText, DocumentTextStore, PDF_TOKENS_PER_PAGE
+from app.scripts.context_planner import ContextCandidate, ContextPlan, TokenCounter, estimate_tokens, pack_context
+from app.database import add_draft, find_draft, find_files, load_drafts, load_file_metadata, load_grant, load_grants, revision, set_drafts_stale
+
+MODEL = config.GEMINI_MODEL
+# Model used by each task
+BREAKDOWN_MODEL = config.BREAKDOWN_MODEL
+EXTRACTION_MODEL = config.EXTRACTION_MODEL
+RESPONSE_MODEL = config.RESPONSE_MODEL
+
+# The task each operation label belongs to, for its deadline and hedging
+OPERATION_TASKS = {
+    "breakdown": "breakdown",
+    "batch_breakdown": "breakdown",
+    "extraction": "extraction",
+    "combined_extraction": "extraction",
+    "response": "response",
+    "generate": "response",
+}
+TASK_DEADLINES = {
+    "breakdown": config.BREAKDOWN_DEADLINE_SECONDS,
+    "extraction": config.EXTRACTION_DEADLINE_SECONDS,
+    "response": config.RESPONSE_DEADLINE_SECONDS,
+}
+
+_client = None
+_client_lock = threading.Lock()
 
 def get_api_key():
-    """Helper to get and validate API key"""
-    # 1. Try to locate .env file
-    current_dir = pathlib.Path(__file__).parent.absolute()
-    # Check backend/app/.env
-    env_path_app = current_dir.parent / '.env'
-    # Check backend/.env
-    env_path_root = current_dir.parent.parent / '.env'
-
-    if env_path_app.exists():
-        load_dotenv(env_path_app)
-    elif env_path_root.exists():
-        load_dotenv(env_path_root)
-    else:
-        load_dotenv()
-
-    api_key = os.getenv("GEMINI_API_KEY")
-    return api_key
+    """Helper to get the API key loaded by app.config"""
+    return config.GEMINI_API_KEY
 
-class SubQuestions(BaseModel):
-    subquestions: List[str] = Field(description="List of sub-questions derived from the main question.")
-
-def break_down_question(question: str) -> List[str]:
+def _gemini_client() -> genai.Client:
+    api_key = get_api_key()
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found.")
+    limits = httpx.Limits(
+        max_connections=config.GEMINI_MAX_CONNECTIONS,
+        max_keepalive_connections=config.GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.GEMINI_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            timeout=int(config.GEMINI_TIMEOUT_SECONDS * 1000),
+            client_args={"limits": limits},
+            async_client_args={"limits": limits},
+        ),
+    )
+
+def _fake_client():
+    from app.scripts.fake_backend import FakeClient
+    return FakeClient(
+        latency_seconds=config.FAKE_MODEL_LATENCY_SECONDS,
+        jitter_seconds=config.FAKE_MODEL_JITTER_SECONDS,
+        error_rate=config.FAKE_MODEL_ERROR_RATE,
+        seed=config.FAKE_MODEL_SEED,
+    )
+
+# Model backends by MODEL_BACKEND name. A backend builds an object with the
+# genai.Client surface used here: models, files, aio.models, aio.files.
+_backends: Dict[str, Callable[[], Any]] = {
+    "gemini": _gemini_client,
+    "fake": _fake_client,
+}
+
+def register_backend(name: str, factory: Callable[[], Any]) -> None:
+    """Make a client factory selectable with MODEL_BACKEND=<name>."""
+    _backends[name] = factory
+
+def backend_configured() -> bool:
+    """Whether model calls can be made: the Gemini API key is set, or another backend is selected."""
+    if config.MODEL_BACKEND == "gemini":
+        return bool(get_api_key())
+    return config.MODEL_BACKEND in _backends
+
+def get_client() -> genai.Client:
     """
-    Analyzes a given question using an LLM and breaks it down into sub-questions.
+    Return the process-wide model client, building it on first use with the
+    MODEL_BACKEND factory.
 
-    Args:
-        question: The main question to be broken down.
+    The Gemini client keeps one pooled, keep-alive HTTP connection pool for
+    sync calls and one for client.aio calls, so repeated requests reuse open
+    connections.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                factory = _backends.get(config.MODEL_BACKEND)
+                if factory is None:
+                    raise ValueError(f"Unknown MODEL_BACKEND {config.MODEL_BACKEND!r}.")
+                _client = factory()
+    return _client
+
+async def close_client() -> None:
+    """Close the shared client's connection pools, if it was ever built."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.aio.aclose()
+        client.close()
+
+# Rate limiting, retries, circuit breaking and coalescing for every model call
+model_gateway = ModelGateway(
+    rate_per_second=config.MODEL_RATE_LIMIT_PER_MINUTE / 60,
+    burst=config.MODEL_RATE_LIMIT_BURST,
+    attempts=config.MODEL_RETRY_ATTEMPTS,
+    backoff_seconds=config.MODEL_RETRY_BACKOFF_SECONDS,
+    max_backoff_seconds=config.MODEL_RETRY_MAX_BACKOFF_SECONDS,
+    failure_threshold=config.MODEL_CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=config.MODEL_CIRCUIT_RESET_SECONDS,
+    on_retry=lambda operation: metrics.retries.inc(operation=f"llm_{operation}"),
+)
+
+def _jsonable(value):
+    if isinstance(value, bytes):
+        return sha256_hex(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    return repr(value)
+
+def _request_key(operation: str, request: dict) -> Optional[str]:
+    """Identity of a generate_content request, for merging identical calls in flight."""
+    if not config.MODEL_COALESCE_REQUESTS:
+        return None
+    fingerprint = json.dumps(request, sort_keys=True, default=_jsonable)
+    return make_key(request.get("model", MODEL), operation, sha256_hex(fingerprint))
+
+async def _count_call_async(model: str, operation: str, call: Callable[[], Awaitable]):
+    metrics.llm_in_flight.inc(model=model)
+    outcome = "error"
+    try:
+        with profiling.span(f"llm.{operation}"):
+            response = await call()
+        outcome = "ok"
+        metrics.record_usage(model, operation, getattr(response, "usage_metadata", None))
+        return response
+    finally:
+        metrics.llm_in_flight.dec(model=model)
+        metrics.llm_requests.inc(model=model, operation=operation, outcome=outcome)
+
+# Latency history and counts for hedged requests, per model and operation
+hedger = Hedger(
+    percentile=config.HEDGE_PERCENTILE,
+    min_samples=config.HEDGE_MIN_SAMPLES,
+    min_delay_seconds=config.HEDGE_MIN_DELAY_SECONDS,
+)
+
+def schema_validator(schema: type) -> Callable:
+    """Accept a response only if its text validates against a pydantic model."""
+    def validate(response) -> bool:
+        try:
+            schema.model_validate_json(response.text)
+            return True
+        except Exception:
+            return False
+    return validate
+
+def _has_text(response) -> bool:
+    try:
+        return bool(response.text)
+    except Exception:
+        return False
 
-    Returns:
-        A list of sub-question strings.
+async def generate_content_async(client: genai.Client, operation: str, validate: Callable = None, **request):
     """
-    api_key = get_api_key()
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found.")
+    client.aio.models.generate_content through model_gateway: identical calls
+    in flight are merged, attempts are rate limited and retried, and each one
+    is counted in the LLM metrics (calls in flight, outcome per model and
+    operation, and token usage). Raises ModelUnavailable when the model
+    cannot be reached.
+
+    Each attempt must answer within its task's deadline (TASK_DEADLINES), and
+    for tasks in HEDGE_TASKS a slow attempt is hedged with a duplicate; the
+    first response passing `validate` (by default, any non-empty text) wins.
+    """
+    model = request.get("model", MODEL)
+    task = OPERATION_TASKS.get(operation, operation)
+
+    def attempt():
+        return hedger.run(
+            (model, operation),
+            lambda: _count_call_async(model, operation, lambda: client.aio.models.generate_content(**request)),
+            validate=validate or _has_text,
+            hedge=task in config.HEDGE_TASKS,
+            admit=model_gateway.admit_hedge,
+            deadline_seconds=TASK_DEADLINES.get(task) or None,
+        )
+
+    return await model_gateway.call_async(_request_key(operation, request), operation, attempt)
+
+def _gateway_metrics():
+    report = model_gateway.report()
+    return [
+        ("llm_coalesced_requests_total", "counter", "Model calls served by an identical call already in flight.",
+         [({}, report["coalesced"])]),
+        ("llm_rate_limited_total", "counter", "Model calls answered with 429.", [({}, report["rate_limited"])]),
+        ("llm_rejected_total", "counter", "Model calls failed fast by the open circuit breaker.", [({}, report["rejected"])]),
+        ("llm_throttle_seconds_total", "counter", "Time model calls waited for the rate limiter.",
+         [({}, report["throttle_seconds"])]),
+        ("llm_rate_limit_per_second", "gauge", "Current adaptive rate limit.", [({}, report["rate_per_second"] or 0)]),
+        ("llm_circuit_open", "gauge", "1 while the model circuit breaker is open or half open.",
+         [({}, int(report["circuit"] != "closed"))]),
+    ]
+
+metrics.registry.register_collector(_gateway_metrics)
+
+def _hedge_metrics():
+    report = hedger.report()
+    def samples(field):
+        return [({"model": model, "operation": operation}, stats[field]) for (model, operation), stats in report.items()]
+    return [
+        ("llm_hedges_sent_total", "counter", "Duplicate requests sent for slow model calls.", samples("sent")),
+        ("llm_hedges_won_total", "counter", "Hedged calls answered first by the duplicate.", samples("won")),
+        ("llm_hedge_overhead_input_tokens_total", "counter",
+         "Estimated prompt tokens billed for duplicate requests.", samples("overhead_input_tokens")),
+    ]
+
+metrics.registry.register_collector(_hedge_metrics)
+
+# Shared cache for breakdown and extraction results, keyed on model, prompt
+# version and a hash of the input
+llm_cache = ResultCache(
+    max_entries=config.LLM_CACHE_MAX_ENTRIES,
+    ttl_seconds=config.LLM_CACHE_TTL_SECONDS,
+    disk_dir=config.LLM_CACHE_DIR,
+)
+
+# Files API handles for context documents, so each file is uploaded once
+document_registry = DocumentRegistry(
+    get_client,
+    expiry_margin_seconds=config.CONTEXT_FILE_EXPIRY_MARGIN_SECONDS,
+)
+
+# Chunked BM25 index over uploaded documents, partitioned by grant
+retrieval_index = RetrievalIndex(
+    chunk_words=config.RETRIEVAL_CHUNK_WORDS,
+    overlap_words=config.RETRIEVAL_CHUNK_OVERLAP_WORDS,
+)
+
+# Every stored grant question, for reusing breakdowns and answers across grants
+question_index = QuestionIndex()
+
+# Extracted page text of uploaded PDFs, so prompts carry text instead of PDF bytes
+document_texts = DocumentTextStore(
+    config.DOCUMENT_TEXT_DIR,
+    min_chars_per_page=config.PDF_TEXT_MIN_CHARS_PER_PAGE,
+)
+
+def _count_tokens_api(text: str) -> int:
+    return get_client().models.count_tokens(model=RESPONSE_MODEL, contents=text).total_tokens
+
+# Token counts of context parts by content hash, from the model's count_tokens
+# endpoint or a local estimate
+token_counter = TokenCounter(count_text=_count_tokens_api if config.CONTEXT_COUNT_TOKENS_API else None)
+
+def _cache_metrics():
+    """Scrape-time metrics from the counts the caches above already keep."""
+    cache = llm_cache.stats()
+    texts = document_texts.stats()
+    tokens = token_counter.stats()
+    uploads = document_registry.stats()
+    questions = question_index.stats()
+    return [
+        ("llm_cache_hits_total", "counter", "LLM result cache hits, by tier.",
+         [({"tier": "memory"}, cache["hits"]), ({"tier": "disk"}, cache["disk_hits"])]),
+        ("llm_cache_misses_total", "counter", "LLM result cache misses.", [({}, cache["misses"])]),
+        ("llm_cache_entries", "gauge", "Entries in the in-memory LLM result cache.", [({}, cache["entries"])]),
+        ("document_text_extractions_total", "counter", "PDFs whose page text was extracted.", [({}, texts["extractions"])]),
+        ("document_text_hits_total", "counter", "Extracted PDF text served from the store.", [({}, texts["hits"])]),
+        ("token_count_cache_hits_total", "counter", "Context token counts served from the cache.", [({}, tokens["hits"])]),
+        ("token_count_cache_misses_total", "counter", "Context token counts computed.", [({}, tokens["misses"])]),
+        ("context_file_uploads_total", "counter", "Context files uploaded through the Files API.", [({}, uploads["uploads"])]),
+        ("context_file_reuses_total", "counter", "Drafts that reused an uploaded context file.", [({}, uploads["reuses"])]),
+        ("context_file_deletes_total", "counter", "Replaced or failed context file uploads deleted from the Files API.", [({}, uploads["deletes"])]),
+        ("question_index_questions", "gauge", "Questions in the cross-grant question index.", [({}, questions["questions"])]),
+    ]
+
+metrics.registry.register_collector(_cache_metrics)
+
+def prompt_version(*parts) -> str:
+    """Short fingerprint of a prompt template and schema; changes whenever either does."""
+    return sha256_hex("\x00".join(str(part) for part in parts))[:16]
 
-    client = genai.Client()
+class SubQuestions(BaseModel):
+    subquestions: List[str] = Field(description="List of sub-questions derived from the main question.")
 
-    prompt = f"""
+BREAKDOWN_PROMPT = """
 You are an AI assistant that analyzes a single narrative question from a government grant application and breaks it into the key sub-questions, components, or sections that an applicant must address in order to fully answer the original question.
 
 Your Task:
@@ -114,60 +373,318 @@ Final Requirement:
 Your output must be only the JSON object.
 
 Here is the question: {question}
+"""
+
+BREAKDOWN_PROMPT_VERSION = prompt_version(BREAKDOWN_PROMPT, SubQuestions.model_json_schema())
+
+def _breakdown_cache_key(question: str) -> str:
+    return make_key(BREAKDOWN_MODEL, BREAKDOWN_PROMPT_VERSION, sha256_hex(question))
+
+
+class RevisionSync:
+    """
+    Runs `sync` again whenever a table's revision (database.revision) has
+    moved since it last ran. The retrieval and question indexes live in each
+    worker process and uploads are indexed by the worker that handles them;
+    syncing before a search picks up what other workers wrote. The revision
+    is read before syncing, so a write made meanwhile triggers another sync.
+    """
+
+    def __init__(self, table: str, sync: Callable[[], None]):
+        self.table = table
+        self.sync = sync
+        self._seen: Optional[int] = None
+        self._lock = threading.Lock()
+        self.syncs = 0
+
+    def __call__(self) -> None:
+        if revision(self.table) == self._seen:
+            return
+        with self._lock:
+            current = revision(self.table)
+            if current == self._seen:
+                return
+            self.sync()
+            self._seen = current
+            self.syncs += 1
+
+
+def index_grant_questions(grant: Optional[dict]) -> None:
+    """Bring a grant's questions and sub-questions up to date in the question index."""
+    if grant:
+        question_index.set_grant(grant["id"], grant.get("questions") or [])
+
+
+def index_existing_questions() -> None:
+    """Add every stored grant's questions to the question index."""
+    for grant in load_grants():
+        index_grant_questions(grant)
+
+
+# Brings the question index up to date with grants stored by any worker
+sync_question_index = RevisionSync("grants", index_existing_questions)
+
+
+def search_questions(question: str, k: int = 5, min_score: float = 0.0) -> List[QuestionMatch]:
+    """
+    Stored questions most similar to `question`, after bringing the question
+    index up to date. Both steps block, so code on the event loop runs this
+    in a thread.
     """
+    sync_question_index()
+    return question_index.search(question, k=k, min_score=min_score)
+
 
+def similar_breakdown(question: str) -> Optional[List[str]]:
+    """
+    Sub-questions of the most similar question already broken down, if it is
+    at least QUESTION_REUSE_THRESHOLD similar, so near-identical questions of
+    another grant program need no model call.
+    """
+    for match in search_questions(question, min_score=config.QUESTION_REUSE_THRESHOLD):
+        if match.sub_questions:
+            metrics.question_reuses.inc(kind="breakdown")
+            return match.sub_questions
+    return None
+
+
+def _breakdown_request(question: str) -> dict:
+    """Build the generate_content arguments for a question breakdown."""
+    return {
+        "model": BREAKDOWN_MODEL,
+        "contents": [BREAKDOWN_PROMPT.format(question=question)],
+        "config": {
+            "response_mime_type": "application/json",
+            "response_schema": SubQuestions.model_json_schema()
+        },
+    }
+
+
+def _parse_breakdown(response) -> List[str]:
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[prompt],
-            config={
-                "response_mime_type": "application/json",
-                "response_mime_type": "application/json",
-                "response_schema": SubQuestions.model_json_schema()
-            }
-        )
         sub_questions_obj = SubQuestions.model_validate_json(response.text)
         return sub_questions_obj.subquestions
-    except httpx.HTTPStatusError as e:
-        print(f"HTTP error during LLM call: {e}")
-        return []
     except json.JSONDecodeError:
         print(f"Failed to decode JSON from LLM response: {response.text}")
         return []
+
+
+def break_down_question(question: str) -> List[str]:
+    """
+    Blocking wrapper around break_down_question_async, for scripts run
+    outside an event loop. Code on the event loop awaits the async function.
+    """
+    return asyncio.run(break_down_question_async(question))
+
+
+@metrics.timed("break_down_question_async")
+async def break_down_question_async(question: str) -> List[str]:
+    """
+    Analyzes a given question using an LLM and breaks it down into sub-questions.
+
+    Args:
+        question: The main question to be broken down.
+
+    Returns:
+        A list of sub-question strings.
+    """
+    cache_key = _breakdown_cache_key(question)
+    cached = llm_cache.get(cache_key)
+    if cached is None:
+        cached = await asyncio.to_thread(similar_breakdown, question)
+    if cached is not None:
+        return cached
+
+    client = get_client()
+
+    try:
+        response = await generate_content_async(client, "breakdown", validate=schema_validator(SubQuestions), **_breakdown_request(question))
+        sub_questions = _parse_breakdown(response)
+        if sub_questions:
+            llm_cache.set(cache_key, sub_questions)
+        return sub_questions
+    except ModelUnavailable:
+        raise
+    except httpx.HTTPStatusError as e:
+        print(f"HTTP error during LLM call: {e}")
+        return []
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
         return []
 
 
-def extract_narrative_questions(grant_id: str) -> List[str]:
+BREAKDOWN_GUIDELINES = """
+- Identify all conceptual parts embedded in the question (e.g., need, goals, activities, outcomes, partners, timeline, population served, evidence, evaluation, sustainability).
+- Make implicit expectations explicit—if the question implies justification, significance, or evidence, include them.
+- Do not rewrite the original question; only deconstruct it.
+- Do not answer the question.
+- Sub-questions should be concise but clear enough that an applicant could respond directly.
+- Aim for 3-5 sub-questions, depending on complexity. Less sub questions is better.
+- Make each sub-question focused on a single aspect.
+- Each sub-question should be distinct and non-overlapping.
+"""
+
+class BatchItem(BaseModel):
+    index: int = Field(description="Number of the question in the input list.")
+    subquestions: List[str] = Field(description="List of sub-questions derived from that question.")
+
+class BatchSubQuestions(BaseModel):
+    items: List[BatchItem]
+
+BATCH_BREAKDOWN_PROMPT = """
+You are an AI assistant that analyzes narrative questions from a government grant application and breaks each one into the key sub-questions, components, or sections that an applicant must address in order to fully answer it.
+
+Your Task:
+
+You will be given a numbered list of questions. Break down each question independently into a small set of clear, actionable sub-questions.
+
+Guidelines:
+""" + BREAKDOWN_GUIDELINES + """
+Output Format:
+
+Output a JSON object with one item per input question, using the question's number as its index:
+
+{{
+  "items": [
+    {{"index": 0, "subquestions": ["string", "string"]}}
+  ]
+}}
+
+Your output must be only the JSON object.
+
+Here are the questions:
+{numbered_questions}
+"""
+
+BATCH_BREAKDOWN_PROMPT_VERSION = prompt_version(BATCH_BREAKDOWN_PROMPT, BatchSubQuestions.model_json_schema())
+
+
+def _batch_breakdown_request(questions: List[str]) -> dict:
+    numbered_questions = "\n".join(f"{i}. {question}" for i, question in enumerate(questions))
+    return {
+        "model": BREAKDOWN_MODEL,
+        "contents": [BATCH_BREAKDOWN_PROMPT.format(numbered_questions=numbered_questions)],
+        "config": {
+            "response_mime_type": "application/json",
+            "response_schema": BatchSubQuestions.model_json_schema()
+        },
+    }
+
+
+def _parse_batch_breakdown(response, count: int) -> List[List[str]]:
+    """Sub-questions per input position; positions the model skipped come back empty."""
+    results = [[] for _ in range(count)]
+    try:
+        for item in BatchSubQuestions.model_validate_json(response.text).items:
+            if 0 <= item.index < count:
+                results[item.index] = item.subquestions
+    except Exception as e:
+        print(f"Failed to validate batch breakdown response: {e}")
+    return results
+
+
+def _cached_breakdowns(questions: List[str]) -> List[Optional[List[str]]]:
     """
-    Extracts narrative questions from the provided text using Gemini API.
-    Returns a list of question strings.
+    Cached sub-questions for each question from a single or batched
+    breakdown, or those of a near-identical question, else None.
     """
-    api_key = get_api_key()
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found.")
-    
-    # Use gemini-2.0-flash as verified earlier
-    client = genai.Client()
-
-    class NarrativeQuestions(BaseModel):
-        questions: List[str] = Field(description="List of narrative questions extracted from the text.")
-    
-    # Load metadata and find grant document
-    metadata = load_file_metadata()
-    grant_doc = next((doc for doc in metadata if doc.get("doc_role") == "grant" and doc.get("grant_id") == grant_id), None)
-    if not grant_doc:
-        raise ValueError("No document with doc_role 'grant' found in metadata.")
-    file_name = grant_doc.get("stored_name", "")
-    file_path = pathlib.Path(__file__).parent.parent / "uploads" / file_name
-    
+    results = []
+    for question in questions:
+        cached = llm_cache.get(_breakdown_cache_key(question))
+        if cached is None:
+            cached = llm_cache.get(make_key(BREAKDOWN_MODEL, BATCH_BREAKDOWN_PROMPT_VERSION, sha256_hex(question)))
+        if cached is None:
+            cached = similar_breakdown(question)
+        results.append(cached)
+    return results
 
-    # Upload the grant document file to Gemini
-    if not file_path.exists():
-        raise ValueError(f"Grant document not found at {file_path}")
 
-    prompt = """
+def _store_batch_breakdown(question: str, sub_questions: List[str]) -> None:
+    if sub_questions:
+        llm_cache.set(make_key(BREAKDOWN_MODEL, BATCH_BREAKDOWN_PROMPT_VERSION, sha256_hex(question)), sub_questions)
+
+
+def _batches(indexes: List[int], batch_size: int) -> List[List[int]]:
+    return [indexes[i:i + batch_size] for i in range(0, len(indexes), batch_size)]
+
+
+@metrics.timed("break_down_questions_async")
+async def break_down_questions_async(questions: List[str], batch_size: int = None, concurrency: int = None) -> List[List[str]]:
+    """
+    Breaks down many questions with one model call per `batch_size` questions.
+    Batches run concurrently, at most `concurrency` at a time.
+
+    Questions the batched response leaves without sub-questions are retried
+    one at a time with break_down_question_async.
+
+    Args:
+        questions: The main questions to be broken down.
+        batch_size: Questions per call. Defaults to config.BREAKDOWN_BATCH_SIZE.
+        concurrency: Batches in flight. Defaults to config.BREAKDOWN_CONCURRENCY.
+
+    Returns:
+        A list of sub-question lists, in the same order as `questions`.
+    """
+    batch_size = max(1, batch_size or config.BREAKDOWN_BATCH_SIZE)
+    semaphore = asyncio.Semaphore(max(1, concurrency or config.BREAKDOWN_CONCURRENCY))
+    results = await asyncio.to_thread(_cached_breakdowns, questions)
+    pending = [i for i, result in enumerate(results) if result is None]
+
+    async def run_batch(batch: List[int]) -> None:
+        batch_questions = [questions[i] for i in batch]
+        async with semaphore:
+            try:
+                client = get_client()
+                response = await generate_content_async(
+                    client,
+                    "batch_breakdown",
+                    validate=schema_validator(BatchSubQuestions),
+                    **_batch_breakdown_request(batch_questions),
+                )
+                batch_results = _parse_batch_breakdown(response, len(batch))
+            except ModelUnavailable:
+                raise
+            except Exception as e:
+                print(f"Error in batched breakdown: {e}")
+                batch_results = [[] for _ in batch]
+        for i, sub_questions in zip(batch, batch_results):
+            _store_batch_breakdown(questions[i], sub_questions)
+            results[i] = sub_questions or None
+
+    async def run_single(i: int) -> None:
+        async with semaphore:
+            results[i] = await break_down_question_async(questions[i])
+
+    if batch_size > 1:
+        await asyncio.gather(*(run_batch(batch) for batch in _batches(pending, batch_size)))
+    # Per-question fallback for anything the batches did not cover
+    await asyncio.gather(*(run_single(i) for i, result in enumerate(results) if result is None))
+    return results
+
+
+@metrics.timed("break_down_questions_concurrently")
+async def break_down_questions_concurrently(questions: List[str], concurrency: int = None) -> List[dict]:
+    """
+    Breaks down several questions in parallel, at most `concurrency` calls at a time.
+
+    Args:
+        questions: The main questions to be broken down.
+        concurrency: Maximum number of calls in flight. Defaults to config.BREAKDOWN_CONCURRENCY.
+
+    Returns:
+        A list of {"question", "sub_questions"} dicts in the same order as `questions`.
+    """
+    results = await break_down_questions_async(questions, concurrency=concurrency)
+    return [
+        {"question": question, "sub_questions": sub_questions}
+        for question, sub_questions in zip(questions, results)
+    ]
+
+
+class NarrativeQuestions(BaseModel):
+    questions: List[str] = Field(description="List of narrative questions extracted from the text.")
+
+EXTRACTION_PROMPT = """
 You are an AI assistant that extracts only the narrative questions from a government grant application.
 Narrative questions are prompts that require the applicant to write multi-sentence or paragraph-length responses in their own words. These typically ask for descriptions, explanations, plans, justifications, needs assessments, project narratives, community impact statements, etc.
 
@@ -208,69 +725,280 @@ Instructions:
 - Do not rewrite, summarize, or merge questions.
 - Only output narrative questions that require written narrative responses.
 - If no narrative questions exist, return an empty list [].
+"""
+
+def _grant_document_path(grant_id: str) -> pathlib.Path:
+    """Locate the stored grant document for a grant."""
+    grant_docs = find_files(grant_id=grant_id, doc_role="grant")
+    grant_doc = grant_docs[0] if grant_docs else None
+    if not grant_doc:
+        raise ValueError("No document with doc_role 'grant' found in metadata.")
+    file_name = grant_doc.get("stored_name", "")
+    file_path = config.UPLOADS_DIR / file_name
+
+    if not file_path.exists():
+        raise ValueError(f"Grant document not found at {file_path}")
+    return file_path
+
+
+EXTRACTION_PROMPT_VERSION = prompt_version(EXTRACTION_PROMPT, NarrativeQuestions.model_json_schema())
+
+def _extraction_cache_key(content) -> str:
+    return make_key(EXTRACTION_MODEL, EXTRACTION_PROMPT_VERSION, sha256_hex(content))
+
+
+def _document_text(file_bytes: bytes) -> Optional[DocumentText]:
     """
-    
+    Preprocessed text of a PDF, or None when the PDF itself is sent: it is
+    scanned or unreadable, or its text would cost more tokens than its pages.
+    """
+    if not config.PDF_TEXT_ENABLED:
+        return None
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[
-                types.Part.from_bytes(
-                    data=file_path.read_bytes(),
-                    mime_type='application/pdf',
-                ),
-                prompt
-            ],
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": NarrativeQuestions.model_json_schema()
-            }
-        )
-        questions = NarrativeQuestions.model_validate_json(response.text)
-        return questions.questions
-            
+        document = document_texts.get(file_bytes)
+    except Exception as e:
+        print(f"Warning: could not extract document text, sending the PDF: {e}")
+        return None
+    return document if document.use_text else None
+
+
+def _document_content(file_bytes: bytes):
+    """A grant document as prompt content: its page text where it has any, else the PDF bytes."""
+    document = _document_text(file_bytes)
+    return document.text() if document is not None else file_bytes
+
+
+def _document_part(content):
+    if isinstance(content, str):
+        return content
+    return types.Part.from_bytes(data=content, mime_type='application/pdf')
+
+
+def _extraction_request(content) -> dict:
+    """Build the generate_content arguments for question extraction from page text or PDF bytes."""
+    return {
+        "model": EXTRACTION_MODEL,
+        "contents": [
+            _document_part(content),
+            EXTRACTION_PROMPT
+        ],
+        "config": {
+            "response_mime_type": "application/json",
+            "response_schema": NarrativeQuestions.model_json_schema()
+        },
+    }
+
+
+def _extraction_inputs(file_bytes: bytes) -> List[tuple]:
+    """
+    (start_page, end_page, content) for each extraction call on a document.
+    Content is page text unless the PDF is sent as it is (see
+    _document_text); documents longer than EXTRACTION_SHARD_PAGES are split
+    into overlapping page windows.
+    """
+    window, overlap = config.EXTRACTION_SHARD_PAGES, config.EXTRACTION_SHARD_OVERLAP_PAGES
+    document = _document_text(file_bytes)
+    if document is not None:
+        return [(start, end, document.text(start, end)) for start, end in page_windows(len(document.pages), window, overlap)]
+    try:
+        total = page_count(file_bytes)
+    except Exception:
+        total = 0
+    if total <= window:
+        return [(0, total, file_bytes)]
+    return [(shard.start_page, shard.end_page, shard.data) for shard in split_pdf(file_bytes, window, overlap)]
+
+
+async def _extract_from_content_async(content) -> List[str]:
+    """One extraction call for a whole document or a single shard. Raises on failure."""
+    cache_key = _extraction_cache_key(content)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    client = get_client()
+    response = await generate_content_async(
+        client, "extraction", validate=schema_validator(NarrativeQuestions), **_extraction_request(content)
+    )
+    questions = NarrativeQuestions.model_validate_json(response.text).questions
+    if questions:
+        llm_cache.set(cache_key, questions)
+    return questions
+
+
+class PartialExtraction(RuntimeError):
+    """
+    Some page windows of a sharded extraction still failed after their
+    retries. `questions` holds what the other windows returned and
+    `failed_pages` the (first, last) page numbers, 1-based, that are missing.
+    Windows that succeeded are cached, so extracting again only re-sends the
+    failed ones.
+    """
+
+    def __init__(self, questions: List[str], failed_pages: List[tuple]):
+        pages = ", ".join(f"{first}-{last}" for first, last in failed_pages)
+        super().__init__(f"questions could not be extracted from pages {pages}")
+        self.questions = questions
+        self.failed_pages = failed_pages
+
+
+async def _extract_sharded_async(inputs: List[tuple]) -> List[str]:
+    """
+    Extract questions from overlapping page windows in parallel and merge them
+    in page order. Each shard is retried on its own; if one still fails,
+    PartialExtraction is raised with the other shards' questions.
+    """
+    semaphore = asyncio.Semaphore(max(1, config.EXTRACTION_SHARD_CONCURRENCY))
+    attempts = max(1, config.EXTRACTION_SHARD_ATTEMPTS)
+
+    async def extract_shard(start_page: int, end_page: int, content) -> List[str]:
+        for attempt in range(1, attempts + 1):
+            try:
+                async with semaphore:
+                    return await _extract_from_content_async(content)
+            except ModelUnavailable:
+                raise
+            except Exception as e:
+                print(f"Error extracting questions from pages {start_page + 1}-{end_page} (attempt {attempt}): {e}")
+                if attempt < attempts:
+                    metrics.retries.inc(operation="extraction_shard")
+                    await asyncio.sleep(config.EXTRACTION_SHARD_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        return None
+
+    results = await asyncio.gather(*(extract_shard(*shard) for shard in inputs))
+    questions = merge_shard_questions([result for result in results if result is not None])
+    failed = [(start + 1, end) for (start, end, _), result in zip(inputs, results) if result is None]
+    if failed:
+        raise PartialExtraction(questions, failed)
+    return questions
+
+
+@metrics.timed("extract_narrative_questions_async")
+async def extract_narrative_questions_async(grant_id: str) -> List[str]:
+    """
+    Extracts narrative questions from a grant's document using Gemini API and
+    returns a list of question strings. The document is read off the event loop.
+    Documents longer than EXTRACTION_SHARD_PAGES are extracted in parallel
+    page windows; if some of them keep failing, PartialExtraction is raised
+    and nothing is cached for the whole document.
+    """
+    file_path = _grant_document_path(grant_id)
+    with profiling.span("read_document"):
+        file_bytes = await asyncio.to_thread(file_path.read_bytes)
+
+    cache_key = _extraction_cache_key(file_bytes)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        with profiling.span("document_text"):
+            inputs = await asyncio.to_thread(_extraction_inputs, file_bytes)
+        if len(inputs) == 1:
+            questions = await _extract_from_content_async(inputs[0][2])
+        else:
+            questions = await _extract_sharded_async(inputs)
+        if questions:
+            llm_cache.set(cache_key, questions)
+        return questions
+
+    except (ModelUnavailable, PartialExtraction):
+        raise
     except Exception as e:
         print(f"Error extracting questions: {e}")
         return []
 
 
-def generate_response(question: str, outline: dict) -> str:
+class GrantQuestion(BaseModel):
+    question: str = Field(description="A narrative question, worded exactly as in the document.")
+    subquestions: List[str] = Field(description="List of sub-questions derived from the question.")
+
+class GrantQuestions(BaseModel):
+    questions: List[GrantQuestion]
+
+COMBINED_PROMPT = EXTRACTION_PROMPT + """
+Breakdown:
+
+For each narrative question you extract, also break it into the key sub-questions an applicant must address to fully answer it:
+""" + BREAKDOWN_GUIDELINES + """
+Output Format (this replaces the format above):
+
+Return a JSON object of the form {"questions": [{"question": "exact question text", "subquestions": ["string", "string"]}]}.
+If no narrative questions exist, return {"questions": []}.
+"""
+
+COMBINED_PROMPT_VERSION = prompt_version(COMBINED_PROMPT, GrantQuestions.model_json_schema())
+
+
+def _combined_request(content) -> dict:
+    """Build the generate_content arguments for extraction plus breakdown in one call."""
+    request = _extraction_request(content)
+    request["contents"][-1] = COMBINED_PROMPT
+    request["config"]["response_schema"] = GrantQuestions.model_json_schema()
+    return request
+
+
+def _parse_combined(response) -> Optional[List[dict]]:
     """
-    Generate a response to a question using uploaded context and an answer outline.
-    
-    Args:
-        question: The question to answer
-        outline: Dict containing sections with 'name' and 'description' keys
-        
+    Validated {"question", "sub_questions"} entries, or None when the output
+    fails the schema or any question came back without sub-questions.
+    """
+    try:
+        parsed = GrantQuestions.model_validate_json(response.text)
+    except Exception as e:
+        print(f"Combined extraction failed validation: {e}")
+        return None
+    if not parsed.questions or any(not item.question.strip() or not item.subquestions for item in parsed.questions):
+        print("Combined extraction returned incomplete questions")
+        return None
+    return [{"question": item.question, "sub_questions": item.subquestions} for item in parsed.questions]
+
+
+@metrics.timed("extract_and_break_down_async")
+async def extract_and_break_down_async(grant_id: str) -> Optional[List[dict]]:
+    """
+    Extract a grant's narrative questions and their sub-questions in a single
+    structured call.
+
     Returns:
-        The generated response string
+        A list of {"question", "sub_questions"} dicts, or None if the response
+        failed validation; callers then fall back to
+        extract_narrative_questions_async plus break_down_questions_async.
     """
-    api_key = get_api_key()
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found.")
-    
-    client = genai.Client()
-    
-    # Load all uploaded files
-    metadata = load_file_metadata()
-    total_prompt_in = []
-    
-    for item in metadata:
-        file_path = pathlib.Path(__file__).parent.parent / "uploads" / item["stored_name"]
-        if file_path.exists():
-            total_prompt_in.append(types.Part.from_bytes(
-                data=file_path.read_bytes(),
-                mime_type=item["content_type"],
-            ))
-        else:
-            print(f"Warning: Uploaded file {file_path} not found.")
-    
-    # Format the outline
-    outline_text = "Answer Outline:\n"
-    if "sections" in outline:
-        for i, section in enumerate(outline["sections"], 1):
-            outline_text += f"{i}. {section['name']}: {section['description']}\n"
-    
-    prompt = f"""
+    file_path = _grant_document_path(grant_id)
+    with profiling.span("read_document"):
+        file_bytes = await asyncio.to_thread(file_path.read_bytes)
+
+    with profiling.span("document_text"):
+        inputs = await asyncio.to_thread(_extraction_inputs, file_bytes)
+    # Long documents go through sharded extraction plus batched breakdown
+    if len(inputs) > 1:
+        return None
+    content = inputs[0][2]
+
+    cache_key = make_key(EXTRACTION_MODEL, COMBINED_PROMPT_VERSION, sha256_hex(content))
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    client = get_client()
+
+    try:
+        response = await generate_content_async(
+            client, "combined_extraction", validate=schema_validator(GrantQuestions), **_combined_request(content)
+        )
+    except ModelUnavailable:
+        raise
+    except Exception as e:
+        print(f"Error in combined extraction: {e}")
+        return None
+    grant_questions = _parse_combined(response)
+    if grant_questions:
+        llm_cache.set(cache_key, grant_questions)
+    return grant_questions
+
+
+RESPONSE_PROMPT = """
 You are an expert grant writer drafting responses on behalf of a local government applicant. You will be given multiple context sources (e.g., grant notice text, local government background, project descriptions, data, compliance requirements, strategic plans).
 
 Your task is to write a single narrative response to one specific question from the grant application.
@@ -309,18 +1037,577 @@ Grant_Question: {question}
 Response_Outline: {outline_text}
 
 """
-    
-    total_prompt_in.append(prompt)
-    
+
+RESPONSE_PROMPT_VERSION = prompt_version(RESPONSE_PROMPT)
+
+def _upload_path(item: dict) -> pathlib.Path:
+    return config.UPLOADS_DIR / item["stored_name"]
+
+
+def _context_files(grant_id: Optional[str] = None) -> list:
+    """(path, mime_type, name) for every uploaded file still on disk, optionally for one grant only."""
+    files = []
+    for item in (find_files(grant_id=grant_id) if grant_id is not None else load_file_metadata()):
+        file_path = _upload_path(item)
+        if file_path.exists():
+            files.append((file_path, item["content_type"], item.get("original_name", item["stored_name"])))
+        else:
+            print(f"Warning: Uploaded file {file_path} not found.")
+    return files
+
+
+def _inline_part(file_path: pathlib.Path, mime_type: str) -> types.Part:
+    return types.Part.from_bytes(data=file_path.read_bytes(), mime_type=mime_type)
+
+
+def _file_text(file_path: pathlib.Path, mime_type: str) -> Optional[str]:
+    """A stored file's text for the prompt; None for binary files and PDFs sent as PDFs (see _document_text)."""
+    mime_type = mime_type or ""
+    if mime_type.startswith("text/"):
+        return file_path.read_text(encoding="utf-8", errors="ignore")
+    if not config.PDF_TEXT_ENABLED or mime_type != "application/pdf":
+        return None
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
+        document = document_texts.get_path(file_path)
+    except Exception as e:
+        print(f"Warning: could not extract text from {file_path}: {e}")
+        return None
+    return document.text() if document.use_text else None
+
+
+def _text_candidate(source: str, text: str, header: str) -> ContextCandidate:
+    key = sha256_hex(text)
+    return ContextCandidate(source=source, key=key, tokens=token_counter.count_part(key, text), text=text, header=header)
+
+
+def _part_tokens(file_path: pathlib.Path, mime_type: str) -> int:
+    """Token estimate for a file sent as a part: one PDF page's worth per page, or per file otherwise."""
+    stat = file_path.stat()
+
+    def compute() -> int:
+        if mime_type == "application/pdf":
+            try:
+                return page_count(file_path.read_bytes()) * PDF_TOKENS_PER_PAGE
+            except Exception:
+                pass
+        return PDF_TOKENS_PER_PAGE
+
+    return token_counter.count(f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}", compute)
+
+
+async def _file_candidates_async(grant_id: Optional[str] = None) -> List[ContextCandidate]:
+    """
+    A context candidate for every uploaded file: its text where it has any,
+    otherwise a Files API handle (or the bytes inline). Files missing a handle
+    are uploaded concurrently.
+    """
+    async def candidate(file_path: pathlib.Path, mime_type: str, source: str) -> ContextCandidate:
+        text = await asyncio.to_thread(_file_text, file_path, mime_type)
+        if text is not None:
+            return await asyncio.to_thread(_text_candidate, source, text, f"[Document: {source}]")
+        part = None
+        if config.CONTEXT_FILES_API:
+            try:
+                part = await document_registry.get_part_async(file_path, mime_type)
+            except Exception as e:
+                print(f"Warning: could not upload {file_path}, sending inline: {e}")
+        if part is None:
+            part = await asyncio.to_thread(_inline_part, file_path, mime_type)
+        tokens = await asyncio.to_thread(_part_tokens, file_path, mime_type)
+        return ContextCandidate(source=source, key=str(file_path), tokens=tokens, part=part)
+
+    with profiling.span("metadata_scan"):
+        files = await asyncio.to_thread(_context_files, grant_id)
+    with profiling.span("file_context"):
+        return list(await asyncio.gather(*(candidate(*file) for file in files)))
+
+
+@metrics.timed("preprocess_document")
+def preprocess_document(file_metadata: dict) -> Optional[dict]:
+    """
+    Extract and store the page text of an uploaded PDF ahead of its first
+    prompt. Returns the document's estimated byte and token savings, or None
+    for other file types and failures.
+    """
+    file_path = _upload_path(file_metadata)
+    if not config.PDF_TEXT_ENABLED or file_metadata.get("content_type") != "application/pdf" or not file_path.exists():
+        return None
+    try:
+        report = document_texts.get_path(file_path).report()
+    except Exception as e:
+        print(f"Warning: could not preprocess {file_path}: {e}")
+        return None
+    metrics.documents_preprocessed.inc(sent_as="scanned" if report["scanned"] else report["sent_as"])
+    if report["tokens_saved_estimate"] > 0:
+        metrics.preprocessing_tokens_saved.inc(report["tokens_saved_estimate"])
+    return report
+
+
+@metrics.timed("index_document")
+def index_document(file_metadata: dict) -> int:
+    """
+    Extract, chunk and add an uploaded file to its grant's retrieval index.
+    Returns the number of chunks added; indexing failures are logged, not raised.
+    """
+    file_path = _upload_path(file_metadata)
+    if not file_path.exists():
+        return 0
+    try:
+        text = None
+        if config.PDF_TEXT_ENABLED and file_metadata.get("content_type") == "application/pdf":
+            text = document_texts.get_path(file_path).text()
+        return retrieval_index.add_document(
+            # Files uploaded without a grant have grant_id None; they share the "" partition
+            grant_id=file_metadata.get("grant_id") or "",
+            # Duplicate uploads share a content hash and are indexed once per grant
+            file_id=file_metadata.get("sha256") or file_metadata["id"],
+            source=file_metadata.get("original_name", file_metadata["stored_name"]),
+            path=file_path,
+            mime_type=file_metadata.get("content_type"),
+            text=text,
+        )
+    except Exception as e:
+        print(f"Warning: could not index {file_path}: {e}")
+        return 0
+
+
+def index_existing_documents() -> None:
+    """Index every file already recorded in the database."""
+    for item in load_file_metadata():
+        index_document(item)
+
+
+# Brings the retrieval index up to date with files stored by any worker
+sync_retrieval_index = RevisionSync("files", index_existing_documents)
+
+
+def _retrieval_queries(grant_id: Optional[str], question: str, outline: dict) -> List[str]:
+    """The question, its stored sub-questions and the outline sections, as search queries."""
+    queries = [question]
+    grant = load_grant(grant_id) if grant_id is not None else None
+    if grant:
+        for item in grant.get("questions", []):
+            if item.get("question") == question:
+                queries.extend(item.get("sub_questions", []))
+    for section in outline.get("sections", []):
+        queries.append(f"{section.get('name', '')} {section.get('description', '')}")
+    return queries
+
+
+RETRIEVAL_HEADER = "Context excerpts from the grant's uploaded documents:"
+
+def _retrieval_candidates(grant_id: str, queries: List[str]) -> List[ContextCandidate]:
+    """Top-k chunks of the grant's documents for these queries."""
+    sync_retrieval_index()
+    chunks = retrieval_index.search(grant_id, queries, config.RETRIEVAL_TOP_K)
+    return [_text_candidate(chunk.source, chunk.text, f"[Source: {chunk.source}]") for chunk in chunks]
+
+
+def _seed_candidates(grant_id: Optional[str], question: str) -> List[ContextCandidate]:
+    """
+    The stored answer to the most similar question of another grant (at
+    least QUESTION_SEED_THRESHOLD similar), as a context candidate to seed the
+    draft. The source names the draft it came from, so the seed is part of
+    the draft's fingerprint.
+    """
+    key = question_key(question)
+    for match in search_questions(question, min_score=config.QUESTION_SEED_THRESHOLD):
+        if match.grant_id == grant_id and question_key(match.question) == key:
+            continue
+        # Only answers drafted from their own grant's documents seed others,
+        # so two grants' drafts cannot keep invalidating each other
+        versions = load_drafts(match.grant_id, question_key(match.question))
+        draft = next((version for version in versions if "" not in version.get("documents", {}).values()), None)
+        if draft is None:
+            continue
+        grant = load_grant(match.grant_id) or {}
+        name = grant.get("name") or f"grant {match.grant_id}"
+        header = (
+            f"[Earlier answer to a similar question in {name}: \"{match.question}\" "
+            "Reuse its structure and facts only where the other context supports them.]"
+        )
+        metrics.question_reuses.inc(kind="draft_seed")
+        return [_text_candidate(f"Earlier answer ({name}, draft {draft['id'][:8]})", draft["response"], header)]
+    return []
+
+
+def _pack(candidates: List[ContextCandidate], queries: List[str], question: str, outline: dict, header: Optional[str] = None) -> ContextPlan:
+    plan = pack_context(candidates, queries, config.CONTEXT_TOKEN_BUDGET, config.CONTEXT_MIN_EXCERPT_TOKENS)
+    if header and plan.parts:
+        plan.parts.insert(0, header)
+    plan.prompt_tokens = estimate_tokens(_response_prompt(question, outline))
+    return plan
+
+
+@metrics.timed("plan_response_context_async")
+async def plan_response_context_async(
+    question: str,
+    outline: dict,
+    grant_id: Optional[str] = None,
+    file_candidates: Optional[Callable[[], Awaitable[List[ContextCandidate]]]] = None,
+) -> ContextPlan:
+    """
+    Choose the context for a draft within CONTEXT_TOKEN_BUDGET tokens.
+
+    With a grant_id, the candidates are the most relevant chunks of that
+    grant's documents; if nothing was indexed for the grant, its files are the
+    candidates. Without one, every uploaded file is. Candidates are ranked by
+    relevance to the question and outline and packed into the budget; the
+    plan's report lists what was included, truncated or left out. An earlier
+    answer to a similar question of another grant competes for the budget
+    alongside them (see _seed_candidates).
+
+    `file_candidates` can supply the whole-file candidates, so several drafts
+    for one grant load them once.
+    """
+    with profiling.span("metadata_scan"):
+        queries = await asyncio.to_thread(_retrieval_queries, grant_id, question, outline)
+        seeds = await asyncio.to_thread(_seed_candidates, grant_id, question)
+    if grant_id is not None and config.RETRIEVAL_ENABLED:
+        with profiling.span("retrieval"):
+            candidates = await asyncio.to_thread(_retrieval_candidates, grant_id, queries)
+        if candidates:
+            with profiling.span("context_pack"):
+                return await asyncio.to_thread(_pack, candidates + seeds, queries, question, outline, RETRIEVAL_HEADER)
+    candidates = await (file_candidates() if file_candidates else _file_candidates_async(grant_id))
+    with profiling.span("context_pack"):
+        return await asyncio.to_thread(_pack, candidates + seeds, queries, question, outline)
+
+
+def _response_prompt(question: str, outline: dict) -> str:
+    """Format the drafting prompt for a question and its answer outline."""
+    outline_text = "Answer Outline:\n"
+    if "sections" in outline:
+        for i, section in enumerate(outline["sections"], 1):
+            outline_text += f"{i}. {section['name']}: {section['description']}\n"
+
+    return RESPONSE_PROMPT.format(question=question, outline_text=outline_text)
+
+
+def question_key(question: str) -> str:
+    """Identifies a question's drafts in the draft store."""
+    return sha256_hex(question.strip())[:32]
+
+
+def _document_hash(item: dict) -> str:
+    """Content hash of a stored file; files stored without one use their size and mtime."""
+    if item.get("sha256"):
+        return item["sha256"]
+    try:
+        stat = _upload_path(item).stat()
+    except OSError:
+        return ""
+    return f"{item['stored_name']}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _plan_documents(plan: ContextPlan, grant_id: Optional[str] = None) -> Dict[str, str]:
+    """
+    {document name: content hash} for the documents a context plan draws on.
+    Sources that are not stored files (earlier answers, whose names include
+    their draft id) map to "".
+    """
+    used = {item["source"] for item in plan.items if item["status"] != "excluded"}
+    hashes: Dict[str, List[str]] = {source: [] for source in used}
+    for item in (find_files(grant_id=grant_id) if grant_id is not None else load_file_metadata()):
+        source = item.get("original_name", item["stored_name"])
+        if source in used:
+            hashes[source].append(_document_hash(item))
+    return {source: ",".join(sorted(values)) for source, values in hashes.items()}
+
+
+def draft_fingerprint(question: str, outline: dict, documents: Dict[str, str]) -> str:
+    """
+    Fingerprint of everything a draft depends on: the question, the outline
+    sections, the model and prompt, and the content of the documents its
+    context came from.
+    """
+    sections = [(section.get("name", ""), section.get("description", "")) for section in outline.get("sections", [])]
+    return sha256_hex(json.dumps(
+        [question.strip(), sections, RESPONSE_MODEL, RESPONSE_PROMPT_VERSION, sorted(documents.items())],
+        separators=(",", ":"),
+    ))
+
+
+def _draft_input(question: str, outline: dict, grant_id: Optional[str], plan: ContextPlan) -> dict:
+    """The draft store fields identifying a draft made from this plan."""
+    documents = _plan_documents(plan, grant_id)
+    return {
+        "grant_id": grant_id,
+        "question_key": question_key(question),
+        "fingerprint": draft_fingerprint(question, outline, documents),
+        "documents": documents,
+    }
+
+
+def _store_draft(question: str, outline: dict, draft_input: dict, response: str, context: dict) -> dict:
+    return add_draft({
+        "id": str(uuid.uuid4()),
+        **draft_input,
+        "question": question,
+        "outline": outline,
+        "model": RESPONSE_MODEL,
+        "response": response,
+        "context": context,
+        "created_at": time.time(),
+    })
+
+
+def draft_result(draft: dict, cached: bool) -> dict:
+    """A stored draft in the shape draft_response_async returns."""
+    info = {key: draft.get(key) for key in ("id", "question_key", "version", "fingerprint", "created_at", "stale")}
+    return {"response": draft["response"], "context": draft["context"], "draft": {**info, "cached": cached}}
+
+
+async def stored_draft(question: str, outline: dict, grant_id: Optional[str], plan: ContextPlan) -> tuple:
+    """(draft store fields for this plan, the stored draft made from the same input or None)."""
+    draft_input = await asyncio.to_thread(_draft_input, question, outline, grant_id, plan)
+    draft = await asyncio.to_thread(find_draft, grant_id, draft_input["question_key"], draft_input["fingerprint"])
+    return draft_input, draft
+
+
+async def save_draft(question: str, outline: dict, draft_input: dict, response: str, context: dict) -> dict:
+    """Store a new draft version and return it in the shape draft_response_async returns."""
+    draft = await asyncio.to_thread(_store_draft, question, outline, draft_input, response, context)
+    return draft_result(draft, cached=False)
+
+
+@metrics.timed("draft_response_async")
+async def draft_response_async(question: str, outline: dict, grant_id: Optional[str] = None, regenerate: bool = False) -> dict:
+    """
+    Draft a response and report the context it was given.
+
+    Drafts are kept in the draft store under a fingerprint of their input
+    (see draft_fingerprint). If a draft was already made from the same input
+    it is returned without calling the model, unless `regenerate` is set;
+    a new draft is stored as the question's next version.
+
+    Returns:
+        {"response": ..., "context": ..., "draft": ...}, where context is the
+        plan report from plan_response_context_async and draft describes the stored
+        version ("cached" tells whether it was reused). Failed drafts are not
+        stored and have no "draft".
+    """
+    client = get_client()
+
+    plan = await plan_response_context_async(question, outline, grant_id)
+    draft_input, draft = await stored_draft(question, outline, grant_id, plan)
+    if draft is not None and not regenerate:
+        return draft_result(draft, cached=True)
+    total_prompt_in = plan.parts + [_response_prompt(question, outline)]
+
+    try:
+        response = await generate_content_async(
+            client,
+            "response",
+            model=RESPONSE_MODEL,
             contents=total_prompt_in,
         )
-        return response.text
+        text = response.text
+    except ModelUnavailable:
+        raise
     except Exception as e:
         print(f"Error generating response: {e}")
-        return f"Error generating response: {e}"
+        return {"response": f"Error generating response: {e}", "context": plan.report()}
+    return await save_draft(question, outline, draft_input, text, plan.report())
+
+
+@metrics.timed("generate_response_async")
+async def generate_response_async(question: str, outline: dict, grant_id: Optional[str] = None) -> str:
+    """
+    Generate a response to a question using uploaded context and an answer outline.
+
+    Args:
+        question: The question to answer
+        outline: Dict containing sections with 'name' and 'description' keys
+        grant_id: Restricts context to this grant's documents, when given
+
+    Returns:
+        The generated response string
+    """
+    return (await draft_response_async(question, outline, grant_id))["response"]
+
+
+@metrics.timed("mark_stale_drafts")
+def mark_stale_drafts(grant_id: Optional[str]) -> List[dict]:
+    """
+    After a grant's documents change, mark its latest drafts (and those of
+    drafts made without a grant, which draw on every file) stale, without
+    planning any context, so the upload is not held up. Returns the drafts,
+    for stale_draft_checker to re-plan: those whose context is unaffected are
+    marked fresh again there; the others are redrafted on their next request.
+    """
+    drafts = [draft for scope in dict.fromkeys([grant_id, None]) for draft in load_drafts(scope)]
+    set_drafts_stale([draft["id"] for draft in drafts])
+    return drafts
+
+
+class StaleDraftChecker:
+    """
+    Re-plans drafts marked stale by mark_stale_drafts, one at a time on the
+    event loop, and marks each fresh again if its context still comes from
+    the same documents. A draft queued again while it is being checked (a
+    second upload) is checked again afterwards, so the last check sees
+    every upload.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.checked = 0
+        self.refreshed = 0
+
+    def schedule(self, drafts: List[dict]) -> None:
+        """Queue drafts for checking; must be called on the event loop."""
+        for draft in drafts:
+            self._pending[draft["id"]] = draft
+        running = self._task is not None and not self._task.done() and self._task.get_loop() is asyncio.get_running_loop()
+        if self._pending and not running:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._pending:
+            draft_id = next(iter(self._pending))
+            draft = self._pending.pop(draft_id)
+            try:
+                await self.check(draft)
+            except Exception as e:
+                print(f"Could not re-check draft {draft_id}: {e}")
+
+    async def check(self, draft: dict) -> bool:
+        """Re-plan one draft's context and store whether it is stale; returns that."""
+        question, outline, grant_id = draft["question"], draft["outline"], draft.get("grant_id")
+        plan = await plan_response_context_async(question, outline, grant_id)
+        draft_input = await asyncio.to_thread(_draft_input, question, outline, grant_id, plan)
+        stale = draft_input["fingerprint"] != draft["fingerprint"]
+        await asyncio.to_thread(set_drafts_stale, [draft["id"]], stale)
+        self.checked += 1
+        self.refreshed += not stale
+        return stale
+
+    async def join(self) -> None:
+        """Wait until every queued draft has been checked."""
+        while self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+
+stale_draft_checker = StaleDraftChecker()
+
+
+def outline_from_sub_questions(sub_questions: List[str]) -> dict:
+    """Answer outline with one section per sub-question, as the questions page builds it."""
+    return {
+        "sections": [
+            {"name": sub_question, "description": "Include relevant details based on context."}
+            for sub_question in sub_questions
+        ]
+    }
+
+
+@metrics.timed("draft_questions")
+async def draft_questions(grant_id: str, questions: List[dict], concurrency: int = None) -> AsyncIterator[dict]:
+    """
+    Draft every {"question", "sub_questions"} entry of a grant, at most
+    `concurrency` at a time, yielding {"index", "question", "response"} (or
+    "error") in completion order.
+
+    The grant's whole-file candidates are loaded once and shared by every
+    draft; each question still gets its own ranking and token-budgeted plan
+    (and, with retrieval enabled, its own top-k chunks). Each result carries
+    the plan report under "context". Questions whose stored draft still
+    matches its input are answered from the draft store; the rest are drafted
+    and stored. Closing the generator cancels drafts that have not finished.
+    """
+    client = get_client()
+    semaphore = asyncio.Semaphore(max(1, concurrency or config.DRAFT_ALL_CONCURRENCY))
+    shared_candidates = None
+    shared_candidates_lock = asyncio.Lock()
+
+    async def file_candidates() -> List[ContextCandidate]:
+        nonlocal shared_candidates
+        async with shared_candidates_lock:
+            if shared_candidates is None:
+                shared_candidates = await _file_candidates_async(grant_id)
+        return shared_candidates
+
+    async def draft(index: int, item: dict) -> dict:
+        question = item["question"]
+        async with semaphore:
+            outline = outline_from_sub_questions(item.get("sub_questions", []))
+            plan = await plan_response_context_async(question, outline, grant_id, file_candidates=file_candidates)
+            draft_input, stored = await stored_draft(question, outline, grant_id, plan)
+            if stored is not None:
+                return {"index": index, "question": question, **draft_result(stored, cached=True)}
+            contents = plan.parts + [_response_prompt(question, outline)]
+            try:
+                response = await generate_content_async(client, "response", model=RESPONSE_MODEL, contents=contents)
+                draft = await save_draft(question, outline, draft_input, response.text, plan.report())
+                return {"index": index, "question": question, **draft}
+            except Exception as e:
+                print(f"Error generating response: {e}")
+                return {"index": index, "question": question, "error": str(e), "context": plan.report()}
+
+    tasks = [asyncio.create_task(draft(index, item)) for index, item in enumerate(questions)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@metrics.timed("stream_text")
+async def stream_text(contents) -> AsyncIterator[str]:
+    """
+    Stream generated text for `contents` chunk by chunk.
+
+    Closing the generator early (for example when the HTTP client disconnects
+    and the response task is cancelled) closes the upstream stream, so an
+    abandoned generation stops being read.
+    """
+    client = get_client()
+    metrics.llm_in_flight.inc(model=RESPONSE_MODEL)
+    outcome = "error"
+    usage = None
+    try:
+        # Opening the stream goes through the gateway; a stream that fails
+        # part way is not retried, as its text has already been sent
+        stream = await model_gateway.call_async(
+            None,
+            "stream",
+            lambda: client.aio.models.generate_content_stream(model=RESPONSE_MODEL, contents=contents),
+        )
+        try:
+            async for chunk in stream:
+                # Usage metadata is cumulative; the last chunk carrying it has the totals
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if chunk.text:
+                    yield chunk.text
+            outcome = "ok"
+        finally:
+            await stream.aclose()
+    finally:
+        metrics.llm_in_flight.dec(model=RESPONSE_MODEL)
+        metrics.llm_requests.inc(model=RESPONSE_MODEL, operation="stream", outcome=outcome)
+        metrics.record_usage(RESPONSE_MODEL, "stream", usage)
+
+
+@metrics.timed("generate_response_stream")
+async def generate_response_stream(
+    question: str,
+    outline: dict,
+    grant_id: Optional[str] = None,
+    plan: Optional[ContextPlan] = None,
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of generate_response_async that yields the draft as it
+    is generated. Pass `plan` to reuse a context plan made beforehand.
+    """
+    if plan is None:
+        plan = await plan_response_context_async(question, outline, grant_id)
+    total_prompt_in = plan.parts + [_response_prompt(question, outline)]
+
+    async for text in stream_text(total_prompt_in):
+        yield text
 
 
 def test_gemini_setup():
@@ -0,0 +1,121 @@
+import json
+import time
+import hashlib
+import pathlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def sha256_hex(data) -> str:
+    """SHA-256 hex digest of a str or bytes value."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_key(model: str, prompt_version: str, input_hash: str) -> str:
+    """Content-addressed cache key for one model call."""
+    return sha256_hex(f"{model}\x00{prompt_version}\x00{input_hash}")
+
+
+class ResultCache:
+    """
+    Two-tier cache for JSON-serializable LLM results.
+
+    The memory tier is an LRU bounded by `max_entries`. When `disk_dir` is set,
+    entries are also written there as one JSON file per key so they survive
+    restarts. Both tiers drop entries older than `ttl_seconds` (0 disables expiry).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 0, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = pathlib.Path(disk_dir) if disk_dir else None
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _expiry(self) -> Optional[float]:
+        return time.time() + self.ttl_seconds if self.ttl_seconds else None
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for `key`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._get_from_disk(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        return value
+
+    def _get_from_disk(self, key: str, now: float) -> Optional[Any]:
+        if not self.disk_dir:
+            return None
+        path = self.disk_dir / f"{key}.json"
+        try:
+            record = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        expires_at = record.get("expires_at")
+        if expires_at is not None and expires_at <= now:
+            path.unlink(missing_ok=True)
+            return None
+        self._set_in_memory(key, record["value"], expires_at)
+        return record["value"]
+
+    def _set_in_memory(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store `value` under `key` in memory and, if enabled, on disk."""
+        expires_at = self._expiry()
+        self._set_in_memory(key, value, expires_at)
+        if not self.disk_dir:
+            return
+        path = self.disk_dir / f"{key}.json"
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_text(json.dumps({"expires_at": expires_at, "value": value}), encoding="utf-8")
+            tmp_path.replace(path)
+        except OSError as e:
+            print(f"Warning: could not write cache entry {path}: {e}")
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+        if self.disk_dir:
+            for path in self.disk_dir.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": self.disk_dir is not None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
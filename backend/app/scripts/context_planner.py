@@ -0,0 +1,169 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Tuple
+
+from app.scripts.pdf_text import CHARS_PER_TOKEN
+from app.scripts.retrieval import chunk_text, rank_texts
+
+# Words per window when an oversized document is cut down to its most relevant parts
+EXCERPT_WINDOW_WORDS = 120
+EXCERPT_SEPARATOR = "\n[...]\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of prompt text; whitespace padding is not counted."""
+    return max(1, len(" ".join(text.split())) // CHARS_PER_TOKEN)
+
+
+class TokenCounter:
+    """
+    Token counts of context parts, memoised by content hash.
+
+    `count_text` counts a text part (the estimate by default; pass a function
+    calling the model's count_tokens for exact counts). Counts for parts that
+    are not text are supplied by the caller through `count`.
+    """
+
+    def __init__(self, count_text: Optional[Callable[[str], int]] = None, max_entries: int = 4096):
+        self.count_text = count_text or estimate_tokens
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, key: str, compute: Callable[[], int]) -> int:
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return tokens
+            self.misses += 1
+        tokens = compute()
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def count_part(self, key: str, text: str) -> int:
+        return self.count(key, lambda: self.count_text(text))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._counts), "hits": self.hits, "misses": self.misses}
+
+
+@dataclass
+class ContextCandidate:
+    """
+    One piece of context that may go into a prompt. Text candidates can be
+    cut down to fit; `part` candidates (uploaded or inline files) are sent
+    whole or not at all.
+    """
+    source: str
+    key: str
+    tokens: int
+    text: Optional[str] = None
+    part: Any = None
+    header: str = ""
+
+    def render(self, text: Optional[str] = None) -> Any:
+        """The prompt part for this candidate, or for an excerpt of its text."""
+        if self.text is None:
+            return self.part
+        text = self.text if text is None else text
+        return f"{self.header}\n{text}" if self.header else text
+
+
+@dataclass
+class ContextPlan:
+    """The context parts chosen for one prompt and what each of them cost."""
+    parts: list
+    items: List[dict] = field(default_factory=list)
+    budget_tokens: int = 0
+    prompt_tokens: int = 0
+
+    @property
+    def context_tokens(self) -> int:
+        return sum(item["tokens"] for item in self.items if item["status"] != "excluded")
+
+    def report(self) -> dict:
+        return {
+            "budget_tokens": self.budget_tokens,
+            "context_tokens": self.context_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "total_tokens": self.context_tokens + self.prompt_tokens,
+            "parts": self.items,
+        }
+
+
+def rank_candidates(candidates: List[ContextCandidate], queries: List[str]) -> List[Tuple[ContextCandidate, float]]:
+    """
+    (candidate, relevance) pairs, text candidates first in order of relevance
+    to the queries. Non-text candidates cannot be scored and follow the text
+    in their original order.
+    """
+    texts = [candidate for candidate in candidates if candidate.text is not None]
+    scored = list(zip(texts, rank_texts([candidate.text for candidate in texts], queries)))
+    scored.sort(key=lambda pair: -pair[1])
+    return scored + [(candidate, 0.0) for candidate in candidates if candidate.text is None]
+
+
+def _excerpt(text: str, queries: List[str], budget: int) -> Optional[tuple]:
+    """The most relevant windows of `text` that fit in `budget` tokens, kept in document order."""
+    windows = chunk_text(text, EXCERPT_WINDOW_WORDS, 0)
+    scores = rank_texts(windows, queries)
+    chosen, used = [], 0
+    for i in sorted(range(len(windows)), key=lambda i: -scores[i]):
+        tokens = estimate_tokens(windows[i])
+        if used + tokens > budget:
+            continue
+        chosen.append(i)
+        used += tokens
+    if not chosen:
+        return None
+    return EXCERPT_SEPARATOR.join(windows[i] for i in sorted(chosen)), used
+
+
+def pack_context(
+    candidates: List[ContextCandidate],
+    queries: List[str],
+    budget_tokens: int,
+    min_excerpt_tokens: int = 200,
+) -> ContextPlan:
+    """
+    Fill `budget_tokens` with candidates in order of relevance.
+
+    A candidate that fits is included whole. A text candidate that does not
+    fit is cut down to its most relevant windows when at least
+    `min_excerpt_tokens` of budget are left; anything else is excluded.
+    Every candidate appears in the plan's items with the tokens it used.
+    """
+    plan = ContextPlan(parts=[], budget_tokens=budget_tokens)
+    remaining = budget_tokens
+    for candidate, relevance in rank_candidates(candidates, queries):
+        item = {
+            "source": candidate.source,
+            "relevance": round(relevance, 4),
+            "full_tokens": candidate.tokens,
+        }
+        if candidate.tokens <= remaining:
+            plan.parts.append(candidate.render())
+            item.update(status="included", tokens=candidate.tokens)
+            remaining -= candidate.tokens
+        elif candidate.text is not None and remaining >= min_excerpt_tokens:
+            excerpt = _excerpt(candidate.text, queries, remaining)
+            if excerpt is None:
+                item.update(status="excluded", tokens=0)
+            else:
+                text, tokens = excerpt
+                plan.parts.append(candidate.render(text))
+                item.update(status="truncated", tokens=tokens)
+                remaining -= tokens
+        else:
+            item.update(status="excluded", tokens=0)
+        plan.items.append(item)
+    return plan
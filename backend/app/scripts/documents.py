@@ -0,0 +1,188 @@
+import time
+import asyncio
+import pathlib
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from google.genai import types
+
+# The Files API keeps uploads for 48 hours; used when a response omits the expiry
+DEFAULT_FILE_LIFETIME_SECONDS = 48 * 3600
+# How long to wait for an uploaded file to leave the PROCESSING state
+PROCESSING_TIMEOUT_SECONDS = 60
+
+
+class DocumentUnavailable(RuntimeError):
+    """An uploaded file failed processing or did not become usable in time."""
+
+
+@dataclass
+class RemoteDocument:
+    """Handle for a file already uploaded through the Files API."""
+    name: str
+    uri: str
+    mime_type: str
+    expires_at: float
+
+    def part(self) -> types.Part:
+        return types.Part.from_uri(file_uri=self.uri, mime_type=self.mime_type)
+
+
+def _fingerprint(path: pathlib.Path) -> tuple:
+    """Identify a stored file's current contents without reading it."""
+    stat = path.stat()
+    return (str(path), stat.st_size, stat.st_mtime_ns)
+
+
+def _to_remote(uploaded: types.File, mime_type: str) -> RemoteDocument:
+    if uploaded.expiration_time is not None:
+        expires_at = uploaded.expiration_time.timestamp()
+    else:
+        expires_at = time.time() + DEFAULT_FILE_LIFETIME_SECONDS
+    return RemoteDocument(
+        name=uploaded.name,
+        uri=uploaded.uri,
+        mime_type=uploaded.mime_type or mime_type,
+        expires_at=expires_at,
+    )
+
+
+class DocumentRegistry:
+    """
+    Uploads each stored context file to the model once and reuses the handle.
+
+    Entries are keyed on the file's path, size and mtime, so a changed file is
+    uploaded again. A handle is reused until it is within `expiry_margin_seconds`
+    of its expiry, at which point the next draft re-uploads it and the handle
+    it replaces is deleted from the Files API.
+
+    `client_factory` returns the genai client to upload with; pass a fake to
+    exercise the registry without network access.
+    """
+
+    def __init__(self, client_factory: Callable, expiry_margin_seconds: float = 3600):
+        self.client_factory = client_factory
+        self.expiry_margin_seconds = expiry_margin_seconds
+        self._documents: Dict[tuple, RemoteDocument] = {}
+        self._lock = threading.Lock()
+        self._upload_locks: Dict[tuple, asyncio.Lock] = {}
+        self.uploads = 0
+        self.reuses = 0
+        self.deletes = 0
+
+    def _lookup(self, key: tuple) -> Optional[RemoteDocument]:
+        with self._lock:
+            document = self._documents.get(key)
+            if document and document.expires_at - self.expiry_margin_seconds > time.time():
+                self.reuses += 1
+                return document
+            return None
+
+    def _remember(self, key: tuple, document: RemoteDocument) -> List[RemoteDocument]:
+        """Store the handle for `key`; returns the handles it replaces, for deleting."""
+        with self._lock:
+            replaced = self._forget_locked(key)
+            self._documents[key] = document
+            self.uploads += 1
+            return replaced
+
+    def _forget_locked(self, key: tuple) -> List[RemoteDocument]:
+        # Handles for every version of the same path, the current one included
+        old_keys = [k for k in self._documents if k[0] == key[0]]
+        return [self._documents.pop(k) for k in old_keys]
+
+    def _forget(self, key: tuple) -> List[RemoteDocument]:
+        with self._lock:
+            return self._forget_locked(key)
+
+    @staticmethod
+    def _check_state(uploaded: types.File, path: pathlib.Path) -> None:
+        if uploaded.state == types.FileState.FAILED:
+            raise DocumentUnavailable(f"Processing {path.name} failed: {uploaded.error}")
+        if uploaded.state == types.FileState.PROCESSING:
+            raise DocumentUnavailable(f"{path.name} still processing after {PROCESSING_TIMEOUT_SECONDS}s")
+
+    def _delete(self, client, names: List[str]) -> None:
+        """Best-effort removal of remote files that are no longer referenced."""
+        for name in names:
+            try:
+                client.files.delete(name=name)
+                self.deletes += 1
+            except Exception as e:
+                print(f"Warning: could not delete remote file {name}: {e}")
+
+    async def _delete_async(self, client, names: List[str]) -> None:
+        for name in names:
+            try:
+                await client.aio.files.delete(name=name)
+                self.deletes += 1
+            except Exception as e:
+                print(f"Warning: could not delete remote file {name}: {e}")
+
+    def get_part(self, path: pathlib.Path, mime_type: str) -> types.Part:
+        """
+        Return a Part referencing `path`, uploading it if needed. Raises
+        DocumentUnavailable if the upload fails processing or times out.
+        """
+        key = _fingerprint(path)
+        document = self._lookup(key)
+        if document is None:
+            client = self.client_factory()
+            uploaded = client.files.upload(file=path, config={"mime_type": mime_type})
+            deadline = time.time() + PROCESSING_TIMEOUT_SECONDS
+            while uploaded.state == types.FileState.PROCESSING and time.time() < deadline:
+                time.sleep(1)
+                uploaded = client.files.get(name=uploaded.name)
+            try:
+                self._check_state(uploaded, path)
+            except DocumentUnavailable:
+                stale = self._forget(key)
+                self._delete(client, [uploaded.name] + [old.name for old in stale])
+                raise
+            document = _to_remote(uploaded, mime_type)
+            replaced = self._remember(key, document)
+            self._delete(client, [old.name for old in replaced if old.name != document.name])
+        return document.part()
+
+    async def get_part_async(self, path: pathlib.Path, mime_type: str) -> types.Part:
+        """Async variant of get_part; concurrent drafts share a single upload."""
+        key = await asyncio.to_thread(_fingerprint, path)
+        document = self._lookup(key)
+        if document is not None:
+            return document.part()
+
+        upload_lock = self._upload_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with upload_lock:
+                document = self._lookup(key)
+                if document is None:
+                    client = self.client_factory()
+                    uploaded = await client.aio.files.upload(file=path, config={"mime_type": mime_type})
+                    deadline = time.time() + PROCESSING_TIMEOUT_SECONDS
+                    while uploaded.state == types.FileState.PROCESSING and time.time() < deadline:
+                        await asyncio.sleep(1)
+                        uploaded = await client.aio.files.get(name=uploaded.name)
+                    try:
+                        self._check_state(uploaded, path)
+                    except DocumentUnavailable:
+                        stale = self._forget(key)
+                        await self._delete_async(client, [uploaded.name] + [old.name for old in stale])
+                        raise
+                    document = _to_remote(uploaded, mime_type)
+                    replaced = self._remember(key, document)
+                    await self._delete_async(client, [old.name for old in replaced if old.name != document.name])
+        finally:
+            # A later upload of the same file may have put in a lock of its own
+            if self._upload_locks.get(key) is upload_lock:
+                del self._upload_locks[key]
+        return document.part()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "uploads": self.uploads,
+                "reuses": self.reuses,
+                "deletes": self.deletes,
+            }
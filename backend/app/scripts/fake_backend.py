@@ -0,0 +1,250 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import pathlib
+import datetime
+import threading
+from typing import Any, AsyncIterator, Optional
+
+from google.genai import errors, types
+
+# Words the fake draws its text from, so outputs look like prose and tokenize sensibly
+VOCABULARY = (
+    "project community grant funding partners outcomes regional workforce training budget "
+    "timeline milestones industry economic growth residents county city program capacity "
+    "sustainability matching local delivery impact strategy plan data evaluation support"
+).split()
+NUMBERED_LINE = re.compile(r"^\s*\d+\.\s", re.M)
+
+
+def _contents_text(contents) -> tuple:
+    """(prompt text, bytes of inline data) of a generate_content `contents` argument."""
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    texts, data_bytes = [], 0
+    for item in contents:
+        if isinstance(item, str):
+            texts.append(item)
+        elif isinstance(item, types.Part):
+            if item.text:
+                texts.append(item.text)
+            if item.inline_data is not None and item.inline_data.data:
+                data_bytes += len(item.inline_data.data)
+            if item.file_data is not None:
+                texts.append(item.file_data.file_uri or "")
+        else:
+            texts.append(str(item))
+    return "\n".join(texts), data_bytes
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def _resolve(schema: dict, defs: dict) -> dict:
+    while "$ref" in schema:
+        schema = defs[schema["$ref"].rsplit("/", 1)[-1]]
+    if "anyOf" in schema:
+        schema = next((option for option in schema["anyOf"] if option.get("type") != "null"), schema["anyOf"][0])
+        return _resolve(schema, defs)
+    return schema
+
+
+def _instance(schema: dict, defs: dict, rng: random.Random, item_count: int, position: int = 0) -> Any:
+    """
+    A value valid against a JSON schema. Arrays of objects get one element per
+    numbered line of the prompt (as batch prompts expect) and integers inside
+    them take the element's position, so index fields line up.
+    """
+    schema = _resolve(schema, defs)
+    kind = schema.get("type")
+    if kind == "object":
+        return {
+            name: _instance(field, defs, rng, item_count, position)
+            for name, field in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        items = _resolve(schema.get("items", {}), defs)
+        count = item_count if items.get("type") == "object" else rng.randint(2, 5)
+        return [_instance(items, defs, rng, item_count, i) for i in range(count)]
+    if kind == "integer":
+        return position
+    if kind == "number":
+        return round(rng.uniform(0, 100), 2)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    return f"{_words(rng, rng.randint(6, 14)).capitalize()}?"
+
+
+class FakeBackend:
+    """
+    Deterministic stand-in for the Gemini API, for offline runs and benchmarks.
+
+    Responses depend only on the request: the same prompt always gets the
+    same text, and structured requests get JSON valid against their
+    response_schema. Each call waits `latency_seconds` plus or minus up to
+    `jitter_seconds`, and fails with a 429 or 503 at `error_rate`; latency and
+    failures are drawn from a generator seeded with `seed`, so a sequential
+    run is reproducible.
+    """
+
+    def __init__(self, latency_seconds: float = 0.05, jitter_seconds: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.uploads = 0
+        self.deleted_files = []
+
+    def _draw(self) -> tuple:
+        """(delay, error or None) for the next call."""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency_seconds + self._rng.uniform(-self.jitter_seconds, self.jitter_seconds))
+            if self._rng.random() >= self.error_rate:
+                return delay, None
+            self.failures += 1
+            code = self._rng.choice((429, 503))
+        status = "RESOURCE_EXHAUSTED" if code == 429 else "UNAVAILABLE"
+        response_json = {"error": {"code": code, "message": "Injected by the fake backend", "status": status}}
+        error = errors.ClientError(code, response_json) if code < 500 else errors.ServerError(code, response_json)
+        return delay, error
+
+    def _response(self, contents, config: Optional[dict]) -> types.GenerateContentResponse:
+        text, data_bytes = _contents_text(contents)
+        rng = random.Random(hashlib.sha256(text.encode("utf-8") + str(data_bytes).encode()).digest())
+        config = config if isinstance(config, dict) else (config.model_dump(exclude_none=True) if config else {})
+        schema = config.get("response_schema")
+        if schema:
+            item_count = len(NUMBERED_LINE.findall(text)) or 3
+            output = json.dumps(_instance(schema, schema.get("$defs", {}), rng, item_count))
+        else:
+            output = " ".join(f"{_words(rng, rng.randint(12, 24)).capitalize()}." for _ in range(rng.randint(6, 12)))
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=output)]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=len(text) // 4 + data_bytes // 1000,
+                candidates_token_count=len(output) // 4,
+            ),
+        )
+
+    def _file(self, file, config) -> types.File:
+        with self._lock:
+            self.uploads += 1
+            upload = self.uploads
+        path = pathlib.Path(file)
+        # Every upload gets a new name, as with the real Files API
+        digest = hashlib.sha256(f"{path}:{upload}".encode("utf-8")).hexdigest()[:16]
+        mime_type = (config or {}).get("mime_type") if isinstance(config, dict) else None
+        return types.File(
+            name=f"files/{digest}",
+            uri=f"fake://files/{digest}",
+            mime_type=mime_type,
+            state=types.FileState.ACTIVE,
+            expiration_time=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48),
+        )
+
+
+class _Models:
+    def __init__(self, backend: FakeBackend):
+        self._backend = backend
+
+    def generate_content(self, *, model: str, contents, config=None) -> types.GenerateContentResponse:
+        delay, error = self._backend._draw()
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return self._backend._response(contents, config)
+
+    def count_tokens(self, *, model: str, contents, config=None) -> types.CountTokensResponse:
+        text, data_bytes = _contents_text(contents)
+        return types.CountTokensResponse(total_tokens=len(text) // 4 + data_bytes // 1000)
+
+
+class _AsyncModels:
+    def __init__(self, backend: FakeBackend):
+        self._backend = backend
+
+    async def generate_content(self, *, model: str, contents, config=None) -> types.GenerateContentResponse:
+        delay, error = self._backend._draw()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return self._backend._response(contents, config)
+
+    async def generate_content_stream(self, *, model: str, contents, config=None) -> AsyncIterator[types.GenerateContentResponse]:
+        delay, error = self._backend._draw()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        response = self._backend._response(contents, config)
+        return self._stream(response, delay)
+
+    async def _stream(self, response: types.GenerateContentResponse, delay: float) -> AsyncIterator[types.GenerateContentResponse]:
+        words = response.text.split(" ")
+        chunks = [" ".join(words[i:i + 20]) + " " for i in range(0, len(words), 20)]
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(delay / 10)
+            last = i == len(chunks) - 1
+            yield types.GenerateContentResponse(
+                candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=chunk)]))],
+                usage_metadata=response.usage_metadata if last else None,
+            )
+
+    async def count_tokens(self, *, model: str, contents, config=None) -> types.CountTokensResponse:
+        return _Models(self._backend).count_tokens(model=model, contents=contents, config=config)
+
+
+class _Files:
+    def __init__(self, backend: FakeBackend):
+        self._backend = backend
+
+    def upload(self, *, file, config=None) -> types.File:
+        return self._backend._file(file, config)
+
+    def get(self, *, name: str) -> types.File:
+        return types.File(name=name, uri=f"fake://{name}", state=types.FileState.ACTIVE)
+
+    def delete(self, *, name: str) -> None:
+        with self._backend._lock:
+            self._backend.deleted_files.append(name)
+
+
+class _AsyncFiles(_Files):
+    async def upload(self, *, file, config=None) -> types.File:
+        return self._backend._file(file, config)
+
+    async def get(self, *, name: str) -> types.File:
+        return types.File(name=name, uri=f"fake://{name}", state=types.FileState.ACTIVE)
+
+    async def delete(self, *, name: str) -> None:
+        _Files.delete(self, name=name)
+
+
+class _AsyncClient:
+    def __init__(self, backend: FakeBackend):
+        self.models = _AsyncModels(backend)
+        self.files = _AsyncFiles(backend)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class FakeClient:
+    """The subset of genai.Client that app.scripts.ai uses, backed by a FakeBackend."""
+
+    def __init__(self, latency_seconds: float = 0.05, jitter_seconds: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.backend = FakeBackend(latency_seconds, jitter_seconds, error_rate, seed)
+        self.models = _Models(self.backend)
+        self.files = _Files(self.backend)
+        self.aio = _AsyncClient(self.backend)
+
+    def close(self) -> None:
+        pass
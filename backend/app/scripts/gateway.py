@@ -0,0 +1,508 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+from google.genai import errors
+
+
+class ModelUnavailable(RuntimeError):
+    """
+    The model could not be reached: the circuit breaker is open, or a call
+    kept failing with rate-limit or server errors until its retries ran out.
+    `retry_after` is a suggested wait in seconds before trying again.
+    """
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    """A model call attempt ran past its task's deadline and was abandoned."""
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return isinstance(error, errors.APIError) and error.code == 429
+
+
+def is_retryable(error: BaseException) -> bool:
+    """429s, 5xx responses, timeouts, missed deadlines and dropped connections; anything else is the request's fault."""
+    if isinstance(error, errors.APIError):
+        return error.code == 429 or (error.code or 0) >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError))
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from a Retry-After header on the error's response, if it sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    Rate limiter admitting `rate_per_second` calls on average, in bursts of
+    up to `burst`.
+
+    The rate adapts to the upstream quota: a 429 halves it (down to
+    `min_rate_per_second`), and each success grows it back by a tenth of the
+    configured rate. Callers reserve a token and sleep for the returned wait,
+    so the same bucket serves threads and the event loop.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int, min_rate_per_second: float = 0.1):
+        self.max_rate = rate_per_second
+        self.min_rate = min(min_rate_per_second, rate_per_second)
+        self.rate = rate_per_second
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        """Take a token only if one is available right now."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def penalize(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+class CircuitBreaker:
+    """
+    Stops calling the model after `failure_threshold` consecutive server
+    errors or timeouts. While open, calls fail fast with ModelUnavailable;
+    after `reset_seconds` one probe call is let through, and its success
+    closes the circuit again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_seconds else "open"
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_seconds - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._probing:
+                raise ModelUnavailable("Model circuit breaker is open", retry_after=max(remaining, 1.0))
+            self._probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.opened += 1
+            self._probing = False
+
+    def record_ignored(self) -> None:
+        """The call failed for a reason that says nothing about upstream health."""
+        with self._lock:
+            self._probing = False
+
+
+class _Flight:
+    """A synchronous call in progress, awaited by the threads asking for the same thing."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+@dataclass
+class GatewayStats:
+    calls: int = 0
+    coalesced: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    rejected: int = 0
+    throttle_seconds: float = 0.0
+
+
+class ModelGateway:
+    """
+    Single entry point for model calls.
+
+    - Identical requests in flight at the same time share one upstream call
+      (single-flight): the first caller makes it, the others wait for its
+      result. Requests are identified by the key the caller passes; a key of
+      None opts out.
+    - Every attempt takes a token from an adaptive TokenBucket.
+    - 429s and server errors are retried up to `attempts` times with full
+      jitter exponential backoff, honouring Retry-After when it is longer.
+    - A CircuitBreaker fails calls fast while the model is down.
+
+    Once retries are exhausted, or the circuit is open, ModelUnavailable is
+    raised; other errors propagate unchanged.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        attempts: int = 4,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 20,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30,
+        on_retry: Optional[Callable[[str], None]] = None,
+    ):
+        self.limiter = TokenBucket(rate_per_second, burst) if rate_per_second > 0 else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_seconds)
+        self.attempts = max(1, attempts)
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.on_retry = on_retry
+        self.stats = GatewayStats()
+        self._flights: Dict[str, _Flight] = {}
+        self._async_flights: Dict[tuple, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+        return max(delay, min(_retry_after(error) or 0.0, self.max_backoff_seconds))
+
+    def _throttle(self) -> float:
+        """Admit an attempt through the breaker and the limiter; returns the wait."""
+        try:
+            self.breaker.before_call()
+        except ModelUnavailable:
+            with self._lock:
+                self.stats.rejected += 1
+            raise
+        wait = self.limiter.reserve() if self.limiter is not None else 0.0
+        with self._lock:
+            self.stats.calls += 1
+            self.stats.throttle_seconds += wait
+        return wait
+
+    def _after_error(self, error: BaseException, attempt: int, operation: str) -> float:
+        """Record a failed attempt; returns the backoff before the next one, or raises."""
+        if not is_retryable(error):
+            self.breaker.record_ignored()
+            raise error
+        if is_rate_limited(error):
+            self.breaker.record_ignored()
+            if self.limiter is not None:
+                self.limiter.penalize()
+            with self._lock:
+                self.stats.rate_limited += 1
+        else:
+            self.breaker.record_failure()
+        if attempt + 1 >= self.attempts:
+            raise ModelUnavailable(
+                f"Model call failed after {self.attempts} attempts: {error}",
+                retry_after=self._backoff(attempt, error),
+            ) from error
+        with self._lock:
+            self.stats.retries += 1
+        if self.on_retry is not None:
+            self.on_retry(operation)
+        return self._backoff(attempt, error)
+
+    def _after_success(self) -> None:
+        self.breaker.record_success()
+        if self.limiter is not None:
+            self.limiter.reward()
+
+    def _call_with_retries(self, operation: str, call: Callable[[], Any]) -> Any:
+        for attempt in range(self.attempts):
+            wait = self._throttle()
+            try:
+                time.sleep(wait)
+                result = call()
+            except Exception as e:
+                delay = self._after_error(e, attempt, operation)
+            except BaseException:
+                # Interrupted, not failed: release the half-open probe slot
+                # taken by _throttle, or the circuit would stay open for good
+                self.breaker.record_ignored()
+                raise
+            else:
+                self._after_success()
+                return result
+            time.sleep(delay)
+
+    async def _call_with_retries_async(self, operation: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        for attempt in range(self.attempts):
+            wait = self._throttle()
+            try:
+                await asyncio.sleep(wait)
+                result = await call()
+            except Exception as e:
+                delay = self._after_error(e, attempt, operation)
+            except BaseException:
+                # Cancelled (a client disconnect, a closed generator or a
+                # worker shutdown): release the half-open probe slot
+                self.breaker.record_ignored()
+                raise
+            else:
+                self._after_success()
+                return result
+            await asyncio.sleep(delay)
+
+    def admit_hedge(self) -> bool:
+        """
+        Whether a duplicate of a call in flight may be sent now. Hedges only
+        use spare capacity: they are refused while the circuit is not closed
+        or when the limiter has no token to hand.
+        """
+        if self.breaker.state != "closed":
+            return False
+        if self.limiter is not None and not self.limiter.try_acquire():
+            return False
+        with self._lock:
+            self.stats.calls += 1
+        return True
+
+    def call(self, key: Optional[str], operation: str, call: Callable[[], Any]) -> Any:
+        """Run a blocking model call through the gateway."""
+        if key is None:
+            return self._call_with_retries(operation, call)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.stats.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = self._call_with_retries(operation, call)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def call_async(self, key: Optional[str], operation: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run a model call on the event loop through the gateway. The shared
+        call runs as its own task, so a caller that is cancelled does not
+        cancel the call for the others waiting on it.
+        """
+        if key is None:
+            return await self._call_with_retries_async(operation, call)
+        flight_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._async_flights.get(flight_key)
+            if task is None:
+                task = asyncio.ensure_future(self._call_with_retries_async(operation, call))
+                self._async_flights[flight_key] = task
+                task.add_done_callback(lambda done: self._land(flight_key, done))
+            else:
+                self.stats.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _land(self, flight_key: tuple, task: asyncio.Task) -> None:
+        with self._lock:
+            self._async_flights.pop(flight_key, None)
+        # Mark the error as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def report(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats.__dict__)
+        stats.update(
+            circuit=self.breaker.state,
+            circuit_opened=self.breaker.opened,
+            rate_per_second=self.limiter.rate if self.limiter is not None else None,
+        )
+        return stats
+
+
+class LatencyTracker:
+    """Recent call latencies per key, for percentile estimates."""
+
+    def __init__(self, window: int = 256):
+        self.window = window
+        self._samples: Dict[Any, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: Any, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key: Any, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """The given percentile of recent latencies, or None with fewer than `min_samples`."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+@dataclass
+class HedgeStats:
+    calls: int = 0
+    sent: int = 0
+    won: int = 0
+    overhead_input_tokens: int = 0
+
+
+class Hedger:
+    """
+    Hedged requests: when a call has not answered by the `percentile` of
+    recent latencies for its key, a duplicate is sent and the first result
+    that passes validation wins; the other call is cancelled.
+
+    No hedge is sent until `min_samples` latencies have been seen for the
+    key, or sooner than `min_delay_seconds`, or when `admit` refuses it.
+    A hedge's cost overhead is estimated as the winner's prompt tokens, which
+    the duplicate was billed for too (its output tokens, if any, are unknown
+    once it is cancelled).
+    """
+
+    def __init__(self, percentile: float = 95, min_samples: int = 20, min_delay_seconds: float = 0.5, window: int = 256):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay_seconds = min_delay_seconds
+        self.latencies = LatencyTracker(window)
+        self._stats: Dict[Any, HedgeStats] = {}
+        self._lock = threading.Lock()
+
+    def delay(self, key: Any) -> Optional[float]:
+        """Seconds to wait before hedging a call, or None when there is not enough history."""
+        observed = self.latencies.percentile(key, self.percentile, self.min_samples)
+        return None if observed is None else max(observed, self.min_delay_seconds)
+
+    def _count(self, key: Any, **increments) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(key, HedgeStats())
+            for name, amount in increments.items():
+                setattr(stats, name, getattr(stats, name) + amount)
+
+    async def run(
+        self,
+        key: Any,
+        start_call: Callable[[], Awaitable[Any]],
+        validate: Optional[Callable[[Any], bool]] = None,
+        hedge: bool = True,
+        admit: Optional[Callable[[], bool]] = None,
+        deadline_seconds: Optional[float] = None,
+    ) -> Any:
+        """
+        Run one attempt of a call, hedged when `hedge` is set. Raises
+        DeadlineExceeded if no result arrives within `deadline_seconds`.
+        When every copy answers but none validates, the first answer is
+        returned for the caller to deal with.
+        """
+        start = time.monotonic()
+        deadline_at = start + deadline_seconds if deadline_seconds else None
+        primary = asyncio.ensure_future(start_call())
+        pending = {primary}
+        hedged = None
+        fallback = None
+        error: Optional[BaseException] = None
+        self._count(key, calls=1)
+        try:
+            delay = self.delay(key) if hedge else None
+            if delay is not None and (deadline_at is None or start + delay < deadline_at):
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and (admit is None or admit()):
+                    hedged = asyncio.ensure_future(start_call())
+                    pending.add(hedged)
+                    self._count(key, sent=1)
+            while pending:
+                timeout = None if deadline_at is None else deadline_at - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                # Prefer the primary when both finish in the same step
+                for task in sorted(done, key=lambda task: task is not primary):
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    result = task.result()
+                    if validate is None or validate(result):
+                        self._finish(key, start, task is hedged, hedged is not None, result)
+                        return result
+                    if fallback is None:
+                        fallback = (task, result)
+            if fallback is not None:
+                task, result = fallback
+                self._finish(key, start, task is hedged, hedged is not None, result)
+                return result
+            if error is not None and not pending:
+                raise error
+            raise DeadlineExceeded(f"No model response within {deadline_seconds:g}s")
+        finally:
+            for task in pending:
+                task.cancel()
+                # Retrieve errors of abandoned calls so they are not logged as unhandled
+                task.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    def _finish(self, key: Any, start: float, hedge_won: bool, hedged: bool, result: Any) -> None:
+        self.latencies.observe(key, time.monotonic() - start)
+        if hedge_won:
+            self._count(key, won=1)
+        if hedged:
+            usage = getattr(result, "usage_metadata", None)
+            self._count(key, overhead_input_tokens=getattr(usage, "prompt_token_count", None) or 0)
+
+    def report(self) -> Dict[Any, dict]:
+        with self._lock:
+            return {key: dict(stats.__dict__) for key, stats in self._stats.items()}
@@ -0,0 +1,84 @@
+import io
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from pypdf import PdfReader, PdfWriter
+
+
+@dataclass
+class PdfShard:
+    """A window of pages cut from a larger PDF (pages are 0-based, end exclusive)."""
+    start_page: int
+    end_page: int
+    data: bytes
+
+
+def page_count(file_bytes: bytes) -> int:
+    return len(PdfReader(io.BytesIO(file_bytes)).pages)
+
+
+def page_windows(total_pages: int, window_pages: int, overlap_pages: int) -> List[Tuple[int, int]]:
+    """
+    (start, end) page ranges of `window_pages` pages, each overlapping the
+    previous one by `overlap_pages` so a question that straddles a boundary
+    appears whole in at least one window.
+    """
+    step = max(1, window_pages - overlap_pages)
+    windows = []
+    for start in range(0, total_pages, step):
+        end = min(start + window_pages, total_pages)
+        windows.append((start, end))
+        if end >= total_pages:
+            break
+    return windows
+
+
+def split_pdf(file_bytes: bytes, window_pages: int, overlap_pages: int) -> List[PdfShard]:
+    """Cut a PDF into overlapping page windows, each written as its own PDF."""
+    reader = PdfReader(io.BytesIO(file_bytes))
+    shards = []
+    for start, end in page_windows(len(reader.pages), window_pages, overlap_pages):
+        writer = PdfWriter()
+        for page_number in range(start, end):
+            writer.add_page(reader.pages[page_number])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        shards.append(PdfShard(start_page=start, end_page=end, data=buffer.getvalue()))
+    return shards
+
+
+def _normalize(question: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", question.lower()).strip()
+
+
+def _is_fragment(short: str, long: str) -> bool:
+    """True when `short` is a cut-off piece of `long` rather than an unrelated short question."""
+    return len(short) >= 20 and len(short) * 2 >= len(long) and short in long
+
+
+def merge_shard_questions(shard_questions: List[List[str]]) -> List[str]:
+    """
+    Merge per-shard question lists in page order, dropping duplicates.
+
+    Overlapping pages mean neighbouring shards can both report a question,
+    sometimes one of them cut short at the window edge. Questions that match
+    after normalisation, or where one contains the other, are kept once, in
+    their longest wording and at their first position.
+    """
+    merged: List[str] = []
+    normalized: List[str] = []
+    for questions in shard_questions:
+        for question in questions:
+            key = _normalize(question)
+            if not key:
+                continue
+            for i, existing in enumerate(normalized):
+                if key == existing or _is_fragment(key, existing) or _is_fragment(existing, key):
+                    if len(key) > len(existing):
+                        merged[i], normalized[i] = question, key
+                    break
+            else:
+                merged.append(question)
+                normalized.append(key)
+    return merged
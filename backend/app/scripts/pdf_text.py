@@ -0,0 +1,197 @@
+import io
+import re
+import json
+import pathlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from functools import cached_property
+from typing import Dict, List, Optional
+
+from pypdf import PdfReader
+
+from app.scripts.cache import sha256_hex
+
+# Gemini bills each page of a PDF part as this many tokens
+PDF_TOKENS_PER_PAGE = 258
+# Rough characters per token for English text, used for savings estimates
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class DocumentText:
+    """Per-page text of one PDF, identified by the hash of its bytes."""
+    sha256: str
+    pages: List[str]
+    scanned: bool
+    pdf_bytes: int
+
+    def text(self, start: int = 0, end: Optional[int] = None) -> str:
+        """Pages start..end (0-based, end exclusive) with page markers, for a prompt."""
+        return "\n\n".join(
+            f"--- Page {number} ---\n{page}"
+            for number, page in enumerate(self.pages[start:end], start + 1)
+        )
+
+    @cached_property
+    def text_tokens_estimate(self) -> int:
+        # Layout padding collapses into few tokens, so it is not counted
+        return len(" ".join(self.text().split())) // CHARS_PER_TOKEN
+
+    @property
+    def pdf_tokens_estimate(self) -> int:
+        return len(self.pages) * PDF_TOKENS_PER_PAGE
+
+    @property
+    def use_text(self) -> bool:
+        """
+        Whether prompts should carry the text rather than the PDF: it must
+        have been extracted (not scanned) and be estimated to cost fewer
+        tokens than the PDF's flat per-page rate, which dense pages exceed.
+        """
+        return not self.scanned and self.text_tokens_estimate < self.pdf_tokens_estimate
+
+    def report(self) -> dict:
+        """Estimated bytes and tokens sent for this document as text instead of as a PDF."""
+        text_bytes = len(self.text().encode("utf-8"))
+        pdf_tokens = self.pdf_tokens_estimate
+        text_tokens = self.text_tokens_estimate
+        use_text = self.use_text
+        if not use_text:
+            text_bytes, text_tokens = self.pdf_bytes, pdf_tokens
+        return {
+            "sha256": self.sha256,
+            "pages": len(self.pages),
+            "scanned": self.scanned,
+            "sent_as": "text" if use_text else "pdf",
+            "pdf_bytes": self.pdf_bytes,
+            "text_bytes": text_bytes,
+            "bytes_saved": self.pdf_bytes - text_bytes,
+            "pdf_tokens_estimate": pdf_tokens,
+            "text_tokens_estimate": text_tokens,
+            "tokens_saved_estimate": pdf_tokens - text_tokens,
+        }
+
+
+def _clean_page(text: str) -> str:
+    """Drop trailing spaces and runs of blank lines while keeping the layout's indentation."""
+    lines = [line.rstrip() for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip("\n")
+
+
+def extract_pages(file_bytes: bytes) -> List[str]:
+    """Text of every page, in layout mode where pypdf can manage it."""
+    reader = PdfReader(io.BytesIO(file_bytes))
+    pages = []
+    for page in reader.pages:
+        try:
+            text = page.extract_text(extraction_mode="layout")
+        except Exception:
+            text = page.extract_text() or ""
+        pages.append(_clean_page(text or ""))
+    return pages
+
+
+def is_scanned(pages: List[str], min_chars_per_page: int) -> bool:
+    """True when most pages carry no extractable text, i.e. the PDF is page images."""
+    if not pages:
+        return True
+    sparse = sum(1 for page in pages if len(page.replace(" ", "").replace("\n", "")) < min_chars_per_page)
+    return sparse * 2 > len(pages)
+
+
+class DocumentTextStore:
+    """
+    Extracted text of uploaded PDFs, one JSON file per content hash.
+
+    Documents are extracted once, at ingestion or on first use, and kept in a
+    small in-memory LRU in front of the files. Stored files are looked up by
+    path, size and mtime, so a PDF already seen is not hashed again.
+    """
+
+    def __init__(self, directory: pathlib.Path, min_chars_per_page: int = 50, max_entries: int = 64):
+        self.directory = pathlib.Path(directory)
+        self.min_chars_per_page = min_chars_per_page
+        self.max_entries = max_entries
+        self._documents: "OrderedDict[str, DocumentText]" = OrderedDict()
+        self._hashes: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+        self.extractions = 0
+        self.hits = 0
+
+    def _path(self, sha256: str) -> pathlib.Path:
+        return self.directory / f"{sha256}.json"
+
+    def _remember(self, document: DocumentText) -> None:
+        with self._lock:
+            self._documents[document.sha256] = document
+            self._documents.move_to_end(document.sha256)
+            while len(self._documents) > self.max_entries:
+                self._documents.popitem(last=False)
+
+    def _load(self, sha256: str) -> Optional[DocumentText]:
+        with self._lock:
+            document = self._documents.get(sha256)
+            if document is not None:
+                self._documents.move_to_end(sha256)
+                self.hits += 1
+                return document
+        try:
+            document = DocumentText(**json.loads(self._path(sha256).read_text(encoding="utf-8")))
+        except (OSError, ValueError, TypeError):
+            return None
+        self._remember(document)
+        with self._lock:
+            self.hits += 1
+        return document
+
+    def _save(self, document: DocumentText) -> None:
+        path = self._path(document.sha256)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(asdict(document)), encoding="utf-8")
+            tmp_path.replace(path)
+        except OSError as e:
+            print(f"Warning: could not write document text {path}: {e}")
+
+    def get(self, file_bytes: bytes, sha256: Optional[str] = None) -> DocumentText:
+        """Text of a PDF given its bytes, extracting and storing it on first sight."""
+        sha256 = sha256 or sha256_hex(file_bytes)
+        document = self._load(sha256)
+        if document is None:
+            pages = extract_pages(file_bytes)
+            document = DocumentText(
+                sha256=sha256,
+                pages=pages,
+                scanned=is_scanned(pages, self.min_chars_per_page),
+                pdf_bytes=len(file_bytes),
+            )
+            self._save(document)
+            self._remember(document)
+            with self._lock:
+                self.extractions += 1
+        return document
+
+    def get_path(self, path: pathlib.Path) -> DocumentText:
+        """Text of a stored PDF, read from disk only when it has not been seen before."""
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            sha256 = self._hashes.get(key)
+        if sha256 is not None:
+            document = self._load(sha256)
+            if document is not None:
+                return document
+        document = self.get(path.read_bytes())
+        with self._lock:
+            self._hashes[key] = document.sha256
+        return document
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "extractions": self.extractions,
+                "hits": self.hits,
+            }
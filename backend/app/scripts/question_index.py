@@ -0,0 +1,178 @@
+import math
+import zlib
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.scripts.retrieval import tokenize
+
+# Features are hashed into this many buckets; large enough that distinct
+# n-grams of a question corpus practically never share one
+FEATURE_BUCKETS = 1 << 24
+# Bigrams carry word order, so reworded questions score below verbatim ones
+BIGRAM_WEIGHT = 0.7
+
+
+def question_features(text: str) -> Dict[int, float]:
+    """
+    Hashed word unigram and bigram vector of a question, with sublinear term
+    frequencies, L2-normalised so dot products are cosine similarities.
+    """
+    tokens = tokenize(text)
+    counts = Counter(tokens)
+    weights: Dict[int, float] = {}
+    for term, tf in counts.items():
+        bucket = zlib.crc32(term.encode("utf-8")) % FEATURE_BUCKETS
+        weights[bucket] = weights.get(bucket, 0.0) + 1 + math.log(tf)
+    for bigram, tf in Counter(zip(tokens, tokens[1:])).items():
+        bucket = zlib.crc32(" ".join(bigram).encode("utf-8")) % FEATURE_BUCKETS
+        weights[bucket] = weights.get(bucket, 0.0) + BIGRAM_WEIGHT * (1 + math.log(tf))
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {bucket: weight / norm for bucket, weight in weights.items()} if norm else {}
+
+
+@dataclass
+class QuestionEntry:
+    grant_id: str
+    question: str
+    sub_questions: List[str] = field(default_factory=list)
+
+
+@dataclass
+class QuestionMatch:
+    grant_id: str
+    question: str
+    sub_questions: List[str]
+    score: float
+
+
+class QuestionIndex:
+    """
+    Similarity index over the questions of every stored grant, for reusing
+    work across grant programs that ask near-identical questions.
+
+    Questions are hashed word n-gram vectors (question_features) held in an
+    inverted index: a search only touches the postings of the query's own
+    features and accumulates cosine similarities for all questions at once
+    with NumPy, so it stays well under a millisecond at tens of thousands of
+    questions. Grants are updated in place with set_grant; rows of removed
+    questions are masked out and reclaimed once they make up half the index.
+    """
+
+    def __init__(self):
+        self._entries: List[Optional[QuestionEntry]] = []
+        self._rows: Dict[str, Dict[str, int]] = {}
+        self._postings: Dict[int, tuple] = {}
+        self._posting_arrays: Dict[int, tuple] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._removed = 0
+        self._lock = threading.Lock()
+        self.searches = 0
+
+    def _add(self, entry: QuestionEntry) -> None:
+        row = len(self._entries)
+        self._entries.append(entry)
+        self._rows.setdefault(entry.grant_id, {})[entry.question] = row
+        for bucket, weight in question_features(entry.question).items():
+            rows, weights = self._postings.setdefault(bucket, ([], []))
+            rows.append(row)
+            weights.append(weight)
+            self._posting_arrays.pop(bucket, None)
+        if row >= len(self._alive):
+            self._alive = np.concatenate([self._alive, np.zeros(max(1024, len(self._alive)), dtype=bool)])
+        self._alive[row] = True
+
+    def _remove(self, row: int) -> None:
+        entry = self._entries[row]
+        del self._rows[entry.grant_id][entry.question]
+        self._entries[row] = None
+        self._alive[row] = False
+        self._removed += 1
+
+    def _compact(self) -> None:
+        """Rebuild the postings without the rows of removed questions."""
+        entries = [entry for entry in self._entries if entry is not None]
+        self._entries, self._rows, self._postings, self._posting_arrays = [], {}, {}, {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._removed = 0
+        for entry in entries:
+            self._add(entry)
+
+    def set_grant(self, grant_id: str, questions: List[dict]) -> None:
+        """
+        Make the index hold exactly these {"question", "sub_questions"} entries
+        for a grant. Unchanged questions keep their postings; only new
+        questions are vectorised.
+        """
+        wanted = {}
+        for item in questions:
+            if item.get("question"):
+                wanted[item["question"]] = list(item.get("sub_questions") or [])
+        with self._lock:
+            for row in list(self._rows.get(grant_id, {}).values()):
+                entry = self._entries[row]
+                if entry.question in wanted:
+                    entry.sub_questions = wanted.pop(entry.question)
+                else:
+                    self._remove(row)
+            for question, sub_questions in wanted.items():
+                self._add(QuestionEntry(grant_id, question, sub_questions))
+            if not self._rows.get(grant_id):
+                self._rows.pop(grant_id, None)
+            if self._removed > len(self._entries) // 2:
+                self._compact()
+
+    def _arrays(self, bucket: int) -> Optional[tuple]:
+        arrays = self._posting_arrays.get(bucket)
+        if arrays is None and bucket in self._postings:
+            rows, weights = self._postings[bucket]
+            arrays = (np.asarray(rows, dtype=np.int64), np.asarray(weights, dtype=np.float32))
+            self._posting_arrays[bucket] = arrays
+        return arrays
+
+    def search(self, question: str, k: int = 5, min_score: float = 0.0) -> List[QuestionMatch]:
+        """The `k` stored questions most similar to `question` scoring at least `min_score`, best first."""
+        features = question_features(question)
+        with self._lock:
+            self.searches += 1
+            n = len(self._entries)
+            if n == 0 or not features:
+                return []
+            postings = []
+            for bucket, weight in features.items():
+                arrays = self._arrays(bucket)
+                if arrays is not None:
+                    postings.append((arrays[0], arrays[1] * weight))
+            if not postings:
+                return []
+            # A question's score is the sum of its shared features' weight
+            # products; bincount adds them up for every question in one pass
+            rows = np.concatenate([rows for rows, _ in postings])
+            weights = np.concatenate([weights for _, weights in postings])
+            scores = np.bincount(rows, weights, minlength=n)
+            scores[~self._alive[:n]] = 0
+            candidates = np.flatnonzero(scores >= max(min_score, 1e-6))
+            if candidates.size > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            return [
+                QuestionMatch(
+                    grant_id=self._entries[row].grant_id,
+                    question=self._entries[row].question,
+                    sub_questions=list(self._entries[row].sub_questions),
+                    score=round(float(scores[row]), 4),
+                )
+                for row in candidates
+            ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "questions": len(self._entries) - self._removed,
+                "grants": len(self._rows),
+                "features": len(self._postings),
+                "searches": self.searches,
+            }
@@ -0,0 +1,215 @@
+import re
+import math
+import pathlib
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from pypdf import PdfReader
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be been by can do does for from has have how if in into is it its "
+    "of on or our that the their this to was we were what when which who will with you your".split()
+)
+TEXT_SUFFIXES = {".txt", ".md", ".csv", ".json"}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords and single characters removed."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def extract_text(path: pathlib.Path, mime_type: Optional[str]) -> str:
+    """Extract plain text from a stored upload; unsupported types yield ''."""
+    mime_type = mime_type or ""
+    if mime_type == "application/pdf" or path.suffix.lower() == ".pdf":
+        reader = PdfReader(str(path))
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    if mime_type.startswith("text/") or path.suffix.lower() in TEXT_SUFFIXES:
+        return path.read_text(encoding="utf-8", errors="ignore")
+    return ""
+
+
+def chunk_text(text: str, chunk_words: int, overlap_words: int) -> List[str]:
+    """Split text into windows of `chunk_words` words overlapping by `overlap_words`."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_words - overlap_words)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+@dataclass
+class Chunk:
+    file_id: str
+    source: str
+    text: str
+
+
+class GrantIndex:
+    """
+    BM25 index over the chunks of one grant's documents.
+
+    Postings are appended as documents arrive, so adding a file only touches
+    the terms it contains. Scoring converts the postings of each query term to
+    NumPy arrays (cached until the term changes) and accumulates scores for
+    all chunks at once.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks: List[Chunk] = []
+        self.file_ids = set()
+        self._lengths: List[int] = []
+        self._postings: Dict[str, tuple] = {}
+        self._posting_arrays: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def add(self, file_id: str, source: str, texts: List[str]) -> int:
+        with self._lock:
+            if file_id in self.file_ids:
+                return 0
+            self.file_ids.add(file_id)
+            for text in texts:
+                chunk_id = len(self.chunks)
+                tokens = tokenize(text)
+                for term, tf in Counter(tokens).items():
+                    chunk_ids, tfs = self._postings.setdefault(term, ([], []))
+                    chunk_ids.append(chunk_id)
+                    tfs.append(tf)
+                    self._posting_arrays.pop(term, None)
+                self.chunks.append(Chunk(file_id=file_id, source=source, text=text))
+                self._lengths.append(len(tokens))
+            return len(texts)
+
+    def _arrays(self, term: str) -> Optional[tuple]:
+        arrays = self._posting_arrays.get(term)
+        if arrays is None and term in self._postings:
+            chunk_ids, tfs = self._postings[term]
+            arrays = (np.asarray(chunk_ids, dtype=np.int64), np.asarray(tfs, dtype=np.float64))
+            self._posting_arrays[term] = arrays
+        return arrays
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for `query`."""
+        with self._lock:
+            n = len(self.chunks)
+            scores = np.zeros(n)
+            if n == 0:
+                return scores
+            lengths = np.asarray(self._lengths, dtype=np.float64)
+            avg_length = lengths.mean() or 1.0
+            norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            for term, query_tf in Counter(tokenize(query)).items():
+                arrays = self._arrays(term)
+                if arrays is None:
+                    continue
+                chunk_ids, tfs = arrays
+                df = len(chunk_ids)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                scores[chunk_ids] += query_tf * idf * tfs * (self.k1 + 1) / (tfs + norm[chunk_ids])
+            return scores
+
+
+def _combined_scores(index: GrantIndex, queries: List[str]) -> Optional[np.ndarray]:
+    """Per-chunk maximum over queries of each query's max-normalised BM25 score."""
+    combined = None
+    for query in queries:
+        scores = index.scores(query)
+        if scores.size == 0 or scores.max() <= 0:
+            continue
+        scores = scores / scores.max()
+        combined = scores if combined is None else np.maximum(combined, scores)
+    return combined
+
+
+def rank_texts(texts: List[str], queries: List[str]) -> List[float]:
+    """Relevance of each text to the queries, on the same 0-1 scale RetrievalIndex.search ranks by."""
+    index = GrantIndex()
+    index.add("", "", texts)
+    combined = _combined_scores(index, queries)
+    return [0.0] * len(texts) if combined is None else combined.tolist()
+
+
+class RetrievalIndex:
+    """Chunked BM25 indexes over uploaded documents, partitioned by grant id."""
+
+    def __init__(self, chunk_words: int = 220, overlap_words: int = 40, chunk_cache_size: int = 128):
+        self.chunk_words = chunk_words
+        self.overlap_words = overlap_words
+        self._grants: Dict[str, GrantIndex] = {}
+        self._lock = threading.Lock()
+        # Chunks of recently indexed files, so a blob shared by several grants
+        # is only parsed once
+        self._chunk_cache: "OrderedDict[tuple, List[str]]" = OrderedDict()
+        self.chunk_cache_size = chunk_cache_size
+
+    def _grant_index(self, grant_id: str) -> GrantIndex:
+        with self._lock:
+            return self._grants.setdefault(grant_id, GrantIndex())
+
+    def add_document(
+        self,
+        grant_id: str,
+        file_id: str,
+        source: str,
+        path: pathlib.Path,
+        mime_type: Optional[str],
+        text: Optional[str] = None,
+    ) -> int:
+        """
+        Extract, chunk and index one file. Returns the number of chunks added;
+        a file_id already indexed for the grant is skipped. Pass `text` when the
+        file's text was already extracted.
+        """
+        index = self._grant_index(grant_id)
+        if file_id in index.file_ids:
+            return 0
+        stat = path.stat()
+        cache_key = (str(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            texts = self._chunk_cache.get(cache_key)
+        if texts is None:
+            if text is None:
+                text = extract_text(path, mime_type)
+            texts = chunk_text(text, self.chunk_words, self.overlap_words)
+            with self._lock:
+                self._chunk_cache[cache_key] = texts
+                while len(self._chunk_cache) > self.chunk_cache_size:
+                    self._chunk_cache.popitem(last=False)
+        return index.add(file_id, source, texts)
+
+    def search(self, grant_id: str, queries: List[str], k: int) -> List[Chunk]:
+        """
+        Top-k chunks of a grant for several queries at once.
+
+        Each query's scores are normalised by its best score so a long question
+        does not drown out its sub-questions; a chunk's relevance is its best
+        normalised score across queries.
+        """
+        with self._lock:
+            index = self._grants.get(grant_id)
+        if index is None:
+            return []
+        combined = _combined_scores(index, queries)
+        if combined is None:
+            return []
+        k = min(k, int(np.count_nonzero(combined)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-combined, k - 1)[:k]
+        top = top[np.argsort(-combined[top])]
+        return [index.chunks[i] for i in top]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {grant_id: len(index.chunks) for grant_id, index in self._grants.items()}
@@ -1,12 +1,15 @@
-import json
-import shutil
+import asyncio
+import hashlib
+import uuid
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Optional
 import os
 
+from app import config
+
 # Define paths
-BASE_DIR = Path(__file__).parent
-UPLOADS_DIR = BASE_DIR / "uploads"
+UPLOADS_DIR = config.UPLOADS_DIR
 
 def ensure_uploads_dir():
     """Ensure uploads directory and index file exist."""
@@ -16,3 +19,76 @@ def get_upload_path(filename: str) -> Path:
     """Get the full path for an uploaded file."""
     ensure_uploads_dir()
     return UPLOADS_DIR / filename
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeded MAX_UPLOAD_BYTES."""
+
+
+@dataclass
+class StoredBlob:
+    """A content-addressed file in the uploads directory."""
+    stored_name: str
+    sha256: str
+    size_bytes: int
+    deduplicated: bool
+
+
+def _write_chunk(buffer, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+
+def _commit_blob(tmp_path: Path, sha256: str, ext: str, size: int) -> StoredBlob:
+    """Move a finished temp file to its content address, or drop it if that blob exists."""
+    stored_name = f"{sha256}{ext.lower()}"
+    final_path = get_upload_path(stored_name)
+    if final_path.exists():
+        tmp_path.unlink(missing_ok=True)
+        return StoredBlob(stored_name, sha256, size, deduplicated=True)
+    os.replace(tmp_path, final_path)
+    return StoredBlob(stored_name, sha256, size, deduplicated=False)
+
+
+async def save_upload_stream(upload, ext: str, max_bytes: Optional[int] = None) -> StoredBlob:
+    """
+    Stream an UploadFile to disk in UPLOAD_CHUNK_BYTES chunks, hashing as the
+    bytes arrive. Disk writes and hashing run off the event loop. Raises
+    UploadTooLarge as soon as more than `max_bytes` (default MAX_UPLOAD_BYTES)
+    have been read.
+
+    The file is stored as <sha256><ext>, so identical uploads share one blob.
+    """
+    max_bytes = max_bytes if max_bytes is not None else config.MAX_UPLOAD_BYTES
+    hasher = hashlib.sha256()
+    tmp_path = get_upload_path(f".{uuid.uuid4()}.part")
+    size = 0
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while chunk := await upload.read(config.UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+                await asyncio.to_thread(_write_chunk, buffer, hasher, chunk)
+        return await asyncio.to_thread(_commit_blob, tmp_path, hasher.hexdigest(), ext, size)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _save_bytes(data: bytes, ext: str) -> StoredBlob:
+    tmp_path = get_upload_path(f".{uuid.uuid4()}.part")
+    try:
+        tmp_path.write_bytes(data)
+        return _commit_blob(tmp_path, hashlib.sha256(data).hexdigest(), ext, len(data))
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+async def save_upload_bytes(data: bytes, ext: str, max_bytes: Optional[int] = None) -> StoredBlob:
+    """In-memory counterpart of save_upload_stream, for content already in the request body."""
+    max_bytes = max_bytes if max_bytes is not None else config.MAX_UPLOAD_BYTES
+    if max_bytes and len(data) > max_bytes:
+        raise UploadTooLarge(f"Upload exceeds the {max_bytes} byte limit")
+    return await asyncio.to_thread(_save_bytes, data, ext)
@@ -0,0 +1,294 @@
+"""
+Offline load benchmark of the API against the fake model backend.
+
+Runs the app in-process (no server, no network, no API key) with a fresh
+database and uploads directory, grows the corpus through the given sizes,
+and at every size drives each endpoint at each concurrency level, recording
+throughput and latency percentiles. Results are written as JSON so runs can
+be compared:
+
+    python benchmark.py --output before.json
+    # ... change something ...
+    python benchmark.py --output after.json --compare before.json
+
+Model latency, jitter and error rate are those of the fake backend
+(--latency, --jitter, --error-rate), so numbers measure this service's own
+overhead and concurrency behaviour rather than the API's.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import asyncio
+import pathlib
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import numpy as np
+
+BACKEND_DIR = pathlib.Path(__file__).parent.absolute()
+SEED_PDF = BACKEND_DIR / "app" / "uploads" / "default-grant-doc.pdf"
+ENDPOINTS = ("upload_grant", "upload_file", "generate_response", "all_grants")
+OUTLINE = {"sections": [
+    {"name": "Overview", "description": "What the project does and why"},
+    {"name": "Outcomes", "description": "Measurable results and how they are tracked"},
+]}
+CONTEXT_WORDS = (
+    "The regional workforce partnership trains residents for advanced manufacturing roles. "
+    "Matching funds come from the county economic development authority and two community colleges. "
+    "Outcomes are tracked quarterly against enrollment, credential and placement targets. "
+).split()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=int, nargs="+", default=[10, 100, 1000],
+                        help="grants (each with one context file) in the database, grown in order")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="requests in flight")
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint and concurrency level")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="fake model latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake model calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=pathlib.Path, help="write results to this JSON file")
+    parser.add_argument("--compare", type=pathlib.Path, help="print deltas against an earlier results file")
+    parser.add_argument("--keep-data", action="store_true", help="keep the temporary data directory")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args: argparse.Namespace, data_dir: pathlib.Path) -> None:
+    """Point the app at the fake backend and a scratch data directory. Must run before importing app."""
+    uploads_dir = data_dir / "uploads"
+    uploads_dir.mkdir(parents=True)
+    for seed_file in (BACKEND_DIR / "app" / "uploads").iterdir():
+        if seed_file.is_file():
+            shutil.copy2(seed_file, uploads_dir / seed_file.name)
+    os.environ.update({
+        "MODEL_BACKEND": "fake",
+        "FAKE_MODEL_LATENCY_SECONDS": str(args.latency),
+        "FAKE_MODEL_JITTER_SECONDS": str(args.jitter),
+        "FAKE_MODEL_ERROR_RATE": str(args.error_rate),
+        "FAKE_MODEL_SEED": str(args.seed),
+        "DATABASE_PATH": str(data_dir / "grants.db"),
+        "UPLOADS_DIR": str(uploads_dir),
+        "DOCUMENT_TEXT_DIR": str(data_dir / "text"),
+        "PROFILE_DIR": str(data_dir / "profiles"),
+        "INGESTION_RETRY_BACKOFF_SECONDS": "0",
+        "EXTRACTION_SHARD_RETRY_BACKOFF_SECONDS": "0",
+    })
+    os.environ.pop("LLM_CACHE_DIR", None)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def context_text(rng: random.Random, words: int = 600) -> str:
+    return " ".join(rng.choice(CONTEXT_WORDS) for _ in range(words))
+
+
+def grow_corpus(size: int, grant_ids: list, rng: random.Random) -> None:
+    """Add grants, each with a context text file, until there are `size` of them."""
+    from app import config
+    from app.database import SEED_GRANTS, add_to_grants_database, add_files_metadata
+    from app.scripts import ai
+
+    files = []
+    while len(grant_ids) < size:
+        grant_id = str(uuid.uuid4())
+        add_to_grants_database({
+            **SEED_GRANTS[0],
+            "id": grant_id,
+            "name": f"Benchmark Grant {len(grant_ids) + 1}",
+            "status": "ready",
+        })
+        stored_name = f"{uuid.uuid4().hex}.txt"
+        (config.UPLOADS_DIR / stored_name).write_text(context_text(rng), encoding="utf-8")
+        files.append({
+            "id": str(uuid.uuid4()),
+            "original_name": "context.txt",
+            "stored_name": stored_name,
+            "content_type": "text/plain",
+            "doc_role": "context",
+            "grant_id": grant_id,
+            "upload_timestamp": time.time(),
+        })
+        grant_ids.append(grant_id)
+    add_files_metadata(files)
+    for metadata in files:
+        ai.index_document(metadata)
+
+
+def make_request(endpoint: str, grant_ids: list, rng: random.Random, seed_pdf: bytes):
+    """(method, path, httpx request kwargs) for one request to an endpoint."""
+    nonce = uuid.uuid4().hex
+    if endpoint == "upload_grant":
+        # A unique trailing comment keeps every upload a distinct blob, so
+        # extraction is not served from the content-hash cache
+        return "POST", "/api/upload_grant", {
+            "files": {"file": (f"grant-{nonce}.pdf", seed_pdf + f"\n%{nonce}\n".encode(), "application/pdf")},
+            "data": {"grant_name": f"Grant {nonce}", "department": "Benchmark", "county": "Benchmark", "due_date": "2030-01-01"},
+        }
+    if endpoint == "upload_file":
+        return "POST", "/api/upload_file", {
+            "files": {"file": (f"context-{nonce}.txt", f"{nonce} {context_text(rng)}".encode(), "text/plain")},
+            "data": {"file_role": "context", "grant_id": rng.choice(grant_ids)},
+        }
+    if endpoint == "generate_response":
+        from app.database import SEED_GRANTS
+        question = rng.choice(SEED_GRANTS[0]["questions"])["question"]
+        return "POST", "/api/generate_response", {
+            "json": {"question": f"{question} ({nonce})", "outline": OUTLINE, "grant_id": rng.choice(grant_ids)},
+        }
+    return "GET", "/api/all_grants", {}
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "mean_ms": round(float(values.mean()), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+async def run_scenario(client, endpoint: str, concurrency: int, total: int, grant_ids: list, rng: random.Random, seed_pdf: bytes) -> dict:
+    requests = [make_request(endpoint, grant_ids, rng, seed_pdf) for _ in range(total)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors, job_ids = [], 0, []
+
+    async def one(method, path, kwargs):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                # Read the whole body so serialization is measured too
+                await response.aread()
+                ok = response.status_code < 400
+                if ok and endpoint == "upload_grant":
+                    job_ids.append(response.json()["job_id"])
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(*request) for request in requests))
+    result = summarize(latencies, errors, time.perf_counter() - start)
+
+    if job_ids:
+        # Uploads only queue ingestion: wait for it here so background jobs
+        # do not leak into the next scenario, and report how long it took
+        from app.jobs import ingestion_queue
+        from app.database import load_job
+        drain_start = time.perf_counter()
+        await ingestion_queue.join()
+        result["ingestion_drain_seconds"] = round(time.perf_counter() - drain_start, 3)
+        result["ingestion_failed"] = sum(1 for job_id in job_ids if (load_job(job_id) or {}).get("state") == "failed")
+    return result
+
+
+async def run(args: argparse.Namespace) -> list:
+    import httpx
+    from app.main import app
+
+    seed_pdf = SEED_PDF.read_bytes()
+    rng = random.Random(args.seed)
+    grant_ids: list = []
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for size in args.corpus:
+                corpus_start = time.perf_counter()
+                await asyncio.to_thread(grow_corpus, size, grant_ids, rng)
+                print(f"corpus {size}: seeded in {time.perf_counter() - corpus_start:.1f}s", flush=True)
+                for concurrency in args.concurrency:
+                    for endpoint in args.endpoints:
+                        result = await run_scenario(client, endpoint, concurrency, args.requests, grant_ids, rng, seed_pdf)
+                        result.update(endpoint=endpoint, corpus=size, concurrency=concurrency)
+                        results.append(result)
+                        print(
+                            f"  {endpoint:<18} c={concurrency:<3} {result['throughput_rps']:>8.1f} req/s  "
+                            f"p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  p99 {result['p99_ms']:>8.1f} ms  "
+                            f"errors {result['errors']}",
+                            flush=True,
+                        )
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: list, baseline_path: pathlib.Path) -> None:
+    """Print throughput and p95 changes against a baseline run, scenario by scenario."""
+    baseline = {
+        (entry["endpoint"], entry["corpus"], entry["concurrency"]): entry
+        for entry in json.loads(baseline_path.read_text())["results"]
+    }
+    print(f"\nCompared with {baseline_path}:")
+    for entry in results:
+        before = baseline.get((entry["endpoint"], entry["corpus"], entry["concurrency"]))
+        if before is None:
+            continue
+        def change(key):
+            return (entry[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(
+            f"  {entry['endpoint']:<18} corpus={entry['corpus']:<5} c={entry['concurrency']:<3} "
+            f"throughput {change('throughput_rps'):+7.1f}%  p95 {change('p95_ms'):+7.1f}%  p99 {change('p99_ms'):+7.1f}%"
+        )
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    data_dir = pathlib.Path(tempfile.mkdtemp(prefix="grant-benchmark-"))
+    try:
+        configure_environment(args, data_dir)
+        results = asyncio.run(run(args))
+    finally:
+        if args.keep_data:
+            print(f"Data kept in {data_dir}")
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {
+            "corpus": args.corpus,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "fake_latency_seconds": args.latency,
+            "fake_jitter_seconds": args.jitter,
+            "fake_error_rate": args.error_rate,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
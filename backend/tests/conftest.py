@@ -0,0 +1,28 @@
+import os
+import shutil
+import pathlib
+import tempfile
+
+# The app reads its settings once, at import, so point it at a scratch
+# database and upload directory and the offline model backend first
+_DATA_DIR = pathlib.Path(tempfile.mkdtemp(prefix="grant-tests-"))
+_SEED_UPLOADS = pathlib.Path(__file__).resolve().parent.parent / "app" / "uploads"
+
+os.environ.update(
+    DATABASE_PATH=str(_DATA_DIR / "grants.db"),
+    DOCUMENT_TEXT_DIR=str(_DATA_DIR / "text"),
+    UPLOADS_DIR=str(_DATA_DIR / "uploads"),
+    PROFILE_DIR=str(_DATA_DIR / "profiles"),
+    MODEL_BACKEND="fake",
+    FAKE_MODEL_LATENCY_SECONDS="0",
+    MODEL_RETRY_BACKOFF_SECONDS="0",
+    INGESTION_RETRY_BACKOFF_SECONDS="0",
+    EXTRACTION_SHARD_RETRY_BACKOFF_SECONDS="0",
+)
+(_DATA_DIR / "uploads").mkdir()
+for seed in ("budget_template.pdf", "default-grant-doc.pdf"):
+    shutil.copy(_SEED_UPLOADS / seed, _DATA_DIR / "uploads" / seed)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_DATA_DIR, ignore_errors=True)
@@ -0,0 +1,115 @@
+import uuid
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from google.genai import types
+
+from app.main import app
+from app.scripts import ai
+
+
+def fresh_questions(count):
+    """Questions nothing is cached or indexed for."""
+    return [f"{uuid.uuid4().hex} {uuid.uuid4().hex}?" for _ in range(count)]
+
+
+def text_response(text):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))]
+    )
+
+
+@pytest.fixture
+def model_calls(monkeypatch):
+    """Operation of every model call, in order."""
+    calls = []
+    generate = ai.generate_content_async
+
+    async def counted_generate(client, operation, validate=None, **request):
+        calls.append(operation)
+        return await generate(client, operation, validate=validate, **request)
+
+    monkeypatch.setattr(ai, "generate_content_async", counted_generate)
+    return calls
+
+
+def test_batch_breaks_down_questions_in_one_call(model_calls):
+    questions = fresh_questions(3)
+
+    results = asyncio.run(ai.break_down_questions_async(questions, batch_size=3))
+
+    assert model_calls == ["batch_breakdown"]
+    assert len(results) == 3 and all(results)
+    assert asyncio.run(ai.break_down_questions_async(questions, batch_size=3)) == results
+    assert model_calls == ["batch_breakdown"]
+
+
+def test_questions_the_batch_misses_fall_back_to_single_calls(model_calls, monkeypatch):
+    parse = ai._parse_batch_breakdown
+    monkeypatch.setattr(ai, "_parse_batch_breakdown", lambda response, count: [[]] + parse(response, count)[1:])
+
+    results = asyncio.run(ai.break_down_questions_async(fresh_questions(3), batch_size=3))
+
+    assert model_calls == ["batch_breakdown", "breakdown"]
+    assert all(results)
+
+
+def test_batch_raises_model_unavailable(monkeypatch):
+    generate = ai.generate_content_async
+
+    async def batch_unavailable(client, operation, validate=None, **request):
+        if operation == "batch_breakdown":
+            raise ai.ModelUnavailable("circuit open", retry_after=5)
+        return await generate(client, operation, validate=validate, **request)
+
+    monkeypatch.setattr(ai, "generate_content_async", batch_unavailable)
+
+    with pytest.raises(ai.ModelUnavailable):
+        asyncio.run(ai.break_down_questions_async(fresh_questions(2), batch_size=2))
+
+
+def test_route_breaks_down_a_list_in_order():
+    questions = fresh_questions(3)
+    with TestClient(app) as client:
+        response = client.post("/api/break_down_question", json={"questions": questions})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["question"] for result in results] == questions
+    assert all(result["sub_questions"] for result in results)
+
+
+def test_route_reports_model_unavailable_for_a_list(monkeypatch):
+    async def unavailable(client, operation, validate=None, **request):
+        raise ai.ModelUnavailable("circuit open", retry_after=5)
+
+    monkeypatch.setattr(ai, "generate_content_async", unavailable)
+    with TestClient(app) as client:
+        response = client.post("/api/break_down_question", json={"questions": fresh_questions(2)})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+
+
+def test_combined_extraction_failing_validation_is_not_used(tmp_path, model_calls, monkeypatch):
+    document = tmp_path / "grant.pdf"
+    document.write_bytes(uuid.uuid4().bytes)
+    content = f"{uuid.uuid4().hex} narrative questions"
+    generate = ai.generate_content_async
+
+    async def invalid_combined(client, operation, validate=None, **request):
+        if operation == "combined_extraction":
+            model_calls.append(operation)
+            return text_response('{"questions": [{"question": "What?"}]}')
+        return await generate(client, operation, validate=validate, **request)
+
+    monkeypatch.setattr(ai, "_grant_document_path", lambda grant_id: document)
+    monkeypatch.setattr(ai, "_extraction_inputs", lambda file_bytes: [(0, 1, content)])
+    monkeypatch.setattr(ai, "generate_content_async", invalid_combined)
+
+    assert asyncio.run(ai.extract_and_break_down_async("grant")) is None
+    assert asyncio.run(ai.extract_and_break_down_async("grant")) is None
+    assert model_calls == ["combined_extraction", "combined_extraction"]
+    assert asyncio.run(ai.extract_narrative_questions_async("grant"))
+    assert model_calls[-1] == "extraction"
@@ -0,0 +1,119 @@
+import os
+import time
+import asyncio
+
+import pytest
+from google.genai import types
+
+from app.scripts import documents
+from app.scripts.documents import DocumentRegistry, DocumentUnavailable
+from app.scripts.fake_backend import FakeClient
+
+
+@pytest.fixture
+def client():
+    return FakeClient(latency_seconds=0)
+
+
+@pytest.fixture
+def registry(client):
+    return DocumentRegistry(lambda: client, expiry_margin_seconds=3600)
+
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / "context.pdf"
+    path.write_bytes(b"%PDF-1.4 context")
+    return path
+
+
+def test_uploads_once_and_reuses_handle(registry, client, document):
+    first = registry.get_part(document, "application/pdf")
+    second = registry.get_part(document, "application/pdf")
+
+    assert first.file_data.file_uri == second.file_data.file_uri
+    assert client.backend.uploads == 1
+    assert registry.stats()["reuses"] == 1
+
+
+def test_async_uploads_are_shared(registry, client, document):
+    async def draft_all():
+        return await asyncio.gather(*(registry.get_part_async(document, "application/pdf") for _ in range(5)))
+
+    parts = asyncio.run(draft_all())
+
+    assert len({part.file_data.file_uri for part in parts}) == 1
+    assert client.backend.uploads == 1
+
+
+def test_finished_upload_keeps_a_newer_upload_lock(registry, client, document, monkeypatch):
+    upload = client.backend._file
+    newer = asyncio.Lock()
+
+    def replaced_lock(file, config):
+        # Another upload of the file started after this one's lock was released
+        registry._upload_locks[next(iter(registry._upload_locks))] = newer
+        return upload(file, config)
+
+    monkeypatch.setattr(client.backend, "_file", replaced_lock)
+    asyncio.run(registry.get_part_async(document, "application/pdf"))
+
+    assert list(registry._upload_locks.values()) == [newer]
+
+
+def test_reuploads_near_expiry_and_deletes_old_file(registry, client, document, monkeypatch):
+    first = registry.get_part(document, "application/pdf")
+    later = time.time() + documents.DEFAULT_FILE_LIFETIME_SECONDS - 60
+    monkeypatch.setattr(documents.time, "time", lambda: later)
+
+    second = registry.get_part(document, "application/pdf")
+
+    assert second.file_data.file_uri != first.file_data.file_uri
+    assert client.backend.uploads == 2
+    assert client.backend.deleted_files == [first.file_data.file_uri.removeprefix("fake://")]
+
+
+def test_reuploads_when_file_changes(registry, client, document):
+    first = registry.get_part(document, "application/pdf")
+    stat = document.stat()
+    os.utime(document, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    second = asyncio.run(registry.get_part_async(document, "application/pdf"))
+
+    assert second.file_data.file_uri != first.file_data.file_uri
+    assert client.backend.uploads == 2
+    assert len(client.backend.deleted_files) == 1
+    assert registry.stats()["documents"] == 1
+
+
+def test_failed_processing_raises_and_is_not_cached(registry, client, document, monkeypatch):
+    upload = client.backend._file
+
+    def failed(file, config):
+        return upload(file, config).model_copy(update={"state": types.FileState.FAILED})
+
+    monkeypatch.setattr(client.backend, "_file", failed)
+    with pytest.raises(DocumentUnavailable):
+        registry.get_part(document, "application/pdf")
+    with pytest.raises(DocumentUnavailable):
+        asyncio.run(registry.get_part_async(document, "application/pdf"))
+
+    assert registry.stats()["documents"] == 0
+    assert len(client.backend.deleted_files) == 2
+
+    monkeypatch.setattr(client.backend, "_file", upload)
+    registry.get_part(document, "application/pdf")
+    assert registry.stats()["documents"] == 1
+
+
+def test_processing_timeout_raises(registry, client, document, monkeypatch):
+    upload = client.backend._file
+    monkeypatch.setattr(
+        client.backend, "_file",
+        lambda file, config: upload(file, config).model_copy(update={"state": types.FileState.PROCESSING}),
+    )
+    monkeypatch.setattr(documents, "PROCESSING_TIMEOUT_SECONDS", 0)
+
+    with pytest.raises(DocumentUnavailable):
+        registry.get_part(document, "application/pdf")
+    assert registry.stats()["documents"] == 0
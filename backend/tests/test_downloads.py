@@ -0,0 +1,96 @@
+import uuid
+import asyncio
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app import downloads
+from app.main import app
+
+
+@pytest.fixture
+def stored_file():
+    """(client, content URL, bytes) of a freshly uploaded text file."""
+    text = f"Budget narrative {uuid.uuid4().hex}. " * 20
+    with TestClient(app) as client:
+        response = client.post("/api/upload_text", json={"text": text, "filename": "notes.txt"})
+        yield client, f"/api/files/{response.json()['file_id']}/content", text.encode("utf-8")
+
+
+def test_full_get(stored_file):
+    client, url, data = stored_file
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["etag"] == f'"{hashlib.sha256(data).hexdigest()}"'
+    assert response.headers["accept-ranges"] == "bytes"
+    assert "immutable" in response.headers["cache-control"]
+
+
+def test_range_is_partial(stored_file):
+    client, url, data = stored_file
+    response = client.get(url, headers={"Range": "bytes=10-19"})
+
+    assert response.status_code == 206
+    assert response.content == data[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(data)}"
+
+
+def test_matching_if_none_match_is_not_modified(stored_file):
+    client, url, data = stored_file
+    etag = client.get(url).headers["etag"]
+    response = client.get(url, headers={"If-None-Match": f'"other", W/{etag}'})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_current_if_range_keeps_the_range(stored_file):
+    client, url, data = stored_file
+    etag = client.get(url).headers["etag"]
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+
+    assert response.status_code == 206
+    assert response.content == data[:10]
+
+
+def test_stale_if_range_sends_the_full_body(stored_file):
+    client, url, data = stored_file
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+
+    assert response.status_code == 200
+    assert response.content == data
+
+
+def test_head_sends_headers_only(stored_file):
+    client, url, data = stored_file
+    response = client.head(url)
+
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["content-length"] == str(len(data))
+
+
+def test_full_get_uses_pathsend_when_the_server_offers_it(tmp_path):
+    path = tmp_path / "grant.pdf"
+    path.write_bytes(b"%PDF-1.7 grant")
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    def respond(headers):
+        scope = {"type": "http", "method": "GET", "headers": headers, "extensions": {"http.response.pathsend": {}}}
+        request = Request(scope)
+        response = downloads.document_response({"content_type": "application/pdf"}, path, "abc", request)
+        messages.clear()
+        asyncio.run(response(scope, None, send))
+        return [message["type"] for message in messages]
+
+    assert respond([]) == ["http.response.start", "http.response.pathsend"]
+    assert messages[1]["path"] == str(path)
+    assert respond([(b"range", b"bytes=0-3")])[-1] == "http.response.body"
@@ -0,0 +1,73 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.scripts import ai
+
+OUTLINE = {"sections": [{"name": "Workforce", "description": "Training partners and outcomes."}]}
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def upload_text(client, grant_id, text):
+    response = client.post("/api/upload_text", json={"text": text, "grant_id": grant_id, "filename": f"{uuid.uuid4()}.txt"})
+    assert response.status_code == 200
+    client.portal.call(ai.stale_draft_checker.join)
+    return response.json()
+
+
+def draft(client, grant_id, question):
+    response = client.post("/api/generate_response", json={"question": question, "outline": OUTLINE, "grant_id": grant_id})
+    assert response.status_code == 200
+    return response.json()["draft"]
+
+
+def stored(client, grant_id, draft_id):
+    drafts = client.get(f"/api/grants/{grant_id}/drafts").json()["drafts"]
+    return next(item for item in drafts if item["id"] == draft_id)
+
+
+def test_upload_does_not_plan_context(client, monkeypatch):
+    grant_id = str(uuid.uuid4())
+    upload_text(client, grant_id, "Our workforce training program partners with the county college.")
+    first = draft(client, grant_id, "Describe your workforce training partners.")
+
+    def no_planning(*args, **kwargs):
+        raise AssertionError("context planned during the upload")
+
+    monkeypatch.setattr(ai, "plan_response_context_async", no_planning)
+    monkeypatch.setattr(ai.stale_draft_checker, "schedule", lambda drafts: None)
+    response = client.post("/api/upload_text", json={"text": "Budget narrative.", "grant_id": grant_id})
+
+    assert response.json()["stale_drafts"] == 1
+    assert stored(client, grant_id, first["id"])["stale"] is True
+
+
+def test_background_check_keeps_unaffected_drafts_fresh(client):
+    grant_id = str(uuid.uuid4())
+    upload_text(client, grant_id, "Our workforce training program partners with the county college.")
+    first = draft(client, grant_id, "Describe your workforce training partners.")
+
+    # Marked stale as on an upload, though none of its documents changed
+    assert ai.mark_stale_drafts(grant_id)
+    assert stored(client, grant_id, first["id"])["stale"] is True
+    assert client.portal.call(ai.stale_draft_checker.check, stored(client, grant_id, first["id"])) is False
+    assert stored(client, grant_id, first["id"])["stale"] is False
+
+
+def test_background_check_marks_affected_drafts_stale(client):
+    grant_id = str(uuid.uuid4())
+    upload_text(client, grant_id, "Our workforce training program partners with the county college.")
+    first = draft(client, grant_id, "Describe your workforce training partners.")
+
+    upload_text(client, grant_id, "Workforce training partners also include the regional hospital.")
+
+    assert stored(client, grant_id, first["id"])["stale"] is True
+    again = draft(client, grant_id, "Describe your workforce training partners.")
+    assert again["cached"] is False and again["version"] == 2
@@ -0,0 +1,58 @@
+import uuid
+import asyncio
+
+import pytest
+
+from app.scripts import ai
+
+
+@pytest.fixture
+def sharded_document(tmp_path, monkeypatch):
+    """A grant document that extracts as three page windows of text, one of which fails for now."""
+    document = tmp_path / "grant.pdf"
+    document.write_bytes(uuid.uuid4().bytes)
+    tag = uuid.uuid4().hex
+    shards = [(0, 25, f"{tag} pages one"), (23, 50, f"{tag} pages two"), (48, 60, f"{tag} pages three")]
+    failing = {shards[1][2]}
+    model_calls = []
+    extract = ai._extract_from_content_async
+    generate = ai.generate_content_async
+
+    async def flaky_extract(content):
+        if content in failing:
+            raise RuntimeError("invalid JSON")
+        return await extract(content)
+
+    async def counted_generate(client, operation, validate=None, **request):
+        model_calls.append(operation)
+        return await generate(client, operation, validate=validate, **request)
+
+    monkeypatch.setattr(ai, "_grant_document_path", lambda grant_id: document)
+    monkeypatch.setattr(ai, "_extraction_inputs", lambda file_bytes: shards)
+    monkeypatch.setattr(ai, "_extract_from_content_async", flaky_extract)
+    monkeypatch.setattr(ai, "generate_content_async", counted_generate)
+    return document, failing, model_calls
+
+
+def test_failed_shard_is_reported_and_not_cached(sharded_document):
+    document, failing, model_calls = sharded_document
+
+    with pytest.raises(ai.PartialExtraction) as partial:
+        asyncio.run(ai.extract_narrative_questions_async("grant"))
+
+    assert partial.value.failed_pages == [(24, 50)]
+    assert partial.value.questions
+    assert len(model_calls) == 2
+    assert ai.llm_cache.get(ai._extraction_cache_key(document.read_bytes())) is None
+
+
+def test_retry_only_resends_failed_shards(sharded_document):
+    document, failing, model_calls = sharded_document
+    with pytest.raises(ai.PartialExtraction):
+        asyncio.run(ai.extract_narrative_questions_async("grant"))
+
+    failing.clear()
+    questions = asyncio.run(ai.extract_narrative_questions_async("grant"))
+
+    assert len(model_calls) == 3
+    assert ai.llm_cache.get(ai._extraction_cache_key(document.read_bytes())) == questions
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+from google.genai import errors
+
+from app.scripts.gateway import ModelGateway, ModelUnavailable
+
+
+def server_error():
+    return errors.ServerError(503, {"error": {"code": 503, "message": "down", "status": "UNAVAILABLE"}})
+
+
+@pytest.fixture
+def gateway():
+    # One failure opens the circuit; it is half-open again straight away
+    return ModelGateway(rate_per_second=0, burst=1, attempts=1, failure_threshold=1, reset_seconds=0)
+
+
+def open_circuit(gateway):
+    def failing():
+        raise server_error()
+
+    with pytest.raises(ModelUnavailable):
+        gateway.call(None, "test", failing)
+    assert gateway.breaker.state == "half_open"
+
+
+def test_cancelled_half_open_probe_releases_the_circuit(gateway):
+    open_circuit(gateway)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hanging():
+            started.set()
+            await asyncio.sleep(3600)
+
+        async def ok():
+            return "ok"
+
+        probe = asyncio.ensure_future(gateway.call_async(None, "test", hanging))
+        await started.wait()
+        # The probe holds the half-open slot: other calls fail fast meanwhile
+        with pytest.raises(ModelUnavailable):
+            await gateway.call_async(None, "test", ok)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await gateway.call_async(None, "test", ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert gateway.breaker.state == "closed"
+
+
+def test_interrupted_sync_probe_releases_the_circuit(gateway):
+    open_circuit(gateway)
+
+    class Interrupted(BaseException):
+        pass
+
+    def interrupted():
+        raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        gateway.call(None, "test", interrupted)
+    assert gateway.call(None, "test", lambda: "ok") == "ok"
+    assert gateway.breaker.state == "closed"
+
+
+def test_cancelled_coalesced_waiter_does_not_cancel_shared_call(gateway):
+    async def scenario():
+        release = asyncio.Event()
+        calls = 0
+
+        async def slow():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "shared"
+
+        first = asyncio.ensure_future(gateway.call_async("key", "test", slow))
+        second = asyncio.ensure_future(gateway.call_async("key", "test", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        return await second, calls
+
+    assert asyncio.run(scenario()) == ("shared", 1)
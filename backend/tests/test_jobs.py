@@ -0,0 +1,121 @@
+import time
+import uuid
+import asyncio
+
+from app import config, jobs
+from app.database import add_file_metadata, add_to_grants_database, load_grant, load_job, update_job
+from app.scripts import ai
+
+
+def queued_job() -> dict:
+    grant_id = str(uuid.uuid4())
+    add_to_grants_database({"id": grant_id, "name": "Test grant", "questions": [], "status": jobs.GRANT_UPLOADING})
+    file_metadata = {
+        "id": str(uuid.uuid4()),
+        "original_name": "default-grant-doc.pdf",
+        "stored_name": "default-grant-doc.pdf",
+        "content_type": "application/pdf",
+        "doc_role": "grant",
+        "upload_timestamp": time.time(),
+        "grant_id": grant_id,
+    }
+    add_file_metadata(file_metadata)
+    return jobs.create_ingestion_job(grant_id, file_metadata)
+
+
+def crashed_job(**fields) -> dict:
+    """A job left running by a worker process that died."""
+    job = queued_job()
+    update_job(job["id"], expected_state=jobs.JOB_QUEUED, state=jobs.JOB_RUNNING, stage=jobs.GRANT_EXTRACTING, **fields)
+    time.sleep(0.01)
+    return job
+
+
+async def run_queue(job_ids=()) -> None:
+    queue = jobs.IngestionQueue()
+    await queue.start(workers=1)
+    for job_id in job_ids:
+        queue.enqueue(job_id)
+    await queue.join()
+    await queue.stop()
+
+
+def test_stopping_mid_job_requeues_it(monkeypatch):
+    job = queued_job()
+    started = asyncio.Event()
+
+    async def hang(grant_id):
+        started.set()
+        await asyncio.sleep(3600)
+
+    async def stop_mid_job():
+        monkeypatch.setattr(ai, "extract_and_break_down_async", hang)
+        queue = jobs.IngestionQueue()
+        await queue.start(workers=1)
+        queue.enqueue(job["id"])
+        await asyncio.wait_for(started.wait(), 30)
+        await queue.stop()
+
+    asyncio.run(stop_mid_job())
+    assert load_job(job["id"])["state"] == jobs.JOB_QUEUED
+    assert load_grant(job["grant_id"])["status"] == jobs.GRANT_UPLOADING
+
+    monkeypatch.undo()
+    asyncio.run(run_queue())
+    assert load_job(job["id"])["state"] == jobs.JOB_SUCCEEDED
+    assert load_grant(job["grant_id"])["status"] == jobs.GRANT_READY
+
+
+def test_running_job_with_live_lease_is_left_alone():
+    job = crashed_job()
+    assert job["id"] not in jobs.recover_stale_jobs()
+    assert load_job(job["id"])["state"] == jobs.JOB_RUNNING
+    update_job(job["id"], state=jobs.JOB_FAILED)
+
+
+def test_job_with_expired_lease_is_requeued_and_run(monkeypatch):
+    job = crashed_job()
+    monkeypatch.setattr(config, "INGESTION_JOB_LEASE_SECONDS", 0)
+
+    assert job["id"] in jobs.recover_stale_jobs()
+    assert load_job(job["id"])["recoveries"] == 1
+    assert load_grant(job["grant_id"])["status"] == jobs.GRANT_UPLOADING
+
+    monkeypatch.undo()
+    asyncio.run(run_queue())
+    assert load_job(job["id"])["state"] == jobs.JOB_SUCCEEDED
+
+
+def test_job_that_keeps_crashing_is_failed(monkeypatch):
+    job = crashed_job(recoveries=config.INGESTION_MAX_ATTEMPTS)
+    monkeypatch.setattr(config, "INGESTION_JOB_LEASE_SECONDS", 0)
+
+    assert job["id"] not in jobs.recover_stale_jobs()
+    assert load_job(job["id"])["state"] == jobs.JOB_FAILED
+    grant = load_grant(job["grant_id"])
+    assert grant["status"] == jobs.GRANT_FAILED
+    assert "worker stopped" in grant["error"]
+
+
+
+def test_combined_extraction_failing_validation_falls_back(monkeypatch):
+    job = queued_job()
+    content = f"{uuid.uuid4().hex} narrative questions"
+    operations = []
+    generate = ai.generate_content_async
+
+    async def invalid_combined(client, operation, validate=None, **request):
+        operations.append(operation)
+        if operation == "combined_extraction":
+            request["config"] = None
+        return await generate(client, operation, validate=validate, **request)
+
+    monkeypatch.setattr(config, "COMBINED_INGESTION", True)
+    monkeypatch.setattr(ai, "_extraction_inputs", lambda file_bytes: [(0, 1, content)])
+    monkeypatch.setattr(ai, "generate_content_async", invalid_combined)
+    asyncio.run(run_queue([job["id"]]))
+
+    assert operations[:2] == ["combined_extraction", "extraction"]
+    assert load_job(job["id"])["state"] == jobs.JOB_SUCCEEDED
+    questions = load_grant(job["grant_id"])["questions"]
+    assert questions and all(item["sub_questions"] for item in questions)
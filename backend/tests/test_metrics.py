@@ -0,0 +1,138 @@
+import asyncio
+import threading
+
+import pytest
+
+from app import metrics, profiling
+
+
+def in_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_counter_sums_per_thread_shards():
+    counter = metrics.Counter("jobs_total", "Jobs.", ("state",))
+
+    def work():
+        for _ in range(1000):
+            counter.inc(state="done")
+        counter.inc(2.5, state="failed")
+
+    in_threads(4, work)
+
+    assert len(counter._shards) == 4
+    assert counter.samples() == {("done",): 4000, ("failed",): 10.0}
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("latency_seconds", "Latency.", ("route",), buckets=(1.0, 0.1))
+
+    def work():
+        histogram.observe(0.05, route="/a")
+        histogram.observe(0.5, route="/a")
+        histogram.observe(5, route="/a")
+
+    in_threads(2, work)
+
+    assert histogram.render() == [
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1"} 4',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 6',
+        'latency_seconds_sum{route="/a"} 11.1',
+        'latency_seconds_count{route="/a"} 6',
+    ]
+
+
+def test_registry_renders_prometheus_text():
+    registry = metrics.Registry()
+    registry.counter("uploads_total", "Uploads.", ("name",)).inc(name='a "quoted"\nname')
+    registry.gauge("in_flight", "In flight.").dec(2)
+
+    def failing():
+        raise RuntimeError("collector broke")
+
+    registry.register_collector(failing)
+    registry.register_collector(lambda: [("cache_hits_total", "counter", "Hits.", [({}, 3), ({"cache": "llm"}, 1.5)])])
+
+    assert registry.render() == "\n".join([
+        "# HELP uploads_total Uploads.",
+        "# TYPE uploads_total counter",
+        'uploads_total{name="a \\"quoted\\"\\nname"} 1',
+        "# HELP in_flight In flight.",
+        "# TYPE in_flight gauge",
+        "in_flight -2",
+        "# HELP cache_hits_total Hits.",
+        "# TYPE cache_hits_total counter",
+        "cache_hits_total 3",
+        'cache_hits_total{cache="llm"} 1.5',
+    ]) + "\n"
+
+
+def outcomes(function):
+    samples = {}
+    for snapshot in metrics.ai_call_duration._snapshots():
+        for (name, outcome), entry in snapshot.items():
+            if name == function:
+                samples[outcome] = samples.get(outcome, 0) + sum(entry[:-1])
+    return samples
+
+
+def test_timed_sync_function():
+    @metrics.timed("test_sync")
+    def divide(a, b):
+        return a / b
+
+    assert divide(1, 2) == 0.5
+    with pytest.raises(ZeroDivisionError):
+        divide(1, 0)
+
+    assert divide.__name__ == "divide"
+    assert outcomes("test_sync") == {"ok": 1, "error": 1}
+
+
+def test_timed_coroutine_records_request_span():
+    @metrics.timed("test_coroutine")
+    async def wait():
+        await asyncio.sleep(0)
+        return "done"
+
+    async def request():
+        spans = []
+        token = profiling._request_spans.set(spans)
+        try:
+            return await wait(), spans
+        finally:
+            profiling._request_spans.reset(token)
+
+    result, spans = asyncio.run(request())
+
+    assert result == "done"
+    assert [name for name, _ in spans] == ["ai.test_coroutine"]
+    assert outcomes("test_coroutine") == {"ok": 1}
+
+
+def test_timed_async_generator():
+    closed = []
+
+    @metrics.timed("test_generator")
+    async def count(n):
+        try:
+            for i in range(n):
+                yield i
+        finally:
+            closed.append(n)
+
+    async def consume():
+        assert [i async for i in count(3)] == [0, 1, 2]
+        stream = count(10)
+        assert await stream.__anext__() == 0
+        await stream.aclose()
+
+    asyncio.run(consume())
+
+    assert closed == [3, 10]
+    assert outcomes("test_generator") == {"ok": 1, "closed": 1}
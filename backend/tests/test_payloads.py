@@ -0,0 +1,100 @@
+import gzip
+import uuid
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import payloads
+from app.database import add_to_grants_database
+from app.main import app
+
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    class Brotli:
+        @staticmethod
+        def compress(body, quality):
+            return b"br:" + body
+
+    monkeypatch.setattr(payloads, "brotli", Brotli)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("gzip", "gzip"),
+    ("GZIP, deflate", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip; q=0.001", "gzip"),
+    ("gzip;q=bad", None),
+    ("identity;q=0, gzip", "gzip"),
+    ("identity;q=0", None),
+    ("*", "gzip"),
+    ("*;q=0.5, gzip;q=0", None),
+    ("br", None),
+])
+def test_choose_encoding(header, expected):
+    assert payloads.choose_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0.8, gzip;q=0.5", "br"),
+    ("br;q=0, gzip;q=0.1", "gzip"),
+    ("gzip;q=0.5, *", "br"),
+    ("identity;q=0, br", "br"),
+])
+def test_choose_encoding_with_brotli(with_brotli, header, expected):
+    assert payloads.choose_encoding(header) == expected
+
+
+def test_response_cache_serves_only_the_current_revision():
+    cache = payloads.ResponseCache(max_entries=2)
+    cache.set("grants", 1, (b"[]", None))
+
+    assert cache.get("grants", 1) == (b"[]", None)
+    assert cache.get("grants", 2) is None
+    cache.set("grants", 2, (b"[1]", None))
+    assert cache.get("grants", 1) is None
+    assert cache.get("grants", 2) == (b"[1]", None)
+
+    cache.set("files", 1, (b"[]", None))
+    cache.get("grants", 2)
+    cache.set("drafts", 1, (b"[]", None))
+    assert cache.get("files", 1) is None
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 3}
+
+
+def test_cached_json_rebuilds_after_a_revision_bump(monkeypatch):
+    monkeypatch.setattr(payloads, "response_cache", payloads.ResponseCache())
+    revision, builds = [1], []
+
+    def build():
+        builds.append(revision[0])
+        return b'{"rows":[' + b",".join(b'"row"' for _ in range(200)) + b"]}"
+
+    def respond(accept_encoding="gzip"):
+        return asyncio.run(payloads.cached_json("rows", lambda: revision[0], build, accept_encoding))
+
+    first, second = respond(), respond()
+    assert builds == [1]
+    assert first.headers["content-encoding"] == "gzip" and second.body == first.body
+    assert gzip.decompress(first.body) == build()
+
+    revision[0] = 2
+    respond()
+    respond(None)
+    assert builds == [1, 1, 2, 2]
+
+
+def test_grant_listing_reflects_new_grants():
+    with TestClient(app) as client:
+        before = client.get("/api/all_grants", params={"view": "summary"}).json()["grants"]
+        grant_id = str(uuid.uuid4())
+        add_to_grants_database({"id": grant_id, "name": "New grant", "status": "ready", "questions": []})
+        after = client.get("/api/all_grants", params={"view": "summary"}).json()["grants"]
+
+    assert grant_id not in [grant["id"] for grant in before]
+    assert grant_id in [grant["id"] for grant in after]
@@ -0,0 +1,54 @@
+from app import metrics
+from app.scripts import ai
+from app.scripts.pdf_text import PDF_TOKENS_PER_PAGE, DocumentText
+
+
+def document(words_per_page: int, scanned: bool = False) -> DocumentText:
+    return DocumentText(sha256="0" * 64, pages=["grant " * words_per_page] * 3, scanned=scanned, pdf_bytes=90_000)
+
+
+def test_sparse_pages_are_sent_as_text():
+    sparse = document(100)
+
+    assert sparse.use_text
+    report = sparse.report()
+    assert report["sent_as"] == "text"
+    assert report["tokens_saved_estimate"] > 0
+
+
+def test_dense_pages_are_sent_as_pdf():
+    dense = document(PDF_TOKENS_PER_PAGE)
+
+    assert dense.text_tokens_estimate > dense.pdf_tokens_estimate
+    assert not dense.use_text
+    report = dense.report()
+    assert report["sent_as"] == "pdf"
+    assert report["tokens_saved_estimate"] == 0
+    assert report["bytes_saved"] == 0
+
+
+def test_scanned_pages_are_sent_as_pdf():
+    assert not document(10, scanned=True).use_text
+
+
+def test_prompts_carry_the_cheaper_form(monkeypatch):
+    monkeypatch.setattr(ai.document_texts, "get", lambda file_bytes: document(PDF_TOKENS_PER_PAGE))
+    assert ai._document_content(b"%PDF dense") == b"%PDF dense"
+
+    monkeypatch.setattr(ai.document_texts, "get", lambda file_bytes: document(100))
+    assert ai._document_content(b"%PDF sparse").startswith("--- Page 1 ---")
+
+
+def test_preprocessing_is_counted_not_printed(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "grant.pdf"
+    path.write_bytes(b"%PDF sparse")
+    monkeypatch.setattr(ai, "_upload_path", lambda file_metadata: path)
+    monkeypatch.setattr(ai.document_texts, "get_path", lambda file_path: document(100))
+    sent_as_text = metrics.documents_preprocessed.samples().get(("text",), 0)
+    tokens_saved = metrics.preprocessing_tokens_saved.samples().get((), 0)
+
+    report = ai.preprocess_document({"content_type": "application/pdf"})
+
+    assert capsys.readouterr().out == ""
+    assert metrics.documents_preprocessed.samples()[("text",)] == sent_as_text + 1
+    assert metrics.preprocessing_tokens_saved.samples()[()] == tokens_saved + report["tokens_saved_estimate"]
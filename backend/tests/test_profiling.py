@@ -0,0 +1,78 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import config, profiling
+
+TOKEN = "s3cret-token"
+
+
+async def list_grants(request):
+    with profiling.span("db_read"):
+        pass
+    with profiling.span("db_read"):
+        pass
+    return PlainTextResponse("ok")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "PROFILE_TOKEN", TOKEN)
+    monkeypatch.setattr(config, "PROFILE_DIR", tmp_path / "profiles")
+    monkeypatch.setattr(config, "SERVER_TIMING", False)
+    app = profiling.ProfilingMiddleware(Starlette(routes=[Route("/grants", list_grants)]))
+    return TestClient(app)
+
+
+def scope(headers=(), query_string=b""):
+    return {"type": "http", "headers": list(headers), "query_string": query_string}
+
+
+def test_token_gate(monkeypatch):
+    monkeypatch.setattr(config, "PROFILE_TOKEN", TOKEN)
+
+    assert profiling._profile_requested(scope([(b"X-Profile", TOKEN.encode())]))
+    assert profiling._profile_requested(scope(query_string=f"profile={TOKEN}".encode()))
+    assert not profiling._profile_requested(scope())
+    assert not profiling._profile_requested(scope([(b"x-profile", b"s3cret")]))
+    assert not profiling._profile_requested(scope(query_string=b"profile="))
+    # A wrong header is not rescued by a right query parameter
+    assert not profiling._profile_requested(scope([(b"x-profile", b"wrong")], f"profile={TOKEN}".encode()))
+
+    monkeypatch.setattr(config, "PROFILE_TOKEN", None)
+    assert not profiling._profile_requested(scope([(b"x-profile", b"")]))
+    assert not profiling._profile_requested(scope(query_string=b"profile=None"))
+
+
+def test_profiled_request_writes_stats(client):
+    response = client.get("/grants", headers={"X-Profile": TOKEN})
+
+    assert response.status_code == 200
+    profile_file = config.PROFILE_DIR / response.headers["x-profile-file"]
+    assert profile_file.is_file() and profile_file.name.endswith("-GET-grants.prof")
+    assert response.headers["server-timing"].startswith('db_read;dur=')
+    assert 'desc="x2"' in response.headers["server-timing"]
+
+
+def test_requests_without_the_token_are_not_profiled(client):
+    for headers in ({}, {"X-Profile": "guess"}):
+        response = client.get("/grants", headers=headers)
+        assert response.status_code == 200
+        assert "x-profile-file" not in response.headers
+        assert "server-timing" not in response.headers
+    assert not config.PROFILE_DIR.exists()
+
+
+def test_server_timing_without_profiling(client, monkeypatch):
+    monkeypatch.setattr(config, "SERVER_TIMING", True)
+    response = client.get("/grants")
+
+    assert "x-profile-file" not in response.headers
+    assert [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")] == ["db_read", "total"]
+
+
+def test_server_timing_sums_repeated_spans():
+    header = profiling.server_timing([("db read", 0.001), ("db read", 0.002), ("total", 0.01)])
+    assert header == 'db_read;dur=3.0;desc="x2", total;dur=10.0'
@@ -0,0 +1,88 @@
+import uuid
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database import add_to_grants_database
+from app.scripts import ai
+from app.scripts.question_index import QuestionIndex
+
+QUESTIONS = [
+    {"question": "Describe the workforce training partners of the project.", "sub_questions": ["Who are the partners?"]},
+    {"question": "What is the total project budget and local match?", "sub_questions": ["What is the budget?"]},
+    {"question": "How will outcomes be measured and reported?", "sub_questions": ["Which metrics?"]},
+]
+
+
+def topic():
+    """A word no other test's questions contain, so searches only see this test's grants."""
+    return f"x{uuid.uuid4().hex}"
+
+
+def test_set_grant_updates_in_place():
+    index = QuestionIndex()
+    index.set_grant("a", QUESTIONS)
+    features = index.stats()["features"]
+    rows = dict(index._rows["a"])
+
+    updated = [dict(QUESTIONS[0], sub_questions=["Which colleges take part?"])] + QUESTIONS[1:]
+    index.set_grant("a", updated)
+
+    assert index._rows["a"] == rows
+    assert index.stats() == {"questions": 3, "grants": 1, "features": features, "searches": 0}
+    match = index.search(QUESTIONS[0]["question"], k=1)[0]
+    assert match.sub_questions == ["Which colleges take part?"]
+    assert match.score == 1.0
+
+
+def test_removed_questions_are_not_found_and_compacted():
+    index = QuestionIndex()
+    index.set_grant("a", QUESTIONS)
+    index.set_grant("b", QUESTIONS[:1])
+
+    index.set_grant("a", QUESTIONS[:1])
+    assert QUESTIONS[1]["question"] not in [match.question for match in index.search(QUESTIONS[1]["question"])]
+    assert index._removed == 2 and len(index._entries) == 4
+
+    index.set_grant("b", [])
+    assert index._removed == 0 and len(index._entries) == 1
+    assert index.stats()["grants"] == 1
+    assert [(match.grant_id, match.question) for match in index.search(QUESTIONS[0]["question"])] == [("a", QUESTIONS[0]["question"])]
+
+
+def test_near_identical_question_reuses_breakdown(monkeypatch):
+    word = topic()
+    question = f"Describe the {word} workforce training partners of the project."
+    add_to_grants_database({
+        "id": str(uuid.uuid4()), "name": "Earlier grant", "status": "ready",
+        "questions": [{"question": question, "sub_questions": ["Who are the partners?"]}],
+    })
+
+    async def no_model_call(*args, **kwargs):
+        raise AssertionError("model called for a near-identical question")
+
+    monkeypatch.setattr(ai, "generate_content_async", no_model_call)
+    reworded = f"Please describe the {word} workforce training partners of the project."
+    assert asyncio.run(ai.break_down_question_async(reworded)) == ["Who are the partners?"]
+    assert ai.similar_breakdown(f"What {word} data will the evaluation use?") is None
+
+
+def test_similar_question_of_another_grant_seeds_the_draft():
+    word = topic()
+    question = f"Describe the {word} workforce training partners of the project."
+    earlier, later = str(uuid.uuid4()), str(uuid.uuid4())
+    add_to_grants_database({
+        "id": earlier, "name": "Earlier grant", "status": "ready",
+        "questions": [{"question": question, "sub_questions": ["Who are the partners?"]}],
+    })
+    with TestClient(app) as client:
+        client.post("/api/upload_text", json={"text": "The county college trains our workforce.", "grant_id": earlier, "filename": f"{uuid.uuid4()}.txt"})
+        response = client.post("/api/generate_response", json={"question": question, "outline": {"sections": []}, "grant_id": earlier})
+        client.portal.call(ai.stale_draft_checker.join)
+    answer = response.json()["response"]
+
+    seeds = ai._seed_candidates(later, f"Describe the {word} workforce training partners.")
+    assert len(seeds) == 1
+    assert "Earlier grant" in seeds[0].source and answer in seeds[0].text
+    assert ai._seed_candidates(earlier, question) == []
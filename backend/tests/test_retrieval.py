@@ -0,0 +1,121 @@
+import uuid
+import asyncio
+
+from app.database import add_file_metadata, add_to_grants_database
+from app.scripts import ai
+from app.scripts.context_planner import ContextCandidate, estimate_tokens, pack_context
+from app.scripts.retrieval import GrantIndex, RetrievalIndex
+from app.utils import save_upload_bytes
+
+
+def test_grantless_upload_is_indexed_under_empty_grant_key():
+    blob = asyncio.run(save_upload_bytes(f"Shared county context {uuid.uuid4()}".encode("utf-8"), ".txt"))
+    metadata = {
+        "id": str(uuid.uuid4()),
+        "original_name": "context.txt",
+        "stored_name": blob.stored_name,
+        "content_type": "text/plain",
+        "doc_role": "context",
+        "grant_id": None,
+        "sha256": blob.sha256,
+    }
+    add_file_metadata(metadata)
+
+    assert ai.index_document(metadata) == 1
+    stats = ai.retrieval_index.stats()
+    assert None not in stats
+    assert stats[""] >= 1
+
+
+def test_indexes_pick_up_writes_from_other_workers():
+    # Written straight to the database, as another worker process would, without indexing here
+    grant_id = str(uuid.uuid4())
+    tag = uuid.uuid4().hex
+    question = f"Describe the {tag} watershed restoration partnership and its monitoring plan."
+    add_to_grants_database({
+        "id": grant_id,
+        "name": "Other worker's grant",
+        "status": "ready",
+        "questions": [{"question": question, "sub_questions": ["Who are the partners?", "How is it monitored?"]}],
+    })
+    blob = asyncio.run(save_upload_bytes(f"The {tag} watershed partnership monitors water quality.".encode("utf-8"), ".txt"))
+    add_file_metadata({
+        "id": str(uuid.uuid4()),
+        "original_name": "watershed.txt",
+        "stored_name": blob.stored_name,
+        "content_type": "text/plain",
+        "doc_role": "context",
+        "grant_id": grant_id,
+        "sha256": blob.sha256,
+    })
+
+    assert ai.similar_breakdown(question) == ["Who are the partners?", "How is it monitored?"]
+    candidates = ai._retrieval_candidates(grant_id, [f"{tag} watershed"])
+    assert candidates and tag in candidates[0].text
+
+
+def test_bm25_ranks_rare_and_repeated_terms_first():
+    index = GrantIndex()
+    index.add("budget", "budget.txt", [
+        "The project budget covers staff and equipment.",
+        "The project budget and the budget match are summarised.",
+        "The project timeline has four milestones.",
+        "Watershed monitoring of the project site.",
+    ])
+
+    scores = index.scores("project budget")
+    assert scores[1] > scores[0] > scores[2] > 0
+    # "project" is in every chunk, so it carries far less weight than "watershed"
+    assert index.scores("watershed")[3] > 2 * index.scores("project")[3]
+    assert index.scores("stopwords of the").max() == 0
+
+
+def test_search_ranks_across_queries_and_bounds_k(tmp_path):
+    path = tmp_path / "plan.txt"
+    path.write_text(
+        "Budget and matching funds. " * 5 + "Watershed monitoring and sampling. " * 5 + "Training partners at the college. " * 5
+    )
+    index = RetrievalIndex(chunk_words=4, overlap_words=0)
+    assert index.add_document("grant", "plan", "plan.txt", path, "text/plain") > 3
+
+    chunks = index.search("grant", ["watershed sampling", "college partners"], 50)
+    # Each query's best chunks count, not only those of the query matching most
+    assert any("Watershed" in chunk.text for chunk in chunks) and any("college" in chunk.text for chunk in chunks)
+    assert all("Watershed" in chunk.text or "college" in chunk.text or "sampling" in chunk.text or "partners" in chunk.text for chunk in chunks)
+    assert len(index.search("grant", ["watershed sampling"], 2)) == 2
+    assert index.search("grant", ["watershed"], 0) == []
+    assert index.search("grant", ["watershed"], -1) == []
+    assert index.search("grant", ["unrelated"], 5) == []
+    assert index.search("other grant", ["watershed"], 5) == []
+
+
+def text_candidate(source, text):
+    return ContextCandidate(source=source, key=source, tokens=estimate_tokens(text), text=text)
+
+
+def test_pack_context_stays_within_budget_and_truncates_overflow():
+    relevant = text_candidate("plan.txt", " ".join(
+        f"Section {i} covers {'watershed monitoring partners' if i % 4 == 0 else 'general administration'} in detail."
+        for i in range(200)
+    ))
+    small = text_candidate("notes.txt", "Watershed monitoring notes.")
+    scan = ContextCandidate(source="scan.pdf", key="scan", tokens=500, part=object())
+    budget = relevant.tokens // 2
+
+    plan = pack_context([scan, relevant, small], ["watershed monitoring"], budget, min_excerpt_tokens=50)
+
+    assert plan.context_tokens <= budget
+    status = {item["source"]: item["status"] for item in plan.items}
+    assert status == {"notes.txt": "included", "plan.txt": "truncated", "scan.pdf": "excluded"}
+    excerpt = next(part for part in plan.parts if part.startswith("Section"))
+    assert "[...]" in excerpt
+    # The windows kept are those about the query: denser in it than the whole text
+    assert excerpt.count("watershed") / excerpt.count("Section") > relevant.text.count("watershed") / relevant.text.count("Section")
+
+
+def test_pack_context_excludes_what_no_excerpt_fits():
+    big = text_candidate("plan.txt", "watershed monitoring " * 400)
+    plan = pack_context([big], ["watershed"], 100, min_excerpt_tokens=200)
+
+    assert plan.parts == []
+    assert plan.items[0]["status"] == "excluded" and plan.context_tokens == 0
@@ -0,0 +1,44 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import config
+from app.main import app
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+def upload(client, data, name="budget.txt"):
+    return client.post(
+        "/api/upload_file",
+        files={"file": (name, data, "text/plain")},
+        data={"file_role": "context", "grant_id": str(uuid.uuid4())},
+    )
+
+
+def test_identical_uploads_share_one_blob(client):
+    data = f"Budget narrative {uuid.uuid4().hex}".encode("utf-8")
+    first, second = upload(client, data).json(), upload(client, data, "copy.TXT").json()
+
+    assert first["file_id"] != second["file_id"]
+    assert (first["deduplicated"], second["deduplicated"]) == (False, True)
+    assert first["file_info"]["stored_name"] == second["file_info"]["stored_name"]
+    assert [path.name for path in config.UPLOADS_DIR.glob(f"{first['file_info']['sha256']}*")] == [first["file_info"]["stored_name"]]
+
+
+def test_upload_over_the_limit_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(config, "MAX_UPLOAD_BYTES", 16)
+    monkeypatch.setattr(config, "UPLOAD_CHUNK_BYTES", 8)
+    before = set(config.UPLOADS_DIR.iterdir())
+
+    streamed = upload(client, b"x" * 40)
+    text = client.post("/api/upload_text", json={"text": "y" * 40})
+
+    assert streamed.status_code == 413 and text.status_code == 413
+    assert "16 byte limit" in streamed.json()["detail"]
+    assert set(config.UPLOADS_DIR.iterdir()) == before
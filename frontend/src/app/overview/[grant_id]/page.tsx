@@ -20,13 +20,15 @@ export default async function OverviewPage({ params }: PageProps) {
   let grant: Grant | undefined;
 
   try {
-    const response = await fetch("http://localhost:8000/api/all_grants", {
-      cache: "no-store",
-    });
+    const response = await fetch(
+      `http://localhost:8000/api/grants/${encodeURIComponent(
+        resolvedParams.grant_id
+      )}?view=summary`,
+      { cache: "no-store" }
+    );
     if (response.ok) {
       const data = await response.json();
-      const grants = Array.isArray(data?.grants) ? data.grants : [];
-      grant = grants.find((item: Grant) => item.id === resolvedParams.grant_id);
+      grant = data?.grant ?? undefined;
     }
   } catch (error) {
     grant = undefined;
@@ -1,9 +1,10 @@
 "use client";
 
-import { useEffect, useMemo, useState } from "react";
+import { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import Link from "next/link";
 import { useRouter } from "next/navigation";
 import { Button } from "@/components/ui/button";
+import { ChangeEvent, useChangeFeed } from "@/lib/events";
 
 type Grant = {
   id?: string;
@@ -19,40 +20,58 @@ export default function GrantDashboardPage() {
   const [grants, setGrants] = useState<Grant[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [loadError, setLoadError] = useState<string | null>(null);
+  const isMountedRef = useRef(true);
 
-  useEffect(() => {
-    let isMounted = true;
+  const fetchGrants = useCallback(async () => {
+    try {
+      const response = await fetch("http://localhost:8000/api/all_grants?view=summary");
+      if (!response.ok) {
+        throw new Error("Failed to load grants.");
+      }
+      const data = await response.json();
+      if (isMountedRef.current) {
+        setGrants(Array.isArray(data?.grants) ? data.grants : []);
+        setLoadError(null);
+      }
+    } catch (error) {
+      if (isMountedRef.current) {
+        setLoadError(
+          error instanceof Error ? error.message : "Failed to load grants."
+        );
+      }
+    } finally {
+      if (isMountedRef.current) {
+        setIsLoading(false);
+      }
+    }
+  }, []);
 
-    const fetchGrants = async () => {
-      try {
-        const response = await fetch("http://localhost:8000/api/all_grants");
-        if (!response.ok) {
-          throw new Error("Failed to load grants.");
-        }
-        const data = await response.json();
-        if (isMounted) {
-          setGrants(Array.isArray(data?.grants) ? data.grants : []);
-          setLoadError(null);
-        }
-      } catch (error) {
-        if (isMounted) {
-          setLoadError(
-            error instanceof Error ? error.message : "Failed to load grants."
-          );
-        }
-      } finally {
-        if (isMounted) {
-          setIsLoading(false);
-        }
+  // Apply grant changes pushed by the backend instead of refetching the list
+  const applyChange = useCallback((event: ChangeEvent) => {
+    if (event.type !== "grant.created" && event.type !== "grant.updated") {
+      return;
+    }
+    const change = event.data as Grant & { id: string };
+    setGrants((current) => {
+      const index = current.findIndex((grant) => grant.id === change.id);
+      if (index === -1) {
+        return event.type === "grant.created" ? [...current, change] : current;
       }
-    };
+      const next = [...current];
+      next[index] = { ...next[index], ...change };
+      return next;
+    });
+  }, []);
 
-    fetchGrants();
+  useChangeFeed(applyChange, { onReset: fetchGrants });
 
+  useEffect(() => {
+    isMountedRef.current = true;
+    fetchGrants();
     return () => {
-      isMounted = false;
+      isMountedRef.current = false;
     };
-  }, []);
+  }, [fetchGrants]);
 
   const stats = useMemo(() => {
     const total = grants.length;
@@ -3,6 +3,7 @@
 import { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import Link from "next/link";
 import { Button } from "@/components/ui/button";
+import { ChangeEvent, useChangeFeed } from "@/lib/events";
 
 type FileRecord = {
   id?: string;
@@ -48,6 +49,21 @@ export default function GrantDocumentsPage() {
     }
   }, []);
 
+  // Add files uploaded elsewhere as the backend announces them
+  const applyChange = useCallback((event: ChangeEvent) => {
+    if (event.type !== "file.created") {
+      return;
+    }
+    const file = event.data as FileRecord & { id: string };
+    setFiles((current) =>
+      current.some((existing) => existing.id === file.id)
+        ? current
+        : [...current, file]
+    );
+  }, []);
+
+  useChangeFeed(applyChange, { onReset: fetchFiles });
+
   useEffect(() => {
     isMountedRef.current = true;
     fetchFiles();
@@ -335,12 +351,14 @@ export default function GrantDocumentsPage() {
                         </p>
                       </div>
                       <div className="mt-4 flex items-center justify-between text-sm">
-                        <button
+                        <a
                           className="font-semibold text-[#0d2a2b] hover:underline"
-                          type="button"
+                          href={`http://localhost:8000/api/files/${encodeURIComponent(doc.id)}/content`}
+                          target="_blank"
+                          rel="noopener noreferrer"
                         >
                           Open
-                        </button>
+                        </a>
                         <button
                           className="text-slate-500 hover:text-slate-700"
                           type="button"
@@ -246,33 +246,58 @@ export default function GrantOverviewQuestionsPage({
       };
 
       const response = await fetch(
-        "http://localhost:8000/api/generate_response",
+        "http://localhost:8000/api/generate_response/stream",
         {
           method: "POST",
           headers: { "Content-Type": "application/json" },
           body: JSON.stringify({
             question: question.title,
             outline: outline,
+            grant_id: grantId,
           }),
         }
       );
 
-      if (response.ok) {
-        const data = await response.json();
-        const paragraphs = data.response
-          .split("\n\n")
-          .filter((p: string) => p.trim());
-
-        setQuestions((prev) =>
-          prev.map((q) =>
-            q.id === questionId
-              ? {
-                  ...q,
-                  draftAnswerParagraphs: paragraphs,
-                }
-              : q
-          )
-        );
+      if (response.ok && response.body) {
+        const setDraft = (text: string) => {
+          const paragraphs = text
+            .split("\n\n")
+            .filter((p: string) => p.trim());
+
+          setQuestions((prev) =>
+            prev.map((q) =>
+              q.id === questionId
+                ? {
+                    ...q,
+                    draftAnswerParagraphs: paragraphs,
+                  }
+                : q
+            )
+          );
+        };
+
+        // The endpoint streams NDJSON events: {type: "context" | "delta" | "draft" | "done" | "error"}
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = "";
+        let draft = "";
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffered += decoder.decode(value, { stream: true });
+          const lines = buffered.split("\n");
+          buffered = lines.pop() ?? "";
+          for (const line of lines) {
+            if (!line.trim()) continue;
+            const event = JSON.parse(line);
+            if (event.type === "delta") {
+              draft += event.text;
+              setDraft(draft);
+            } else if (event.type === "error") {
+              console.error("Failed to generate response:", event.detail);
+            }
+          }
+        }
       } else {
         console.error("Failed to generate response");
       }
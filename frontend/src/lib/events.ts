@@ -0,0 +1,76 @@
+"use client";
+
+import { useEffect, useRef } from "react";
+
+export type ChangeEventType =
+  | "grant.created"
+  | "grant.updated"
+  | "file.created"
+  | "job.updated"
+  | "draft.created"
+  | "draft.updated";
+
+export type ChangeEvent = {
+  type: ChangeEventType;
+  data: Record<string, unknown> & { id: string; grant_id?: string };
+};
+
+type ChangeFeedOptions = {
+  // Only receive changes to this grant
+  grantId?: string;
+  // Called when changes were missed (e.g. after a long disconnect); refetch
+  onReset?: () => void;
+};
+
+const EVENT_TYPES: ChangeEventType[] = [
+  "grant.created",
+  "grant.updated",
+  "file.created",
+  "job.updated",
+  "draft.created",
+  "draft.updated",
+];
+
+/**
+ * Subscribe to the backend change feed (/api/events) while the component is
+ * mounted. EventSource reconnects on its own and resumes after the last
+ * event it saw, so handlers only need to apply each change as it arrives.
+ * Open the feed before fetching the initial snapshot and apply changes as
+ * upserts, so nothing published in between is lost.
+ */
+export function useChangeFeed(
+  onEvent: (event: ChangeEvent) => void,
+  { grantId, onReset }: ChangeFeedOptions = {}
+) {
+  const onEventRef = useRef(onEvent);
+  const onResetRef = useRef(onReset);
+  onEventRef.current = onEvent;
+  onResetRef.current = onReset;
+
+  useEffect(() => {
+    const query = grantId ? `?grant_id=${encodeURIComponent(grantId)}` : "";
+    const source = new EventSource(`http://localhost:8000/api/events${query}`);
+
+    const listeners = EVENT_TYPES.map((type) => {
+      const listener = (message: MessageEvent) => {
+        try {
+          onEventRef.current({ type, data: JSON.parse(message.data) });
+        } catch (error) {
+          console.error("Bad change event", error);
+        }
+      };
+      source.addEventListener(type, listener);
+      return [type, listener] as const;
+    });
+    const resetListener = () => onResetRef.current?.();
+    source.addEventListener("reset", resetListener);
+
+    return () => {
+      listeners.forEach(([type, listener]) =>
+        source.removeEventListener(type, listener)
+      );
+      source.removeEventListener("reset", resetListener);
+      source.close();
+    };
+  }, [grantId]);
+}